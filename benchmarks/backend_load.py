@@ -0,0 +1,105 @@
+#!/usr/bin/env python
+"""
+Load test the backend's HTTP serving: the Flask development server (what
+``debug: true`` runs) against the PooledWSGIServer, with `clients` concurrent
+clients each making `requests` requests, either on a new connection per
+request (as the esz_* commands do), or on one keep-alive connection (as
+Zabbix HTTP agent items can).  The app answers a constant, so this measures
+the server, not the stat lookups.
+
+    python benchmarks/backend_load.py [clients] [requests] [threads]
+"""
+import http.client
+import logging
+import multiprocessing
+import statistics
+import sys
+import threading
+import time
+from flask import Flask
+from werkzeug.serving import make_server
+from es_stats_zabbix.backend.server import PooledWSGIServer
+
+def make_app():
+    """A stand-in for the Stat resource"""
+    app = Flask(__name__)
+    @app.route('/api/nodestats/<key>')
+    def stat(key):
+        return '42'
+    return app
+
+def client(port, count, keepalive):
+    """Make count requests.  Return their latencies, and the number of errors."""
+    latencies, errors = [], 0
+    conn = None
+    for _ in range(count):
+        start = time.perf_counter()
+        try:
+            if conn is None:
+                conn = http.client.HTTPConnection('127.0.0.1', port, timeout=10)
+            conn.request('GET', '/api/nodestats/jvm.mem.heap_used_percent')
+            conn.getresponse().read()
+        except (OSError, http.client.HTTPException):
+            errors += 1
+            conn.close()
+            conn = None
+            continue
+        latencies.append(time.perf_counter() - start)
+        if not keepalive:
+            conn.close()
+            conn = None
+    if conn:
+        conn.close()
+    return latencies, errors
+
+def load(server, pool, clients, count, keepalive):
+    """Run the clients against server.  Return requests/s, p50 and p99 ms, errors, peak threads"""
+    baseline = threading.active_count()
+    peak = [baseline]
+    done = threading.Event()
+    def watch():
+        while not done.wait(0.01):
+            peak[0] = max(peak[0], threading.active_count())
+    watcher = threading.Thread(target=watch)
+    watcher.start()
+    start = time.perf_counter()
+    results = pool.starmap(client, [(server.port, count, keepalive)] * clients, chunksize=1)
+    elapsed = time.perf_counter() - start
+    done.set()
+    watcher.join()
+    latencies = sorted(x for result in results for x in result[0])
+    return (
+        len(latencies) / elapsed, statistics.median(latencies) * 1000,
+        latencies[int(len(latencies) * 0.99) - 1] * 1000, sum(x[1] for x in results),
+        # Less the watcher
+        peak[0] - baseline - 1)
+
+def main():
+    clients = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    count = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+    threads = int(sys.argv[3]) if len(sys.argv) > 3 else 32
+    servers = (
+        ('development', lambda: make_server('127.0.0.1', 0, make_app(), threaded=True)),
+        ('pooled', lambda: PooledWSGIServer('127.0.0.1', 0, make_app(), threads=threads)),
+    )
+    print('{0} clients x {1} requests, pool of {2} threads'.format(clients, count, threads))
+    print('{0:<12} {1:<10} {2:>8} {3:>8} {4:>8} {5:>7} {6:>13}'.format(
+        'server', 'conns', 'req/s', 'p50 ms', 'p99 ms', 'errors', 'serve threads'))
+    # The clients run in their own processes, so as not to compete with the server for the GIL
+    with multiprocessing.Pool(clients) as pool:
+        for name, build in servers:
+            for keepalive in (False, True):
+                server = build()
+                listener = threading.Thread(target=server.serve_forever)
+                listener.start()
+                result = load(server, pool, clients, count, keepalive)
+                server.shutdown()
+                server.server_close()
+                listener.join()
+                print('{0:<12} {1:<10} {2:8.0f} {3:8.2f} {4:8.2f} {5:7d} {6:13d}'.format(
+                    name, 'keep-alive' if keepalive else 'new', *result))
+
+if __name__ == '__main__':
+    # Per-request logging would dominate the measurement
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+    main()
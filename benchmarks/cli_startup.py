@@ -0,0 +1,58 @@
+#!/usr/bin/env python
+"""
+Measure the startup cost of each esz_* entry point: the time to import its
+command module, and the wall time to run it (with --version) in a new process,
+less the time to start a bare Python interpreter.  The target applies to the
+polling commands the Zabbix agent runs, not to the long-running esz_backend.
+
+    python benchmarks/cli_startup.py [runs] [target ms]
+"""
+import os
+import statistics
+import subprocess
+import sys
+import time
+from es_stats_zabbix.cli.entrypoint import EXECUTABLE
+
+IMPORT = (
+    'import time; start = time.perf_counter(); '
+    'from es_stats_zabbix.cli.entrypoint import EXECUTABLE; '
+    'from importlib import import_module; import_module(EXECUTABLE["{0}"]); '
+    'print(time.perf_counter() - start)'
+)
+RUN = (
+    'import sys; sys.argv = ["{0}", "--version"]; '
+    'from es_stats_zabbix.cli.entrypoint import run; run()'
+)
+
+def wall(code, env):
+    """Return the seconds it takes to run code in a new interpreter"""
+    start = time.perf_counter()
+    subprocess.run([sys.executable, '-c', code], env=env, check=False,
+                   stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    return time.perf_counter() - start
+
+def main():
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+    target = float(sys.argv[2]) if len(sys.argv) > 2 else 50.0
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join(sys.path)
+    baseline = statistics.median(wall('pass', env) for _ in range(runs))
+    print('bare interpreter: {0:.1f} ms (subtracted from exec)'.format(baseline * 1000))
+    print('{0:<24} {1:>10} {2:>10}'.format('command', 'import ms', 'exec ms'))
+    for name in sorted(x for x in EXECUTABLE if x.startswith('esz_')):
+        imports = []
+        for _ in range(runs):
+            out = subprocess.run(
+                [sys.executable, '-c', IMPORT.format(name)], env=env, check=False,
+                stdout=subprocess.PIPE, stderr=subprocess.DEVNULL).stdout
+            imports.append(float(out))
+        execs = [wall(RUN.format(name), env) - baseline for _ in range(runs)]
+        exec_ms = statistics.median(execs) * 1000
+        print('{0:<24} {1:10.1f} {2:10.1f}{3}'.format(
+            name, statistics.median(imports) * 1000, exec_ms,
+            '' if exec_ms < target or name == 'esz_backend'
+            else '  (over {0:.0f} ms target)'.format(target)))
+
+if __name__ == '__main__':
+    main()
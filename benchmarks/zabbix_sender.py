@@ -0,0 +1,57 @@
+#!/usr/bin/env python
+"""
+Compare the protobix based ZbxSendObject with the native ZabbixSender, pushing
+to a local fake Zabbix server.
+
+    python benchmarks/zabbix_sender.py [pushes] [items per push] [port]
+"""
+import json
+import socketserver
+import struct
+import sys
+import threading
+import time
+from es_stats_zabbix.helpers.zabbix import ZabbixSender, ZbxSendObject
+
+class FakeTrapper(socketserver.BaseRequestHandler):
+    """Answer one Zabbix sender request with a canned success response"""
+    def handle(self):
+        header = self.request.recv(13)
+        length = struct.unpack('<Q', header[5:])[0]
+        body = b''
+        while len(body) < length:
+            body += self.request.recv(length - len(body))
+        total = len(json.loads(body.decode('utf-8'))['data'])
+        answer = json.dumps({
+            'response': 'success',
+            'info': 'processed: {0}; failed: 0; total: {0}; seconds spent: 0.000100'.format(total)
+        }).encode('utf-8')
+        self.request.sendall(b'ZBXD\x01' + struct.pack('<Q', len(answer)) + answer)
+
+def timeit(label, func, pushes):
+    """Run func pushes times and print the mean time per push"""
+    start = time.perf_counter()
+    for _ in range(pushes):
+        func()
+    elapsed = time.perf_counter() - start
+    print('{0:<14} {1:8.3f} ms/push'.format(label, elapsed * 1000 / pushes))
+
+def main():
+    pushes = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    items = int(sys.argv[2]) if len(sys.argv) > 2 else 100
+    port = int(sys.argv[3]) if len(sys.argv) > 3 else 20051
+    # protobix rejects ports above 32767, so no ephemeral port here
+    server = socketserver.ThreadingTCPServer(('127.0.0.1', port), FakeTrapper)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    # protobix only honors a port given in ServerActive
+    zbxconf = {'ServerActive': '127.0.0.1:{0}'.format(server.server_address[1]),
+               'ServerPort': server.server_address[1], 'Timeout': 3, 'DebugLevel': 3}
+    data = dict(('es_stats[nodestats,key{0},]'.format(i), i * 1.5) for i in range(items))
+    print('{0} pushes of {1} items'.format(pushes, items))
+    timeit('protobix', lambda: ZbxSendObject(zbxconf).zbx_sender('node1', data), pushes)
+    sender = ZabbixSender(zbxconf)
+    timeit('ZabbixSender', lambda: sender.send('node1', data), pushes)
+    server.shutdown()
+
+if __name__ == '__main__':
+    main()
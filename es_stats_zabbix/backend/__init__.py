@@ -1,9 +1,16 @@
 """
 Import these here to prevent imports from having too deep dotted notation
 """
+from es_stats_zabbix.backend.agent import AgentListener
+from es_stats_zabbix.backend.batch import Batch
+from es_stats_zabbix.backend.bulk import Bulk
 from es_stats_zabbix.backend.discovery import (
     ClusterDiscovery, Discovery, DisplayEndpoints, NodeDiscovery)
+from es_stats_zabbix.backend.metrics import Metrics, MetricsCache
+from es_stats_zabbix.backend.refresher import Refresher
 from es_stats_zabbix.backend.requestlogger import RequestLogger
+from es_stats_zabbix.backend.scheduler import Scheduler
+from es_stats_zabbix.backend.server import PooledWSGIServer
 from es_stats_zabbix.backend.stat import Stat
-from es_stats_zabbix.backend.trapper import TrapperDiscovery, TrapperStats
+from es_stats_zabbix.backend.trapper import TrapperDiscovery, TrapperStats, TrapperSweep
 from es_stats_zabbix.backend.runner import run_backend
@@ -0,0 +1,187 @@
+"""
+Zabbix agent passive check listener, so the Zabbix server (or proxy) can poll
+the backend directly, as it would a Zabbix agent.
+"""
+
+import json
+import logging
+import socketserver
+import struct
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dotmap import DotMap
+from es_stats_zabbix.backend.bulk import bulk
+from es_stats_zabbix.backend.trapper import get_kv
+from es_stats_zabbix.defaults.settings import APIS
+from es_stats_zabbix.helpers.snapshot import pinned
+
+ZBX_HDR = b'ZBXD\x01'
+ZBX_NOTSUPPORTED = 'ZBX_NOTSUPPORTED'
+# Item keys are limited to 2048 characters by Zabbix.  Allow for parameters.
+MAX_REQUEST = 65536
+
+def parse_key(key):
+    """
+    Split a Zabbix item key, e.g. es_stat[nodestats,"jvm.mem.heap_used_percent",node1],
+    into a tuple of its name and a list of its (unquoted) parameters
+    """
+    key = key.strip()
+    if '[' not in key:
+        return key, []
+    if not key.endswith(']'):
+        raise ValueError('Invalid item key: {0}'.format(key))
+    name, params = key[:-1].split('[', 1)
+    retval = []
+    current = ''
+    quoted = False
+    for char in params:
+        if quoted:
+            if char == '"':
+                quoted = False
+            elif char != '\\':
+                current += char
+        elif char == '"' and not current.strip():
+            quoted = True
+            current = ''
+        elif char == ',':
+            retval.append(current.strip())
+            current = ''
+        else:
+            current += char
+    retval.append(current.strip())
+    return name, retval
+
+def read_request(sock):
+    """Read one passive check request: a Zabbix protocol packet, or a plain line"""
+    data = sock.recv(len(ZBX_HDR))
+    if data == ZBX_HDR:
+        header = b''
+        while len(header) < 8:
+            chunk = sock.recv(8 - len(header))
+            if not chunk:
+                break
+            header += chunk
+        length = min(struct.unpack('<Q', header)[0], MAX_REQUEST)
+        data = b''
+    else:
+        length = MAX_REQUEST
+    while len(data) < length and not data.endswith(b'\n'):
+        chunk = sock.recv(min(4096, length - len(data)))
+        if not chunk:
+            break
+        data += chunk
+    return data.decode('utf-8')
+
+def packet(value):
+    """Return value as a Zabbix protocol packet"""
+    payload = '{0}'.format(value).encode('utf-8')
+    return ZBX_HDR + struct.pack('<Q', len(payload)) + payload
+
+class AgentHandler(socketserver.BaseRequestHandler):
+    """Answer one passive check"""
+    def handle(self):
+        if not self.server.permitted(self.client_address[0]):
+            self.server.logger.warning(
+                'Rejected connection from {0}'.format(self.client_address[0]))
+            return
+        self.request.settimeout(self.server.check_timeout)
+        try:
+            key = read_request(self.request)
+        except (OSError, struct.error) as err:
+            # The connection was dropped, or closed part way through the header
+            self.server.logger.debug('Unable to read request: {0}'.format(err))
+            return
+        except UnicodeDecodeError as err:
+            self.server.logger.debug('Invalid request: {0}'.format(err))
+            self.request.sendall(packet('{0}\0Invalid request.'.format(ZBX_NOTSUPPORTED)))
+            return
+        self.request.sendall(packet(self.server.answer(key)))
+
+class AgentListener(socketserver.TCPServer):
+    """
+    Listen for Zabbix agent passive checks, and answer them from the stat
+    objects.  Supported item keys are:
+
+        es_stat[api,endpoint,node]  (node is optional, as in es_stats_zbx.conf)
+        es_bulk[node,nodetype,interval]  (if plans are provided)
+        agent.ping
+
+    If `allowed` is a list of IP addresses, connections from any other address
+    are closed unanswered, like the Zabbix agent's `Server` setting.
+
+    At most `threads` checks are answered at a time, as with PooledWSGIServer.
+    Further connections wait in the listen backlog until a thread is free.
+    """
+    allow_reuse_address = True
+
+    def __init__(self, address, statobjs, plans=None, allowed=None, check_timeout=3,
+                 threads=8):
+        self.logger = logging.getLogger('esz.AgentListener')
+        self.statobjs = statobjs
+        self.plans = plans
+        self.allowed = set(allowed) if allowed else None
+        self.check_timeout = check_timeout
+        self.thread = None
+        self.slots = threading.BoundedSemaphore(threads)
+        self.pool = ThreadPoolExecutor(max_workers=threads)
+        socketserver.TCPServer.__init__(self, address, AgentHandler)
+
+    def process_request(self, request, client_address):
+        # Stop accepting while every thread is busy
+        self.slots.acquire()
+        self.pool.submit(self.process_request_thread, request, client_address)
+
+    def process_request_thread(self, request, client_address):
+        """Answer one check in a pool thread"""
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+            self.slots.release()
+
+    def permitted(self, address):
+        """Return True if a connection from address may be answered"""
+        return self.allowed is None or address in self.allowed
+
+    def answer(self, key):
+        """Return the answer to the passive check of item key"""
+        self.logger.debug('Passive check: {0}'.format(key))
+        try:
+            name, params = parse_key(key)
+            if name == 'agent.ping':
+                return 1
+            if name == 'es_bulk' and self.plans and params and params[0]:
+                nodetypes = [params[1]] if len(params) > 1 and params[1] else None
+                interval = params[2] if len(params) > 2 and params[2] else '60s'
+                return json.dumps(bulk(
+                    pinned(self.statobjs), self.plans, params[0], interval, nodetypes=nodetypes))
+            if name != 'es_stat' or len(params) < 2:
+                return '{0}\0Unsupported item key.'.format(ZBX_NOTSUPPORTED)
+            api, endpoint = params[0], params[1]
+            node = params[2] if len(params) > 2 and params[2] else None
+            if api not in APIS:
+                return '{0}\0Invalid API: {1}'.format(ZBX_NOTSUPPORTED, api)
+            zbxkey, value = get_kv(self.statobjs, api, endpoint, node)
+        except Exception as err:
+            self.logger.error('Unable to answer {0}: {1}'.format(key, err))
+            return '{0}\0{1}'.format(ZBX_NOTSUPPORTED, err)
+        if zbxkey is None:
+            return '{0}\0Not found: {1}'.format(ZBX_NOTSUPPORTED, endpoint)
+        if isinstance(value, DotMap):
+            return json.dumps(value.toDict())
+        return value
+
+    def start(self):
+        """Serve in a background thread"""
+        self.logger.info('Listening for passive checks on {0}:{1}'.format(*self.server_address))
+        self.thread = threading.Thread(target=self.serve_forever, name='esz-agent')
+        self.thread.daemon = True
+        self.thread.start()
+
+    def stop(self):
+        """Stop serving, close the listening socket, and wait for the checks in progress"""
+        self.shutdown()
+        self.server_close()
+        self.pool.shutdown(wait=True)
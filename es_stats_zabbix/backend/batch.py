@@ -0,0 +1,61 @@
+"""
+Batch module for flask_restful
+"""
+
+import json
+import logging
+from dotmap import DotMap
+from flask import request
+from flask_restful import Resource
+from es_stats_zabbix.backend.stat import get_stat
+from es_stats_zabbix.defaults.settings import APIS
+from es_stats_zabbix.exceptions import NotFound
+from es_stats_zabbix.helpers.snapshot import pinned
+
+def batch(statobjs, stats):
+    """
+    Return a list of the values of stats, a list of [api, key, node] (node is
+    optional), in the same order.  Keys which are not found are 'ZBX_NOTFOUND',
+    and anything else which can't be read, including malformed entries, is
+    'ZBX_NOTSUPPORTED'.
+    """
+    retval = []
+    for stat in stats:
+        if isinstance(stat, dict):
+            stat = [stat.get('api'), stat.get('key'), stat.get('node')]
+        if not isinstance(stat, list) or len(stat) < 2:
+            retval.append('ZBX_NOTSUPPORTED')
+            continue
+        api, key = stat[0], stat[1]
+        node = stat[2] if len(stat) > 2 and stat[2] else None
+        if api not in APIS:
+            retval.append('ZBX_NOTSUPPORTED')
+            continue
+        try:
+            value = get_stat(statobjs[api], key, node=node)
+            # Nested values are returned as JSON objects
+            retval.append(value.toDict() if isinstance(value, DotMap) else value)
+        except NotFound:
+            retval.append('ZBX_NOTFOUND')
+        except Exception:
+            retval.append('ZBX_NOTSUPPORTED')
+    return retval
+
+class Batch(Resource):
+    """Batch Resource class for flask_restful"""
+    def __init__(self, statobjs):
+        self.statobjs = statobjs
+        self.logger = logging.getLogger('esz.Batch')
+
+    def post(self):
+        """
+        POST method.  The body is {"stats": [[api, key, node], ...]}, and the
+        response is the list of their values, all from the same Snapshots.
+        """
+        self.logger.debug('request.data contents = {}'.format(request.data))
+        stats = []
+        if request.data != b'':
+            # Must decode to 'utf-8' for older versions of Python
+            json_data = json.loads(request.data.decode('utf-8'))
+            stats = json_data['stats'] if 'stats' in json_data else []
+        return batch(pinned(self.statobjs), stats), 200
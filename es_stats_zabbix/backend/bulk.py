@@ -0,0 +1,54 @@
+"""
+Bulk module for flask_restful
+"""
+
+import json
+import logging
+from flask import request
+from flask_restful import Resource
+from es_stats_zabbix.backend.trapper import collect, get_node_roles
+from es_stats_zabbix.exceptions import NotFound
+from es_stats_zabbix.helpers.plans import CollectionPlans
+from es_stats_zabbix.helpers.snapshot import pinned
+
+def bulk(statobjs, plans, node, interval, nodetypes=None):
+    """
+    Return every planned stat for interval for node (or for the cluster, if node
+    is the cluster name) as one flat dictionary of "api:endpoint": value,
+    limited to nodetypes if provided.
+    """
+    node, roles = get_node_roles(node, statobjs)
+    retval = {}
+    for api, entry, _, value in collect(statobjs, plans, node, roles, interval, nodetypes):
+        retval['{0}:{1}'.format(api, entry)] = value
+    return retval
+
+class Bulk(Resource):
+    """Bulk Resource class for flask_restful"""
+    def __init__(self, statobjs, endpoints, plans=None):
+        self.statobjs = statobjs
+        self.plans = plans if plans else CollectionPlans(endpoints)
+        self.logger = logging.getLogger('esz.Bulk')
+
+    def get(self, node):
+        """GET method"""
+        return self.post(node)
+
+    def post(self, node):
+        """POST method"""
+        self.logger.debug('request.data contents = {}'.format(request.data))
+        nodetypes = None
+        interval = '60s'
+        if request.data != b'':
+            # Must decode to 'utf-8' for older versions of Python
+            json_data = json.loads(request.data.decode('utf-8'))
+            if json_data.get('nodetype'):
+                nodetypes = [json_data['nodetype']]
+            # Zabbix passes an empty string for an omitted key parameter
+            interval = json_data.get('interval') or '60s'
+        # Every endpoint is read from the same Snapshots
+        try:
+            return bulk(
+                pinned(self.statobjs), self.plans, node, interval, nodetypes=nodetypes), 200
+        except NotFound as err:
+            return {'message': '{0}'.format(err)}, 404
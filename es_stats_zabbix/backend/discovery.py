@@ -8,16 +8,24 @@ from flask import request
 from flask_restful import Resource
 from es_stats_zabbix.exceptions import NotFound
 from es_stats_zabbix.defaults.settings import APIS
-from es_stats_zabbix.helpers.batch import get_endpoints, lldoutput, macrogen
+from es_stats_zabbix.helpers.batch import LLDCache, get_endpoints
 from es_stats_zabbix.helpers.config import extract_endpoints
+from es_stats_zabbix.helpers.snapshot import prefetch
 from es_stats_zabbix.helpers.utils import get_nodeid, get_cluster_macros, get_node_macros
 
 class Discovery(Resource):
     """
     Endpoint Discovery Resource Class for flask_restful
+
+    Discovery with show_all reads from full_statobjs, as statobjs may be pruned
+    to only the configured endpoints.
+
+    Results are memoized in lldcache, which should be shared between requests.
     """
-    def __init__(self, statobjs, do_not_discover, endpoints):
+    def __init__(self, statobjs, do_not_discover, endpoints, full_statobjs=None, lldcache=None):
         self.statobjs = statobjs
+        self.full_statobjs = full_statobjs if full_statobjs else statobjs
+        self.lldcache = lldcache if lldcache else LLDCache()
         self.dnd = do_not_discover
         self.raw_endpoints = endpoints
         self.logger = logging.getLogger('esz.Discovery')
@@ -37,9 +45,10 @@ class Discovery(Resource):
             json_data = json.loads(request.data.decode('utf-8'))
             node = json_data['node'] if 'node' in json_data else None
             show_all = json_data['show_all'] if 'show_all' in json_data else False
-        results = macrogen(self.statobjs, self.dnd, node=node,
-                           included=None if show_all else endpoints)
-        llddata = lldoutput(results)
+        statobjs = self.full_statobjs if show_all else self.statobjs
+        prefetch(statobjs)
+        llddata = self.lldcache.lldoutput(statobjs, self.dnd, node=node,
+                                          included=None if show_all else endpoints)
         return {'data': llddata}
 
 class ClusterDiscovery(Resource):
@@ -50,7 +59,6 @@ class ClusterDiscovery(Resource):
         self.logger = logging.getLogger('esz.ClusterDiscovery')
         self.statobjs = statobjs
         self.statobj = statobjs['nodeinfo']
-        self.nodeinfo = self.statobj.cached_read('nodeinfo')['nodes']
 
     def get(self, value):
         """GET method"""
@@ -68,14 +76,15 @@ class ClusterDiscovery(Resource):
             # Placeholder if needed.
             pass
         macros = []
+        nodeinfo = self.statobj.cached_read('nodeinfo')['nodes']
         if value == 'cluster':
-            nodeid = list(self.nodeinfo.keys())[0]
+            nodeid = list(nodeinfo.keys())[0]
             self.logger.debug('Value is "cluster."  Returning LLD data for the cluster...')
             self.logger.debug('Using nodeid {0} for cluster data'.format(nodeid))
             macros.append(get_cluster_macros(self.statobj, nodeid))
         elif value == 'nodes':
             self.logger.debug('Value is "nodes."  Returning LLD data for all discovered nodes...')
-            for nodeid in self.nodeinfo:
+            for nodeid in nodeinfo:
                 macros.append(get_cluster_macros(self.statobj, nodeid))
         return {'data': macros}
 
@@ -87,7 +96,6 @@ class NodeDiscovery(Resource):
         self.logger = logging.getLogger('esz.NodeDiscovery')
         self.statobjs = statobjs
         self.statobj = statobjs['nodeinfo']
-        self.nodeinfo = self.statobj.cached_read('nodeinfo')['nodes']
 
     def get(self, node):
         """GET method"""
@@ -132,6 +140,7 @@ class DisplayEndpoints(Resource):
             node = json_data['node'] if 'node' in json_data else None
         results = {}
         node = node if node else self.statobjs['health'].local_name
+        prefetch(self.statobjs)
         for api in APIS:
             results[api] = get_endpoints(self.statobjs, api, node=node)[api]
         self.logger.debug('RESULTS = {0}'.format(results))
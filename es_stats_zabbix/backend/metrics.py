@@ -0,0 +1,106 @@
+"""
+Prometheus metrics module for flask_restful
+"""
+
+import logging
+import re
+import threading
+from flask import Response
+from flask_restful import Resource
+from es_stats_zabbix.backend.trapper import get_kv, targets
+from es_stats_zabbix.defaults.settings import APIS
+from es_stats_zabbix.helpers.plans import CollectionPlans
+from es_stats_zabbix.helpers.snapshot import pinned
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+def metric_name(api, endpoint):
+    """Return the Prometheus metric name for endpoint of api"""
+    return re.sub('[^a-zA-Z0-9_]', '_', 'es_stats_{0}_{1}'.format(api, endpoint))
+
+def label_value(value):
+    """Return value escaped for use as a Prometheus label value"""
+    return '{0}'.format(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def sample_value(value):
+    """Return value as a Prometheus sample value, or None if it is not numeric"""
+    if isinstance(value, (int, float)):
+        return '{0}'.format(value)
+    try:
+        return '{0}'.format(float(value))
+    except (TypeError, ValueError):
+        return None
+
+def families(statobjs, plans):
+    """
+    Yield the text of one gauge metric family per configured endpoint, with a
+    sample for the cluster, or for each node whose nodetypes it is configured
+    for.  Endpoints with non-numeric values, e.g. versions, are left out, as are
+    the samples of nodes which are missing from the Snapshot of the api.
+    """
+    hosts = targets(statobjs)
+    cluster = 'cluster="{0}"'.format(label_value(hosts[0][0]))
+    samples = {}
+    for _, node, roles in hosts:
+        labels = cluster
+        if roles != ('cluster',):
+            labels += ',node="{0}"'.format(label_value(node))
+        for api, endpoint, _ in plans.entries(roles):
+            samples.setdefault((api, endpoint), []).append((labels, node))
+    for api, endpoint in sorted(samples, key=lambda x: (APIS.index(x[0]), x[1])):
+        name = metric_name(api, endpoint)
+        lines = ['# TYPE {0} gauge'.format(name)]
+        for labels, node in samples[(api, endpoint)]:
+            value = sample_value(get_kv(statobjs, api, endpoint, node)[1])
+            if value is not None:
+                lines.append('{0}{{{1}}} {2}'.format(name, labels, value))
+        if len(lines) > 1:
+            yield '\n'.join(lines) + '\n'
+
+class MetricsCache(object):
+    """
+    The metrics rendered from the latest Snapshots.  They are only rendered
+    again once any of the Snapshots they were rendered from is refreshed.
+    """
+    def __init__(self):
+        self.key = None
+        self.chunks = None
+        self.lock = threading.Lock()
+
+    def stream(self, statobjs, plans):
+        """
+        Return an iterator of the encoded metrics for statobjs, which should be
+        pinned.  If they are not cached, they are rendered as they are iterated,
+        and cached once complete.
+        """
+        key = tuple(statobjs[api].generation() for api in APIS)
+        with self.lock:
+            if key == self.key:
+                return iter(self.chunks)
+        return self.render(key, statobjs, plans)
+
+    def render(self, key, statobjs, plans):
+        """Yield each encoded metric family, and cache them all under key at the end"""
+        chunks = []
+        for family in families(statobjs, plans):
+            chunk = family.encode('utf-8')
+            chunks.append(chunk)
+            yield chunk
+        # Not reached if rendering failed, or the client went away, so only a
+        # complete rendering is ever cached
+        with self.lock:
+            self.key, self.chunks = key, tuple(chunks)
+
+class Metrics(Resource):
+    """Prometheus metrics Resource class for flask_restful"""
+    def __init__(self, statobjs, endpoints, plans=None, cache=None):
+        self.statobjs = statobjs
+        self.plans = plans if plans else CollectionPlans(endpoints)
+        self.cache = cache if cache else MetricsCache()
+        self.logger = logging.getLogger('esz.Metrics')
+
+    def get(self):
+        """GET method"""
+        # Every endpoint is read from the same Snapshots
+        return Response(
+            self.cache.stream(pinned(self.statobjs), self.plans), content_type=CONTENT_TYPE)
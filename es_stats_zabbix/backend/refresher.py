@@ -0,0 +1,53 @@
+"""
+Background thread which keeps the SnapshotStore fresh, so that no request
+has to wait on Elasticsearch.
+"""
+
+import logging
+import threading
+from es_stats_zabbix.defaults.settings import APIS
+
+class Refresher(threading.Thread):
+    """
+    Refresh each API in the SnapshotStore when its Snapshot expires.
+
+    If a refresh fails, the previous Snapshot stays published and the API is
+    retried after `retry` seconds.
+    """
+    def __init__(self, store, apis=None, retry=5):
+        super(Refresher, self).__init__(name='esz-refresher')
+        self.daemon = True
+        self.store = store
+        self.apis = apis if apis else APIS
+        self.retry = retry
+        self.stopped = threading.Event()
+        self.logger = logging.getLogger('esz.Refresher')
+
+    def refresh_due(self):
+        """Refresh every API which is due.  Return seconds until the next one is due."""
+        due = [api for api in self.apis if self.store.due_in(api) <= 0]
+        # Fetched concurrently, so a slow API does not hold up the others
+        results = self.store.refresh_all(due) if due else {}
+        waits = []
+        for api in self.apis:
+            if api not in results:
+                wait = self.store.due_in(api)
+            elif isinstance(results[api], Exception):
+                self.logger.error(
+                    'Unable to refresh "{0}": {1}. Retry in {2} seconds...'.format(
+                        api, results[api], self.retry))
+                wait = self.retry
+            else:
+                wait = self.store.ttl(api)
+            waits.append(wait)
+        return max(min(waits), 0.1)
+
+    def run(self):
+        self.logger.info('Starting background refresh of APIs: {0}'.format(self.apis))
+        while not self.stopped.is_set():
+            self.stopped.wait(self.refresh_due())
+        self.logger.info('Background refresh stopped.')
+
+    def stop(self):
+        """Signal the thread to stop after the current pass"""
+        self.stopped.set()
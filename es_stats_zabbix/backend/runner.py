@@ -4,16 +4,25 @@ Actually run the flask backend, and spin up all Resource classes and necessary c
 
 import json
 import logging
+import os
+import signal
+import threading
 from time import sleep
 from flask import Flask
 from flask_restful import Api
-from es_stats.classes import ClusterHealth, ClusterState, ClusterStats, NodeInfo, NodeStats
 from es_stats_zabbix.backend import (
-    ClusterDiscovery, Discovery, DisplayEndpoints, NodeDiscovery, RequestLogger, Stat,
-    TrapperDiscovery, TrapperStats
+    AgentListener, Batch, Bulk, ClusterDiscovery, Discovery, DisplayEndpoints, Metrics,
+    MetricsCache, NodeDiscovery, PooledWSGIServer, Refresher, RequestLogger, Scheduler, Stat,
+    TrapperDiscovery, TrapperStats, TrapperSweep
 )
 from es_stats_zabbix.exceptions import ConfigurationError
-from es_stats_zabbix.helpers.config import configure_logging, get_client, get_config
+from es_stats_zabbix.helpers.batch import LLDCache
+from es_stats_zabbix.helpers.config import (
+    api_endpoints, cache_timeouts, configure_logging, get_client, get_config)
+from es_stats_zabbix.helpers.history import History
+from es_stats_zabbix.helpers.plans import CollectionPlans
+from es_stats_zabbix.helpers.snapshot import SnapshotStore, statobjs as get_statobjs
+from es_stats_zabbix.helpers.zabbix import ChangeFilter, LLDFilter, ZabbixSender
 
 def retry_es_connect(config):
     """
@@ -50,7 +59,7 @@ def run_backend(config_dict):
     zabbix = get_config(config_dict, 'zabbix')
     endpoints = get_config(config_dict, 'endpoints')
     backend = get_config(config_dict, 'backend')
-    c_t = backend['cache_timeout']
+    ttls = cache_timeouts(backend['cache_timeout'])
 
     # Now that logging is enabled and we have the rest of the configuration,
     # let's attempt an Elasticsearch Client connection:
@@ -58,28 +67,66 @@ def run_backend(config_dict):
 
     app = Flask(__name__)
     api = Api(app)
-    statobjs = {
-        'health': ClusterHealth(client, cache_timeout=c_t),
-        'clusterstate': ClusterState(client, cache_timeout=c_t),
-        'clusterstats': ClusterStats(client, cache_timeout=c_t),
-        'nodeinfo': NodeInfo(client, cache_timeout=c_t),
-        'nodestats': NodeStats(client, cache_timeout=c_t),
-    }
-    api.add_resource(Stat, '/api/health/<key>', endpoint='/health/',
+    # All stat objects share one SnapshotStore.  The Refresher keeps it current
+    # in the background, so requests only ever read the latest Snapshot.
+    # APIs are fetched pruned to the configured endpoints.  Discovery with
+    # show_all and the endpoint display use the full_statobjs instead.
+    store = SnapshotStore(client, ttls=ttls, endpoints=api_endpoints(endpoints),
+                          history=History(backend['history_samples']))
+    refresher = Refresher(store)
+    refresher.refresh_due()
+    refresher.start()
+    statobjs = get_statobjs(store)
+    full_statobjs = get_statobjs(store, full=True)
+    lldcache = LLDCache()
+    # Trapper collection plans are compiled from the endpoints config once, here.
+    plans = CollectionPlans(endpoints)
+    # One Zabbix sender for all trapper pushes
+    sender = ZabbixSender(zabbix)
+    # Only resend LLD data which is unchanged once lld_refresh seconds have passed
+    lldfilter = LLDFilter(refresh=backend['lld_refresh']) if backend['lld_refresh'] else None
+    # Optionally push only the values which changed since the last push
+    changes = None
+    if backend['changes_only']['enabled']:
+        changes = ChangeFilter(heartbeat=backend['changes_only']['heartbeat'])
+    # Optionally push trapper data on the configured intervals ourselves
+    scheduler = None
+    if backend['scheduler']['enabled']:
+        scheduler = Scheduler(
+            statobjs, plans, sender, jitter=backend['scheduler']['jitter'], changes=changes)
+        scheduler.start()
+    # Optionally answer Zabbix agent passive checks directly
+    agent = None
+    if backend['agent']['enabled']:
+        agent = AgentListener(
+            (backend['agent']['host'], backend['agent']['port']), statobjs, plans=plans,
+            allowed=backend['agent']['allowed'], threads=backend['agent']['threads'])
+        agent.start()
+    # Keys are routed as paths, as derived endpoints like ratio:a/b contain a slash
+    api.add_resource(Stat, '/api/health/<path:key>', endpoint='/health/',
                      resource_class_kwargs={'statobj': statobjs['health']})
-    api.add_resource(Stat, '/api/clusterstate/<key>', endpoint='/clusterstate/',
+    api.add_resource(Stat, '/api/clusterstate/<path:key>', endpoint='/clusterstate/',
                      resource_class_kwargs={'statobj': statobjs['clusterstate']})
-    api.add_resource(Stat, '/api/clusterstats/<key>', endpoint='/clusterstats/',
+    api.add_resource(Stat, '/api/clusterstats/<path:key>', endpoint='/clusterstats/',
                      resource_class_kwargs={'statobj': statobjs['clusterstats']})
-    api.add_resource(Stat, '/api/nodeinfo/<key>', endpoint='/nodeinfo/',
+    api.add_resource(Stat, '/api/nodeinfo/<path:key>', endpoint='/nodeinfo/',
                      resource_class_kwargs={'statobj': statobjs['nodeinfo']})
-    api.add_resource(Stat, '/api/nodestats/<key>', endpoint='/nodestats/',
+    api.add_resource(Stat, '/api/nodestats/<path:key>', endpoint='/nodestats/',
                      resource_class_kwargs={'statobj': statobjs['nodestats']})
-    api.add_resource(DisplayEndpoints, '/api/display/', endpoint='/display/',
+    api.add_resource(Batch, '/api/batch', endpoint='/batch/',
                      resource_class_kwargs={'statobjs': statobjs})
+    api.add_resource(Bulk, '/api/bulk/<node>', endpoint='/bulk/',
+                     resource_class_kwargs={
+                         'statobjs': statobjs,
+                         'plans': plans,
+                         'endpoints': endpoints})
+    api.add_resource(DisplayEndpoints, '/api/display/', endpoint='/display/',
+                     resource_class_kwargs={'statobjs': full_statobjs})
     api.add_resource(Discovery, '/api/discovery/', endpoint='/discovery/',
                      resource_class_kwargs={
                          'statobjs': statobjs,
+                         'full_statobjs': full_statobjs,
+                         'lldcache': lldcache,
                          'endpoints': endpoints,
                          'do_not_discover': dnd})
     api.add_resource(ClusterDiscovery, '/api/clusterdiscovery/<value>',
@@ -92,14 +139,71 @@ def run_backend(config_dict):
                      resource_class_kwargs={
                          'statobjs': statobjs,
                          'zabbix': zabbix,
+                         'lldcache': lldcache,
+                         'plans': plans,
+                         'sender': sender,
+                         'lldfilter': lldfilter,
                          'endpoints': endpoints,
                          'do_not_discover': dnd})
     api.add_resource(TrapperStats, '/api/trapperstats/<zbxhost>', endpoint='/trapperstats/',
                      resource_class_kwargs={
                          'statobjs': statobjs,
                          'zabbix': zabbix,
+                         'plans': plans,
+                         'sender': sender,
+                         'changes': changes,
+                         'endpoints': endpoints})
+    api.add_resource(TrapperSweep, '/api/trappersweep/', endpoint='/trappersweep/',
+                     resource_class_kwargs={
+                         'statobjs': statobjs,
+                         'zabbix': zabbix,
+                         'plans': plans,
+                         'sender': sender,
+                         'changes': changes,
+                         'endpoints': endpoints})
+    api.add_resource(Metrics, '/metrics', endpoint='/metrics/',
+                     resource_class_kwargs={
+                         'statobjs': statobjs,
+                         'plans': plans,
+                         'cache': MetricsCache(),
                          'endpoints': endpoints})
     api.add_resource(RequestLogger, '/api/logger/<loglevel>', endpoint='/logger/')
-    app.run(host=backend['host'], port=backend['port'], debug=backend['debug'], threaded=True)
+    # Optionally serve the same app on a Unix domain socket, for the CLI commands
+    unix = None
+    if backend['socket']:
+        unix = PooledWSGIServer(
+            'unix://{0}'.format(backend['socket']), 0, app, threads=backend['threads'],
+            keepalive=backend['keepalive'])
+        # As open to local users as the TCP listener on localhost is
+        os.chmod(backend['socket'], 0o666)
+        unix.start()
+    if backend['debug']:
+        # The Flask development server, with its debugger
+        app.run(host=backend['host'], port=backend['port'], debug=True, threaded=True)
+    else:
+        server = PooledWSGIServer(
+            backend['host'], backend['port'], app, threads=backend['threads'],
+            keepalive=backend['keepalive'])
+        # serve_forever runs in this thread, so it must be shut down from another
+        signal.signal(
+            signal.SIGTERM, lambda signum, frame: threading.Thread(target=server.shutdown).start())
+        logger.info('Serving on {0}:{1} with {2} threads'.format(
+            backend['host'], server.port, backend['threads']))
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        # Finish the requests in progress before stopping anything they use
+        logger.info('Shutting down...')
+        server.server_close()
+    if unix:
+        unix.shutdown()
+        unix.server_close()
+        os.unlink(backend['socket'])
+    if agent:
+        agent.stop()
+    if scheduler:
+        scheduler.stop()
+    refresher.stop()
 
     logger.info('Job completed.')
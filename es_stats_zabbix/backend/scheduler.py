@@ -0,0 +1,79 @@
+"""
+Background thread which pushes trapper data to Zabbix on the intervals from
+the endpoints configuration, with no Zabbix agent polling involved.
+"""
+
+import heapq
+import logging
+import random
+import threading
+import time
+from es_stats_zabbix.backend.trapper import shipall, sweep
+from es_stats_zabbix.helpers.config import interval_seconds
+from es_stats_zabbix.helpers.snapshot import pinned
+
+class Scheduler(threading.Thread):
+    """
+    Push each (nodetype, interval) group of the collection plans through the
+    trapper sweep on its own timer.
+
+    Each group first runs at a random offset of up to `jitter` seconds, so
+    groups don't all fire at once, and then every interval from there.  A group
+    which falls behind skips the runs it missed rather than bunching them up.
+
+    If `changes`, a ChangeFilter, is provided, only changed values are pushed.
+    """
+    def __init__(self, statobjs, plans, sender, jitter=5, changes=None):
+        super(Scheduler, self).__init__(name='esz-scheduler')
+        self.daemon = True
+        self.statobjs = statobjs
+        self.plans = plans
+        self.sender = sender
+        self.jitter = jitter
+        self.changes = changes
+        self.stopped = threading.Event()
+        self.logger = logging.getLogger('esz.Scheduler')
+        self.groups = []
+        for nodetype in plans.nodetypes:
+            for interval in plans.nodetypes[nodetype]:
+                self.groups.append((nodetype, interval, interval_seconds(interval)))
+
+    def push(self, nodetype, interval):
+        """Collect and send the stats of one group.  Return the number of failed items."""
+        data = sweep(pinned(self.statobjs), self.plans, interval, nodetypes=[nodetype])
+        failed, http_code = shipall(self.sender, data, changes=self.changes)
+        if http_code != 200:
+            self.logger.error('Push of {0}/{1} failed: {2}'.format(nodetype, interval, failed))
+        elif failed:
+            self.logger.warning(
+                '{0} item(s) of {1}/{2} not accepted by Zabbix'.format(failed, nodetype, interval))
+        return failed
+
+    def run(self):
+        self.logger.info('Scheduling trapper pushes for: {0}'.format(
+            ', '.join('{0}/{1}'.format(x[0], x[1]) for x in self.groups)))
+        start = time.time()
+        queue = []
+        for nodetype, interval, seconds in self.groups:
+            offset = random.uniform(0, min(self.jitter, seconds))
+            heapq.heappush(queue, (start + offset, nodetype, interval, seconds))
+        while queue and not self.stopped.is_set():
+            due, nodetype, interval, seconds = queue[0]
+            if self.stopped.wait(max(due - time.time(), 0)):
+                break
+            heapq.heappop(queue)
+            try:
+                self.push(nodetype, interval)
+            except Exception as err:
+                self.logger.error('Push of {0}/{1} failed: {2}'.format(nodetype, interval, err))
+            due += seconds
+            now = time.time()
+            if due <= now:
+                # Skip the runs we missed
+                due += seconds * ((now - due) // seconds + 1)
+            heapq.heappush(queue, (due, nodetype, interval, seconds))
+        self.logger.info('Scheduled trapper pushes stopped.')
+
+    def stop(self):
+        """Signal the thread to stop"""
+        self.stopped.set()
@@ -0,0 +1,78 @@
+"""
+WSGI server for the backend: a fixed pool of threads, with HTTP/1.1 keep-alive.
+
+The backend is deliberately one process.  Every request is answered from the
+SnapshotStore in memory, and each extra process would need its own store,
+Refresher and Scheduler, multiplying the load on Elasticsearch and the pushes
+to Zabbix.  Requests only read published Snapshots, so threads scale well.
+"""
+
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from werkzeug.serving import BaseWSGIServer, WSGIRequestHandler
+
+class KeepAliveHandler(WSGIRequestHandler):
+    """
+    Serve requests on a connection until the client closes it, or it has been
+    idle for the server's `keepalive` seconds.  With a `keepalive` of 0, every
+    connection is closed after one request.
+
+    Responses are buffered until werkzeug flushes them, so the headers and body
+    go out together.  Written separately, the body of each response after the
+    first on a connection waits out Nagle's algorithm and a delayed ACK.
+    """
+    wbufsize = -1
+
+    def setup(self):
+        if self.server.keepalive:
+            self.protocol_version = 'HTTP/1.1'
+            self.timeout = self.server.keepalive
+        super(KeepAliveHandler, self).setup()
+
+class PooledWSGIServer(BaseWSGIServer):
+    """
+    Serve app with at most `threads` connections at a time.  Further
+    connections wait in the listen backlog until a thread is free, instead of
+    each getting a new thread, as with the Flask development server.
+
+    `server_close` waits for the requests in progress to complete.
+    """
+    multithread = True
+
+    def __init__(self, host, port, app, threads=32, keepalive=5, backlog=128):
+        self.logger = logging.getLogger('esz.PooledWSGIServer')
+        self.threads = threads
+        self.keepalive = keepalive
+        self.request_queue_size = backlog
+        self.slots = threading.BoundedSemaphore(threads)
+        self.pool = ThreadPoolExecutor(max_workers=threads)
+        super(PooledWSGIServer, self).__init__(host, port, app, handler=KeepAliveHandler)
+
+    def process_request(self, request, client_address):
+        # Stop accepting while every thread is busy
+        self.slots.acquire()
+        self.pool.submit(self.process_request_thread, request, client_address)
+
+    def process_request_thread(self, request, client_address):
+        """Handle one connection in a pool thread, as socketserver.ThreadingMixIn would"""
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+            self.slots.release()
+
+    def start(self):
+        """Serve in a background thread"""
+        self.logger.info('Serving on {0} with {1} threads'.format(
+            self.host if self.host.startswith('unix://') else '{0}:{1}'.format(
+                self.host, self.port), self.threads))
+        thread = threading.Thread(target=self.serve_forever, name='esz-http-listener')
+        thread.daemon = True
+        thread.start()
+
+    def server_close(self):
+        super(PooledWSGIServer, self).server_close()
+        self.pool.shutdown(wait=True)
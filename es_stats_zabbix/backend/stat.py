@@ -7,9 +7,28 @@ import logging
 from dotmap import DotMap
 from flask import request
 from flask_restful import Resource
-from es_stats_zabbix.exceptions import EmptyResult
+from es_stats_zabbix.exceptions import EmptyResult, NotFound
 from es_stats_zabbix.helpers.utils import status_map
 
+def get_stat(statobj, key, node=None):
+    """
+    Return the value of key from statobj for node, as Zabbix expects it.  Raise
+    NotFound if there is no such key, and EmptyResult if its value is empty.
+    """
+    result = statobj.get(key, name=node)
+    # Remap for `status`
+    if key == 'status':
+        result = status_map(result)
+    if result == DotMap():
+        raise NotFound('ZBX_NOTFOUND')
+    if str(result).strip().lower() == 'false':
+        return 0
+    if str(result).strip().lower() == 'true':
+        return 1
+    if result == '':
+        raise EmptyResult('No result received.')
+    return result
+
 class Stat(Resource):
     """Stat Resource class for flask_restful"""
     def __init__(self, statobj):
@@ -31,17 +50,10 @@ class Stat(Resource):
             json_data = json.loads(request.data.decode('utf-8'))
             node = json_data['node'] if 'node' in json_data else None
         self.logger.debug('Node = {0} -- key = {1}'.format(node, key))
-        result = self.statobj.get(key, name=node)
-        # Remap for `status`
-        if key == 'status':
-            result = status_map(result)
-        if result == DotMap():
+        try:
+            return get_stat(self.statobj, key, node=node), 200
+        except NotFound:
             return {'message':'ZBX_NOTFOUND'}, 404
-        if str(result).strip().lower() == 'false':
-            return 0, 200
-        if str(result).strip().lower() == 'true':
-            return 1, 200
-        if result == '':
+        except EmptyResult:
             self.logger.error('Empty value')
-            raise EmptyResult('No result received.')
-        return result, 200
+            raise
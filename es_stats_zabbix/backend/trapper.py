@@ -4,61 +4,155 @@ Trapper module for flask_restful
 
 import json
 import logging
-from copy import deepcopy
 from dotmap import DotMap
 from flask import request
 from flask_restful import Resource
-from es_stats_zabbix.defaults.settings import APIS
-from es_stats_zabbix.helpers.batch import lldoutput, macrogen
-from es_stats_zabbix.helpers.config import extract_endpoints
+from es_stats_zabbix.helpers.batch import LLDCache
+from es_stats_zabbix.helpers.plans import CollectionPlans, zbxkey
 from es_stats_zabbix.helpers.utils import get_nodeid, status_map, true_nodetypes
-from es_stats_zabbix.helpers.zabbix import ZbxSendObject
+from es_stats_zabbix.helpers.snapshot import pinned
+from es_stats_zabbix.helpers.zabbix import ZabbixSender
 
+LOGGER = logging.getLogger(__name__)
 
-def shipit(zbxconf, zbxhost, data, data_type='items'):
+def shipit(sender, zbxhost, data, data_type='items', changes=None):
     """
-    Do the zabbix_trapper shipping via ZbxSendObject, which uses protobix
+    Do the zabbix_trapper shipping via sender, a ZabbixSender
     """
+    return shipall(sender, {zbxhost: data}, data_type=data_type, changes=changes)
+
+def shipall(sender, data, data_type='items', changes=None):
+    """
+    Ship data, a dictionary of Zabbix hosts and their items, via sender, in as
+    few batches as possible.  If changes, a ChangeFilter, is provided, only the
+    values it passes are shipped.
+    """
+    if changes is not None:
+        data = changes.changes(data)
+        if not data:
+            return 0, 200
     try:
-        zso = ZbxSendObject(zbxconf)
-        _, server_failure, _, failed, _, _ = zso.zbx_sender(
-            zbxhost, data, data_type=data_type)
-    except ConnectionRefusedError:
-        return (
-            'Unable to connect to Zabbix server at '
-            '{0}'.format(zbxconf['ServerActive'])), 500
+        _, server_failure, _, failed, _, _ = sender.send_hosts(data, data_type=data_type)
+    except Exception as err:
+        # Nothing was sent, so send these values again next time
+        if changes is not None:
+            changes.forget(data)
+        if isinstance(err, ConnectionRefusedError):
+            return (
+                'Unable to connect to Zabbix server at '
+                '{0}:{1}'.format(sender.server, sender.port)), 500
+        raise
 
     # If server_failure is 1, we were unable to communicate with the Zabbix server
     if server_failure > 0:
+        if changes is not None:
+            changes.forget(data)
         return 1, 500
     # Return the number of items that failed to be picked up by Zabbix (hopefully zero!)
     return failed, 200
 
-def get_node_endpoints(zbxhost, raw_endpoints, statobjs):
-    """Return a tuple of a node name and the endpoints to extract"""
-    node = zbxhost
+def get_node_roles(zbxhost, statobjs):
+    """
+    Return a tuple of a node name and its roles: the nodetypes whose
+    collection plans apply to it
+    """
+    # The node id and its nodetypes are read from the same nodeinfo Snapshot
+    statobjs = pinned(statobjs)
     if zbxhost == statobjs['health'].get('cluster_name'):
-        node = statobjs['health'].local_name
-        endpoints = {'cluster': raw_endpoints['cluster']}
-    else:
-        node_endpoints = deepcopy(raw_endpoints)
-        del node_endpoints['cluster']
-        # Determine which nodetypes are "True" for the given node
-        valid_nodetypes = true_nodetypes(statobjs['nodeinfo'], get_nodeid(statobjs, node))
-        for nodetype in list(node_endpoints.keys()):
-            if nodetype not in valid_nodetypes:
-                del node_endpoints[nodetype]
-        endpoints = node_endpoints
-    return node, endpoints
+        return statobjs['health'].local_name, ('cluster',)
+    # Determine which nodetypes are "True" for the given node
+    nodeid = get_nodeid(statobjs, zbxhost)
+    return zbxhost, tuple(true_nodetypes(statobjs['nodeinfo'], nodeid))
+
+def get_kv(statobjs, api, entry, node, key=None):
+    """
+    Return a tuple of the Zabbix key and value of entry from api for node, with
+    the value normalized for Zabbix, or (None, None) if there is nothing to send
+    """
+    value = statobjs[api].get(entry, name=node)
+    LOGGER.debug('Value: {0}'.format(value))
+    # Map cluster health status to Zabbix expected values
+    if entry == 'status':
+        value = status_map(value)
+    # Do nothing for nested or DotMap values
+    if value == DotMap():
+        LOGGER.debug('Nested or value for {0}:{1}'.format(api, entry))
+        return None, None
+    # Set boolean and bool-ish values to firm 0/1
+    if str(value).strip().lower() == 'false':
+        value = 0
+    if str(value).strip().lower() == 'true':
+        value = 1
+    # Do nothing for empty values
+    if value == '':
+        LOGGER.debug('Empty value for {0}:{1}'.format(api, entry))
+        return None, None
+    # Truncate floating point values at 3 places
+    if isinstance(value, float):
+        value = float("{0:.3f}".format(value))
+    return key if key else zbxkey(api, entry), value
+
+def collect(statobjs, plans, node, roles, interval, nodetypes=None):
+    """
+    Collect the planned stats for interval for node, which has roles, limited to
+    nodetypes if provided.  Yield a tuple of (api, entry, Zabbix key, value) for
+    each stat with a value.
+    """
+    for nodetype in roles:
+        if nodetypes and nodetype not in nodetypes:
+            continue
+        for api, entry, zbxitem in plans.plan(roles, nodetype, interval):
+            key, value = get_kv(statobjs, api, entry, node, key=zbxitem)
+            if key:
+                yield api, entry, key, value
+
+def targets(statobjs):
+    """
+    Return a list of a (Zabbix host, node, roles) tuple for the cluster host and
+    for every node, in that order.  The cluster host is named for the cluster,
+    and collected through the local node.  Node hosts are named for their nodes.
+    """
+    health = statobjs['health']
+    retval = [(health.get('cluster_name'), health.local_name, ('cluster',))]
+    index = statobjs['nodeinfo'].nodes()
+    for nodeid in sorted(index.names, key=index.names.get):
+        name = index.names[nodeid]
+        retval.append((name, name, tuple(index.nodetypes[nodeid])))
+    return retval
+
+def sweep(statobjs, plans, interval, nodetypes=None):
+    """
+    Collect the planned stats for interval for the cluster host and for every
+    node, limited to nodetypes if provided.  Return a dictionary of Zabbix host:
+    {key: value}.
+    """
+    data = {}
+    for zbxhost, node, roles in targets(statobjs):
+        stats = {}
+        for _, _, key, value in collect(statobjs, plans, node, roles, interval, nodetypes):
+            stats[key] = value
+        if stats:
+            data[zbxhost] = stats
+    return data
 
 class TrapperDiscovery(Resource):
-    """TrapperDiscovery Resource class for flask_restful"""
-    def __init__(self, statobjs, zabbix, endpoints, do_not_discover):
+    """
+    TrapperDiscovery Resource class for flask_restful
+
+    If `lldfilter`, an LLDFilter, is provided, LLD data which is unchanged since
+    it was last sent is not sent again, until its refresh is due.  The number
+    of times LLD data was sent and skipped for the host are returned in the
+    X-LLD-Sent and X-LLD-Skipped response headers.
+    """
+    def __init__(self, statobjs, zabbix, endpoints, do_not_discover, lldcache=None, plans=None,
+                 sender=None, lldfilter=None):
         self.logger = logging.getLogger('esz.TrapperDiscovery')
         self.statobjs = statobjs
-        self.zabbix = zabbix
-        self.raw_endpoints = endpoints
+        self.sender = sender if sender else ZabbixSender(zabbix)
+        self.plans = plans if plans else CollectionPlans(endpoints)
         self.dnd = do_not_discover
+        self.lldcache = lldcache if lldcache else LLDCache()
+        self.lldfilter = lldfilter
 
     def get(self, zbxhost):
         """GET method"""
@@ -66,53 +160,33 @@ class TrapperDiscovery(Resource):
 
     def post(self, zbxhost):
         """POST method"""
-        node, endpoints = get_node_endpoints(zbxhost, self.raw_endpoints, self.statobjs)
-        endpoints = extract_endpoints(endpoints)
-        results = macrogen(
-            self.statobjs, self.dnd, node=node, included=endpoints)
-        llddata = lldoutput(results)
-        exit_code, http_code = shipit(
-            self.zabbix, zbxhost, llddata, data_type='lld')
-        return exit_code, http_code
+        node, roles = get_node_roles(zbxhost, self.statobjs)
+        endpoints = self.plans.endpoints(roles)
+        llddata = self.lldcache.lldoutput(self.statobjs, self.dnd, node=node, included=endpoints)
+        if self.lldfilter is None:
+            return shipit(self.sender, zbxhost, llddata, data_type='lld')
+        fingerprint = self.lldfilter.fingerprint(llddata)
+        exit_code, http_code = 0, 200
+        if self.lldfilter.due(zbxhost, fingerprint):
+            exit_code, http_code = shipit(self.sender, zbxhost, llddata, data_type='lld')
+            # Unless Zabbix accepted it, send it again next time
+            if exit_code == 0 and http_code == 200:
+                self.lldfilter.sent(zbxhost, fingerprint)
+        sent, skipped = self.lldfilter.count(zbxhost)
+        return exit_code, http_code, {'X-LLD-Sent': sent, 'X-LLD-Skipped': skipped}
 
 class TrapperStats(Resource):
     """TrapperStats Resource class for flask_restful"""
-    def __init__(self, statobjs, zabbix, endpoints):
+    def __init__(self, statobjs, zabbix, endpoints, plans=None, sender=None, changes=None):
         self.statobjs = statobjs
-        self.raw_endpoints = endpoints
-        self.zabbix = zabbix
-        self.client = statobjs['health'].client
+        self.plans = plans if plans else CollectionPlans(endpoints)
+        self.sender = sender if sender else ZabbixSender(zabbix)
+        self.changes = changes
         self.logger = logging.getLogger('esz.TrapperStats')
-        self.nodeinfo = self.client.nodes.info()['nodes']
         self.debug = False
         if logging.getLogger().getEffectiveLevel() == 10:
             self.debug = True
 
-    def _get_kv(self, api, entry, node):
-        value = self.statobjs[api].get(entry, name=node)
-        self.logger.debug('Value: {0}'.format(value))
-        # Map cluster health status to Zabbix expected values
-        if entry == 'status':
-            value = status_map(value)
-        # Do nothing for nested or DotMap values
-        if value == DotMap():
-            self.logger.debug('Nested or value for {0}:{1}'.format(api, entry))
-            return None, None
-        # Set boolean and bool-ish values to firm 0/1
-        if str(value).strip().lower() == 'false':
-            value = 0
-        if str(value).strip().lower() == 'true':
-            value = 1
-        # Do nothing for empty values
-        if value == '':
-            self.logger.debug('Empty value for {0}:{1}'.format(api, entry))
-            return None, None
-        # Truncate floating point values at 3 places
-        if isinstance(value, float):
-            value = float("{0:.3f}".format(value))
-        key = 'es_stats[{0},{1},]'.format(api, entry)
-        return key, value
-
     def get(self, zbxhost):
         """GET method"""
         self.logger.debug('We are doing a GET, but shouldn\'t be')
@@ -121,27 +195,51 @@ class TrapperStats(Resource):
     def post(self, zbxhost):
         """POST method"""
         self.logger.debug('request.data contents = {}'.format(request.data))
-        node, endpoints = get_node_endpoints(zbxhost, self.raw_endpoints, self.statobjs)
+        # Every endpoint is read from the same Snapshots
+        statobjs = pinned(self.statobjs)
+        node, roles = get_node_roles(zbxhost, statobjs)
+        nodetype = None
+        interval = '60s'
         if request.data != b'':
             # Must decode to 'utf-8' for older versions of Python
             json_data = json.loads(request.data.decode('utf-8'))
             nodetype = json_data['nodetype'] if 'nodetype' in json_data else None
-            interval = json_data['interval'] if 'interval' in json_data else '60s'
-        # Get the result here.
-        # We need all the results specified in the YAML file.
-        # endpoints:
-        #   nodetype:
-        #     interval:
-        #       api:
-        #         - array of keys
+            # Zabbix passes an empty string for an omitted key parameter
+            interval = json_data.get('interval') or '60s'
+        # The plans hold every (api, entry, key) specified in the YAML file for
+        # each nodetype and interval, compiled once at startup.
         stats = {}
-        if nodetype in endpoints:
-            if interval in endpoints[nodetype]:
-                for api in APIS:
-                    if api in endpoints[nodetype][interval]:
-                        for entry in endpoints[nodetype][interval][api]:
-                            key, value = self._get_kv(api, entry, node)
-                            if key:
-                                stats[key] = value
-        exit_code, http_code = shipit(self.zabbix, zbxhost, stats)
+        for _, _, key, value in collect(statobjs, self.plans, node, roles, interval,
+                                        nodetypes=[nodetype]):
+            stats[key] = value
+        exit_code, http_code = shipit(self.sender, zbxhost, stats, changes=self.changes)
+        return exit_code, http_code
+
+class TrapperSweep(Resource):
+    """TrapperSweep Resource class for flask_restful"""
+    def __init__(self, statobjs, zabbix, endpoints, plans=None, sender=None, changes=None):
+        self.statobjs = statobjs
+        self.plans = plans if plans else CollectionPlans(endpoints)
+        self.sender = sender if sender else ZabbixSender(zabbix)
+        self.changes = changes
+        self.logger = logging.getLogger('esz.TrapperSweep')
+
+    def get(self):
+        """GET method"""
+        return self.post()
+
+    def post(self):
+        """POST method"""
+        self.logger.debug('request.data contents = {}'.format(request.data))
+        nodetypes = None
+        interval = '60s'
+        if request.data != b'':
+            json_data = json.loads(request.data.decode('utf-8'))
+            nodetypes = json_data['nodetypes'] if 'nodetypes' in json_data else None
+            # Zabbix passes an empty string for an omitted key parameter
+            interval = json_data.get('interval') or '60s'
+        # Every host is collected from the same Snapshots
+        data = sweep(pinned(self.statobjs), self.plans, interval, nodetypes=nodetypes)
+        self.logger.debug('Sweep of {0} host(s) for interval {1}'.format(len(data), interval))
+        exit_code, http_code = shipall(self.sender, data, changes=self.changes)
         return exit_code, http_code
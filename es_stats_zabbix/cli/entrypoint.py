@@ -1,35 +1,46 @@
 """
 Universal entrypoint for any scripts/modules that need to be called.
 """
+from importlib import import_module
 from sys import argv as cli_args
 from sys import exit
 from os import path as os_path
-from es_stats_zabbix.cli.backend import cli as backend
-from es_stats_zabbix.cli.display_endpoints import cli as display_endpoints
-from es_stats_zabbix.cli.get_discovery import cli as get_discovery
-from es_stats_zabbix.cli.get_es_stat import cli as get_es_stat
-from es_stats_zabbix.cli.get_cluster import cli as get_cluster
-from es_stats_zabbix.cli.get_nodes import cli as get_nodes
-from es_stats_zabbix.cli.trapper_discovery import cli as trapper_discovery
-from es_stats_zabbix.cli.trapper_stats import cli as trapper_stats
+from es_stats_zabbix.exceptions import BackendUnavailable
+
+# Commands are only imported when run.  The Zabbix agent runs the polling
+# commands constantly, and they must not pay for importing the backend.
+BACKEND = 'es_stats_zabbix.cli.backend'
+DISPLAY_ENDPOINTS = 'es_stats_zabbix.cli.display_endpoints'
+GET_BULK = 'es_stats_zabbix.cli.get_bulk'
+GET_DISCOVERY = 'es_stats_zabbix.cli.get_discovery'
+GET_ES_STAT = 'es_stats_zabbix.cli.get_es_stat'
+GET_CLUSTER = 'es_stats_zabbix.cli.get_cluster'
+GET_NODES = 'es_stats_zabbix.cli.get_nodes'
+TRAPPER_DISCOVERY = 'es_stats_zabbix.cli.trapper_discovery'
+TRAPPER_STATS = 'es_stats_zabbix.cli.trapper_stats'
+TRAPPER_SWEEP = 'es_stats_zabbix.cli.trapper_sweep'
 
 EXECUTABLE = {
-    'run_backend.py': backend,
-    'esz_backend': backend,
-    'run_display_endpoints.py': display_endpoints,
-    'esz_display_endpoints': display_endpoints,
-    'run_discovery.py': get_discovery,
-    'esz_discovery': get_discovery,
-    'run_cluster_discovery.py': get_cluster,
-    'esz_cluster_discovery': get_cluster,
-    'run_node_discovery.py': get_nodes,
-    'esz_node_discovery': get_nodes,
-    'run_get_es_stat.py': get_es_stat,
-    'esz_get_stat': get_es_stat,
-    'run_trapper_discovery.py': trapper_discovery,
-    'esz_trapper_discovery': trapper_discovery,
-    'run_trapper_stats.py': trapper_stats,
-    'esz_trapper_stats': trapper_stats,
+    'run_backend.py': BACKEND,
+    'esz_backend': BACKEND,
+    'run_display_endpoints.py': DISPLAY_ENDPOINTS,
+    'esz_display_endpoints': DISPLAY_ENDPOINTS,
+    'run_discovery.py': GET_DISCOVERY,
+    'esz_discovery': GET_DISCOVERY,
+    'run_cluster_discovery.py': GET_CLUSTER,
+    'esz_cluster_discovery': GET_CLUSTER,
+    'run_node_discovery.py': GET_NODES,
+    'esz_node_discovery': GET_NODES,
+    'run_get_es_stat.py': GET_ES_STAT,
+    'esz_get_stat': GET_ES_STAT,
+    'run_get_bulk.py': GET_BULK,
+    'esz_get_bulk': GET_BULK,
+    'run_trapper_discovery.py': TRAPPER_DISCOVERY,
+    'esz_trapper_discovery': TRAPPER_DISCOVERY,
+    'run_trapper_stats.py': TRAPPER_STATS,
+    'esz_trapper_stats': TRAPPER_STATS,
+    'run_trapper_sweep.py': TRAPPER_SWEEP,
+    'esz_trapper_sweep': TRAPPER_SWEEP,
 }
 
 def command_liner(name, cli):
@@ -60,13 +71,15 @@ Be sure to substitute your unicode variant for en_US.utf8
     try:
         # pylint: disable=no-value-for-parameter
         cli()
+    except BackendUnavailable:
+        # The backend is not running (or not reachable).  Fail quietly, as ever.
+        exit(1)
     except Exception as err:
         if isinstance(err, RuntimeError):
             if 'ASCII' in str(err):
                 print('{0}'.format(err))
                 print(msg)
         else:
-            from sys import exit
             print('{0}'.format(err))
             exit(1)
 
@@ -76,7 +89,7 @@ def run():
     if program_name not in list(EXECUTABLE.keys()):
         print('{0} is not an recognized command'.format(program_name))
         exit(1)
-    command_liner(program_name, EXECUTABLE[program_name])
+    command_liner(program_name, import_module(EXECUTABLE[program_name]).cli)
 
 if __name__ == '__main__':
     run()
@@ -0,0 +1,57 @@
+"""
+Click module to get every configured stat for a node as one JSON object
+"""
+
+import click
+from es_stats_zabbix import __version__
+from es_stats_zabbix.exceptions import FailedExecution
+from es_stats_zabbix.helpers.utils import do_request, log_to_listener
+
+CONTEXT_SETTINGS = dict(help_option_names=['-h', '--help'])
+
+@click.command(context_settings=CONTEXT_SETTINGS)
+@click.option('--host', help='es_stats_zabbix backend listener IP',
+              default='127.0.0.1', show_default=True)
+@click.option('--port', help='es_stats_zabbix backend listener Port',
+              default=7600, show_default=True)
+@click.option('--socket', help='es_stats_zabbix backend Unix domain socket, used instead of '
+              '--host and --port', default=None)
+@click.option('--debug', is_flag=True, help='Log all transactions in listener')
+@click.option('--interval', show_default=True, default='60s',
+              help='An interval defined in the YAML configuration file.')
+@click.option('--nodetype', default=None,
+              help='Only this nodetype.  Default is every nodetype of the node.')
+@click.argument('node', nargs=1)
+@click.version_option(version=__version__)
+@click.pass_context
+def cli(ctx, host, port, socket, debug, interval, nodetype, node):
+    """
+    Connect to the backend at --host and --port and return every stat
+    configured for --interval for "node" as one flat JSON object, with keys of
+    "api:endpoint".
+
+    "node" is a node name, or the cluster name for the "cluster" nodetype stats.
+
+    This is meant for a Zabbix master item, with dependent items extracting
+    values with JSONPath preprocessing, e.g. $['nodestats:jvm.mem.heap_used_percent']
+
+    Perform --debug logging upstream to the backend if specified
+    """
+    if socket:
+        host = 'unix://{0}'.format(socket)
+
+    uri = '/api/bulk/{0}'.format(node)
+    body = {'interval': interval}
+    if nodetype:
+        body['nodetype'] = nodetype
+    if debug:
+        log_to_listener(host, port, 'debug', {'host':host, 'port':port, 'uri':uri, 'body':body})
+    fail = 'ZBX_NOTSUPPORTED'
+    method = 'post'
+
+    try:
+        print(do_request(host, port, uri, method, body=body).strip())
+    except FailedExecution:
+        mdict = {'error':'The request was unable to successfully complete.'}
+        log_to_listener(host, port, 'error', mdict)
+        print(fail)
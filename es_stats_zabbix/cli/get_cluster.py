@@ -6,7 +6,7 @@ from sys import exit
 import click
 from es_stats_zabbix import __version__
 from es_stats_zabbix.exceptions import FailedExecution, NotFound
-from es_stats_zabbix.helpers.utils import do_request, log_to_listener, open_port
+from es_stats_zabbix.helpers.utils import do_request, log_to_listener
 
 CONTEXT_SETTINGS = dict(help_option_names=['-h', '--help'])
 
@@ -15,13 +15,15 @@ CONTEXT_SETTINGS = dict(help_option_names=['-h', '--help'])
               default='127.0.0.1', show_default=True)
 @click.option('--port', help='es_stats_zabbix backend listener Port',
               default=7600, show_default=True)
+@click.option('--socket', help='es_stats_zabbix backend Unix domain socket, used instead of '
+              '--host and --port', default=None)
 @click.option('--debug', is_flag=True, help='Log all transactions in listener')
 @click.option('--value', type=click.Choice(['cluster', 'nodes']),
               default='nodes', show_default=True)
 @click.option('--flag', help='Pass arbitrary value to differentiate calls')
 @click.version_option(version=__version__)
 @click.pass_context
-def cli(ctx, host, port, debug, value, flag):
+def cli(ctx, host, port, socket, debug, value, flag):
     """
     Connect to the backend at --host and --port.
 
@@ -32,6 +34,8 @@ def cli(ctx, host, port, debug, value, flag):
 
     Perform --debug logging upstream to the backend if specified
     """
+    if socket:
+        host = 'unix://{0}'.format(socket)
 
     uri = '/api/clusterdiscovery/{0}'.format(value)
     fail = 'ZBX_NOTSUPPORTED'
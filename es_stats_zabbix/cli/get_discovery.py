@@ -2,12 +2,11 @@
 Click module to call the discovery functions
 """
 
-from sys import exit
 import click
 from es_stats_zabbix import __version__
 from es_stats_zabbix.defaults.settings import apis
 from es_stats_zabbix.exceptions import FailedExecution, NotFound
-from es_stats_zabbix.helpers.utils import do_request, log_to_listener, open_port
+from es_stats_zabbix.helpers.utils import do_request, log_to_listener
 
 CONTEXT_SETTINGS = dict(help_option_names=['-h', '--help'])
 
@@ -16,13 +15,15 @@ CONTEXT_SETTINGS = dict(help_option_names=['-h', '--help'])
               default='127.0.0.1', show_default=True)
 @click.option('--port', help='es_stats_zabbix backend listener Port',
               default=7600, show_default=True)
+@click.option('--socket', help='es_stats_zabbix backend Unix domain socket, used instead of '
+              '--host and --port', default=None)
 @click.option('--debug', is_flag=True, help='Log all transactions in listener')
 @click.option('--node', help='Optional node name', default=None, show_default=True)
 @click.option('--show_all', default='false', show_default=True,
               help='Show all macros, not just those in config file (yes, y, true, show_all)')
 @click.version_option(version=__version__)
 @click.pass_context
-def cli(ctx, host, port, debug, node, show_all):
+def cli(ctx, host, port, socket, debug, node, show_all):
     """
     Connect to the backend at --host and --port and return the Zabbix Low-Level Discovery
     json object.
@@ -33,9 +34,8 @@ def cli(ctx, host, port, debug, node, show_all):
 
     Perform --debug logging upstream to the backend if specified
     """
-    # Do a simple socket check first
-    if not open_port(host, port):
-        exit(1)
+    if socket:
+        host = 'unix://{0}'.format(socket)
 
     # Now try to get the value
     if debug:
@@ -2,12 +2,13 @@
 Click module to launch es_stat gathering
 """
 
+import json
 from sys import exit
 import click
 from es_stats_zabbix import __version__
 from es_stats_zabbix.defaults.settings import apis
 from es_stats_zabbix.exceptions import EmptyResult, FailedExecution, NotFound
-from es_stats_zabbix.helpers.utils import do_request, log_to_listener, open_port
+from es_stats_zabbix.helpers.utils import do_request, log_to_listener
 
 CONTEXT_SETTINGS = dict(help_option_names=['-h', '--help'])
 
@@ -16,26 +17,42 @@ CONTEXT_SETTINGS = dict(help_option_names=['-h', '--help'])
               default='127.0.0.1', show_default=True)
 @click.option('--port', help='es_stats_zabbix backend listener Port',
               default=7600, show_default=True)
+@click.option('--socket', help='es_stats_zabbix backend Unix domain socket, used instead of '
+              '--host and --port', default=None)
 @click.option('--debug', is_flag=True, help='Log all transactions in listener')
 @click.option('--node', help='Optional node name', default=None, show_default=True)
+@click.option('--batch', is_flag=True,
+              help='Get many values, each given as "api,endpoint[,node]", in one request')
 @click.argument('api', nargs=1)
-@click.argument('endpoint', nargs=1)
+@click.argument('endpoint', nargs=1, required=False)
+@click.argument('more', nargs=-1)
 @click.version_option(version=__version__)
 @click.pass_context
-def cli(ctx, host, port, debug, node, api, endpoint):
+def cli(ctx, host, port, socket, debug, node, batch, api, endpoint, more):
     """
     Connect to the backend at --host and --port and return the value
     associated with the provided API and ENDPOINT.
 
     Specify a particular node name with --node
     Perform --debug logging upstream to the backend if specified
+
+    With --batch, every argument is a stat given as "api,endpoint[,node]", and
+    a single argument of "-" reads them from stdin, one per line.  The values
+    are printed one per line, in the same order, all read in one request.
+    --node is the node for stats which do not name one.
     """
-    # Do a simple socket check first
-    if not open_port(host, port):
+    if socket:
+        host = 'unix://{0}'.format(socket)
+
+    node = None if node == '' else node
+    if batch:
+        get_batch(host, port, debug, node, [api, endpoint] + list(more))
+        return
+    if endpoint is None or more:
+        click.echo(ctx.get_usage())
         exit(1)
 
     # Now try to get the value
-    node = None if node == '' else node
     if debug:
         mdict = {'user_parms': 'api: {0}, endpoint: {1}, node: {2}'.format(api, endpoint, node)}
         log_to_listener(host, port, 'debug', mdict)
@@ -62,3 +79,25 @@ def cli(ctx, host, port, debug, node, api, endpoint):
         mdict = {'error':'The request was unable to successfully complete.'}
         log_to_listener(host, port, 'error', mdict)
         print(fail)
+
+def get_batch(host, port, debug, node, args):
+    """Get and print the value of every stat in args in a single request"""
+    lines = click.get_text_stream('stdin') if args[:2] == ['-', None] else args
+    stats = []
+    for line in lines:
+        if line is None or not line.strip():
+            continue
+        stat = [x.strip() for x in line.strip().split(',')]
+        stats.append([stat[0], stat[1] if len(stat) > 1 else '',
+                      stat[2] if len(stat) > 2 and stat[2] else node])
+    uri = '/api/batch'
+    if debug:
+        log_to_listener(host, port, 'debug', {'host':host, 'port':port, 'uri':uri, 'stats':stats})
+    try:
+        values = json.loads(do_request(host, port, uri, 'post', body={'stats': stats}))
+    except FailedExecution:
+        mdict = {'error':'The request was unable to successfully complete.'}
+        log_to_listener(host, port, 'error', mdict)
+        values = ['ZBX_NOTSUPPORTED'] * len(stats)
+    for value in values:
+        print(value if isinstance(value, str) else json.dumps(value))
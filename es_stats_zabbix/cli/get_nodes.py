@@ -6,7 +6,7 @@ from sys import exit
 import click
 from es_stats_zabbix import __version__
 from es_stats_zabbix.exceptions import FailedExecution, NotFound
-from es_stats_zabbix.helpers.utils import do_request, log_to_listener, open_port
+from es_stats_zabbix.helpers.utils import do_request, log_to_listener
 
 CONTEXT_SETTINGS = dict(help_option_names=['-h', '--help'])
 
@@ -15,12 +15,14 @@ CONTEXT_SETTINGS = dict(help_option_names=['-h', '--help'])
               default='127.0.0.1', show_default=True)
 @click.option('--port', help='es_stats_zabbix backend listener Port',
               default=7600, show_default=True)
+@click.option('--socket', help='es_stats_zabbix backend Unix domain socket, used instead of '
+              '--host and --port', default=None)
 @click.option('--debug', is_flag=True, help='Log all transactions in listener')
 @click.argument('node')
 @click.option('--flag', help='Pass arbitrary value to differentiate calls')
 @click.version_option(version=__version__)
 @click.pass_context
-def cli(ctx, host, port, debug, node, flag):
+def cli(ctx, host, port, socket, debug, node, flag):
     """
     Connect to the backend at --host and --port.
 
@@ -31,6 +33,8 @@ def cli(ctx, host, port, debug, node, flag):
 
     Perform --debug logging upstream to the backend if specified
     """
+    if socket:
+        host = 'unix://{0}'.format(socket)
 
     uri = '/api/nodediscovery/{0}'.format(node)
     fail = 'ZBX_NOTSUPPORTED'
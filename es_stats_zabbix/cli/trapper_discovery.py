@@ -2,12 +2,11 @@
 Trapper Discovery CLI
 """
 
-from sys import exit
 import click
 from es_stats_zabbix import __version__
 from es_stats_zabbix.defaults.settings import apis
 from es_stats_zabbix.exceptions import FailedExecution, NotFound
-from es_stats_zabbix.helpers.utils import do_request, log_to_listener, open_port
+from es_stats_zabbix.helpers.utils import do_request, log_to_listener
 
 
 CONTEXT_SETTINGS = dict(help_option_names=['-h', '--help'])
@@ -17,12 +16,14 @@ CONTEXT_SETTINGS = dict(help_option_names=['-h', '--help'])
               default='127.0.0.1', show_default=True)
 @click.option('--port', help='es_stats_zabbix backend listener Port',
               default=7600, show_default=True)
+@click.option('--socket', help='es_stats_zabbix backend Unix domain socket, used instead of '
+              '--host and --port', default=None)
 @click.option('--debug', is_flag=True, help='Log all transactions in listener')
 @click.option('--flag', help='Pass arbitrary value to differentiate calls')
 @click.option('--node', help='Optional node name', default=None, show_default=True)
 @click.version_option(version=__version__)
 @click.pass_context
-def cli(ctx, host, port, debug, flag, node):
+def cli(ctx, host, port, socket, debug, flag, node):
     """
     Connect to the backend at --host and --port and return the discovery json
     object for all APIs as Zabbix trapper data from "node".
@@ -32,9 +33,8 @@ def cli(ctx, host, port, debug, flag, node):
 
     Perform --debug logging upstream to the backend if specified
     """
-    # Do a simple socket check first
-    if not open_port(host, port):
-        exit(1)
+    if socket:
+        host = 'unix://{0}'.format(socket)
 
     # Now try to get the value
     if debug:
@@ -2,12 +2,11 @@
 Click module to launch gathering of stats and sending via the Zabbix trapper protocol
 """
 
-from sys import exit
 import click
 from es_stats_zabbix import __version__
 from es_stats_zabbix.defaults.settings import apis
 from es_stats_zabbix.exceptions import EmptyResult, FailedExecution, NotFound
-from es_stats_zabbix.helpers.utils import do_request, log_to_listener, open_port
+from es_stats_zabbix.helpers.utils import do_request, log_to_listener
 
 CONTEXT_SETTINGS = dict(help_option_names=['-h', '--help'])
 
@@ -16,6 +15,8 @@ CONTEXT_SETTINGS = dict(help_option_names=['-h', '--help'])
               default='127.0.0.1', show_default=True)
 @click.option('--port', help='es_stats_zabbix backend listener Port',
               default=7600, show_default=True)
+@click.option('--socket', help='es_stats_zabbix backend Unix domain socket, used instead of '
+              '--host and --port', default=None)
 @click.option('--debug', is_flag=True, help='Log all transactions in listener')
 @click.option('--interval', show_default=True, default='60s',
               help='An interval defined in the YAML configuration file.')
@@ -23,7 +24,7 @@ CONTEXT_SETTINGS = dict(help_option_names=['-h', '--help'])
 @click.argument('nodetype', nargs=1)
 @click.version_option(version=__version__)
 @click.pass_context
-def cli(ctx, host, port, debug, interval, node, nodetype):
+def cli(ctx, host, port, socket, debug, interval, node, nodetype):
     """
     Connect to the backend at --host and --port using "node" as the target Zabbix host name.
     Collect stats, and ship them to Zabbix via the trapper protocol.
@@ -42,9 +43,8 @@ def cli(ctx, host, port, debug, interval, node, nodetype):
 
     Perform --debug logging upstream to the backend if specified
     """
-    # Do a simple socket check first
-    if not open_port(host, port):
-        exit(1)
+    if socket:
+        host = 'unix://{0}'.format(socket)
 
     # Now try to get the value
     if debug:
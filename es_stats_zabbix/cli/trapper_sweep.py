@@ -0,0 +1,57 @@
+"""
+Click module to launch a cluster-wide gathering of stats, sent via the Zabbix trapper protocol
+"""
+
+import click
+from es_stats_zabbix import __version__
+from es_stats_zabbix.exceptions import FailedExecution
+from es_stats_zabbix.helpers.utils import do_request, log_to_listener
+
+CONTEXT_SETTINGS = dict(help_option_names=['-h', '--help'])
+
+@click.command(context_settings=CONTEXT_SETTINGS)
+@click.option('--host', help='es_stats_zabbix backend listener IP',
+              default='127.0.0.1', show_default=True)
+@click.option('--port', help='es_stats_zabbix backend listener Port',
+              default=7600, show_default=True)
+@click.option('--socket', help='es_stats_zabbix backend Unix domain socket, used instead of '
+              '--host and --port', default=None)
+@click.option('--debug', is_flag=True, help='Log all transactions in listener')
+@click.option('--interval', show_default=True, default='60s',
+              help='An interval defined in the YAML configuration file.')
+@click.option('--nodetype', multiple=True,
+              help='Only collect this nodetype.  May be repeated.  Default is all nodetypes.')
+@click.version_option(version=__version__)
+@click.pass_context
+def cli(ctx, host, port, socket, debug, interval, nodetype):
+    """
+    Connect to the backend at --host and --port.  Collect the stats for
+    --interval for the cluster and for every node in it, and ship them all to
+    Zabbix via the trapper protocol, in as few batches as possible.
+
+    The cluster stats go to the Zabbix host named for the cluster, and each
+    node's stats go to the Zabbix host named for the node.  Each node gets the
+    stats of every nodetype it has, as defined in the YAML config file.
+
+    Return the number of stats which failed to be read by Zabbix. A zero indicates all succeeded.
+
+    Perform --debug logging upstream to the backend if specified
+    """
+    if socket:
+        host = 'unix://{0}'.format(socket)
+
+    uri = '/api/trappersweep/'
+    body = {'interval': interval}
+    if nodetype:
+        body['nodetypes'] = list(nodetype)
+    if debug:
+        log_to_listener(host, port, 'debug', {'host':host, 'port':port, 'uri':uri, 'body':body})
+    fail = 'ZBX_NOTSUPPORTED'
+    method = 'post'
+
+    try:
+        print(do_request(host, port, uri, method, body=body).strip())
+    except FailedExecution:
+        mdict = {'error':'The request was unable to successfully complete.'}
+        log_to_listener(host, port, 'error', mdict)
+        print(fail)
@@ -23,7 +23,37 @@ DEFAULTS = {
         Optional('host', default='127.0.0.1'): Any(None, *string_types),
         Optional('port', default=7600): All(Coerce(int), Range(min=1025, max=65534)),
         Optional('debug', default=False): Boolean(),
-        Optional('cache_timeout', default=60): All(Coerce(int), Range(min=1, max=600))
+        Optional('socket', default=None): Any(None, *string_types),
+        Optional('threads', default=32): All(Coerce(int), Range(min=1, max=512)),
+        Optional('keepalive', default=5): All(Coerce(int), Range(min=0, max=300)),
+        Optional('history_samples', default=1048576): All(Coerce(int), Range(min=0)),
+        Optional('cache_timeout', default=60): Any(
+            All(Coerce(int), Range(min=1, max=600)),
+            {
+                Optional('default'): All(Coerce(int), Range(min=1, max=600)),
+                Optional('health'): All(Coerce(int), Range(min=1, max=3600)),
+                Optional('clusterstate'): All(Coerce(int), Range(min=1, max=3600)),
+                Optional('clusterstats'): All(Coerce(int), Range(min=1, max=3600)),
+                Optional('nodeinfo'): All(Coerce(int), Range(min=1, max=3600)),
+                Optional('nodestats'): All(Coerce(int), Range(min=1, max=3600)),
+            }
+        ),
+        Optional('scheduler', default={}): {
+            Optional('enabled', default=False): Boolean(),
+            Optional('jitter', default=5): All(Coerce(int), Range(min=0, max=300)),
+        },
+        Optional('lld_refresh', default=3600): All(Coerce(int), Range(min=0)),
+        Optional('changes_only', default={}): {
+            Optional('enabled', default=False): Boolean(),
+            Optional('heartbeat', default=10): All(Coerce(int), Range(min=1, max=1000)),
+        },
+        Optional('agent', default={}): {
+            Optional('enabled', default=False): Boolean(),
+            Optional('host', default='127.0.0.1'): Any(*string_types),
+            Optional('port', default=10070): All(Coerce(int), Range(min=1025, max=65534)),
+            Optional('allowed', default=None): Any(None, list),
+            Optional('threads', default=8): All(Coerce(int), Range(min=1, max=256)),
+        },
     },
     # Configuration file: zabbix
     'zabbix': {
@@ -8,6 +8,36 @@ APIS = ['health', 'clusterstate', 'clusterstats', 'nodeinfo', 'nodestats']
 
 NODETYPES = ['cluster', 'coordinating', 'master', 'data', 'ml', 'ingest']
 
+# APIs with cluster-wide values, only discovered for the cluster's Zabbix host
+CLUSTER_APIS = ['health', 'clusterstate', 'clusterstats']
+
+# APIs whose responses are keyed by node id under 'nodes'
+NODE_APIS = ['nodeinfo', 'nodestats']
+
+# Keys the backend itself reads, which must never be pruned from an API response
+REQUIRED_KEYS = {
+    'clusterstate': ['cluster_name', 'master_node'],
+    'clusterstats': ['cluster_name'],
+    'nodeinfo': ['name', 'host', 'ip', 'settings.node'],
+    'nodestats': ['name'],
+}
+
+# Derived endpoints, and the number of source endpoints each is computed from:
+#   rate:<endpoint>                      per second change of a counter
+#   ratio:<numerator>/<denominator>      change of one counter per change of another
+DERIVED = {'rate': 1, 'ratio': 2}
+
+# Aggregates of windowed endpoints, e.g. avg5m:<endpoint>, over the last 5 minutes
+WINDOWED = ['avg', 'min', 'max']
+
+# Valid values for the `metric` parameter of the nodes stats API
+NODESTATS_METRICS = [
+    'adaptive_selection', 'breaker', 'discovery', 'fs', 'http', 'indices', 'ingest', 'jvm',
+    'os', 'process', 'script', 'thread_pool', 'transport',
+]
+# The nodestats response keys which are not named for their metric
+NODESTATS_METRIC_KEYS = {'breakers': 'breaker'}
+
 FILEPATHS = [
     path.join(path.expanduser('~'), '.es_stats_zabbix', 'config.yml'),
     path.join('/', 'etc', 'es_stats_zabbix', 'config.yml'),
@@ -32,3 +32,8 @@ class EmptyResult(ESZException):
     """
     Exception raised when there is no result at all.
     """
+
+class BackendUnavailable(ESZException):
+    """
+    Exception raised when the backend cannot be reached.
+    """
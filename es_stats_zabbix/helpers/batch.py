@@ -2,13 +2,13 @@
 Batch processing functions
 """
 
+import hashlib
 import json
 import logging
+import threading
+from collections import OrderedDict
 from re import sub
-from dotmap import DotMap
-from es_stats.utils import fix_key
-from es_stats_zabbix.defaults.settings import (
-    APIS, valuetype_map, skip_these_endpoints)
+from es_stats_zabbix.defaults.settings import APIS, CLUSTER_APIS, valuetype_map
 from es_stats_zabbix.exceptions import NotFound
 from es_stats_zabbix.helpers.utils import get_nodeid, status_map
 
@@ -16,31 +16,7 @@ LOGGER = logging.getLogger(__name__)
 
 BASETYPES = ['bool', 'bytes', 'millis', 'percent', 'unsigned', 'character', 'float']
 
-def dotty(dotmapobj, notation='', retval=[]):
-    """Extract a DotMap of endpoints into dotted notation strings"""
-    for i in list(dotmapobj.keys()):
-        if i in skip_these_endpoints():
-            continue
-        if isinstance(dotmapobj[i], DotMap):
-            nestlevel = notation[:]
-            if notation == '':
-                notation += i
-            else:
-                notation += '.' + i
-            try:
-                val = eval('dotmapobj' + '.' + i)
-            except (NameError, SyntaxError):
-                val = dotmapobj[i]
-            dotty(val, notation, retval=retval)
-            notation = nestlevel
-        elif isinstance(dotmapobj[i], list):
-            pass
-        else:
-            if notation == '':
-                retval.append('{0}'.format(i))
-            else:
-                retval.append('{0}.{1}'.format(notation, i))
-    return retval
+SUFFIXED = ['bytes', 'millis', 'percent']
 
 def typecaster(value):
     """
@@ -66,6 +42,27 @@ def typecaster(value):
     return str
 
 
+def valuetypes(line, value, vtype):
+    """
+    Return the BASETYPES which the endpoint line belongs to, given its value and
+    the typecaster type vtype of that value.
+
+    Empty values match every type.  The bytes, millis, and percent types must
+    also match the endpoint name's suffix, and unsigned must match none of them.
+    """
+    retval = []
+    for zbxtype in BASETYPES:
+        if value != '' and vtype is not valuetype_map(zbxtype):
+            continue
+        if zbxtype in SUFFIXED:
+            if not line.endswith(zbxtype):
+                continue
+        elif zbxtype == 'unsigned':
+            if line.endswith(tuple(SUFFIXED)):
+                continue
+        retval.append(zbxtype)
+    return retval
+
 def get_endpoints(statobjs, api, node=None, valuetype=None):
     """
     Get the endpoints matching only the provided valuetype
@@ -76,94 +73,53 @@ def get_endpoints(statobjs, api, node=None, valuetype=None):
     except NotFound:
         nodeid = statobjs['health'].local_id
         LOGGER.debug('No specific node name provided. Using "{0}"'.format(nodeid))
-    if api in ['health', 'clusterstate', 'clusterstats']:
-        full = statobjs[api].stats()
-    else:
-        full = statobjs[api].stats(nodeid=nodeid)
-
-    # Must set dotty's retval to an empty list on initialization
-    # Neglecting this leads to data duplication on subsequent runs
-    # since there's recursion in dotty.
-    dotted = dotty(full, retval=[])
+    # The FlatIndex of the current snapshot already has every discoverable
+    # endpoint in dotted notation, and the type of its value.
+    index = statobjs[api].index(nodeid)
 
     all_lines = []
 
-    for line in dotted:
-        value = eval('full' + fix_key(line))
+    for line in index.endpoints:
         # Only add lines which have the same valuetype as what we received.
-        if valuetype is not None and value != '':
-            if typecaster(value) is not valuetype_map(valuetype):
-                continue
-        if value == DotMap():
-            # This is essential to not returning invalid endpoints
-            continue
         if valuetype is not None:
-            vtl = len(valuetype)
-            if valuetype in ['bytes', 'millis', 'percent']:
-                if line[-vtl:] == valuetype:
-                    all_lines.append(line)
-            elif valuetype == 'unsigned':
-                # Only append these if they're not those valuetype endings
-                if line[-5:] != 'bytes' and \
-                line[-6:] != 'millis' and \
-                line[-7:] != 'percent':
-                    all_lines.append(line)
-            else:
-                all_lines.append(line)
-        else:
-            all_lines.append(line)
+            if valuetype not in valuetypes(line, index.values[line], index.types[line]):
+                continue
+        all_lines.append(line)
     if all_lines:
         retval = {api: all_lines}
     else:
         retval = {}
     return retval
 
-def get_macros(statobjs, api, dnd, node=None, valuetype=None, included=None):
-    """
-    Get the appropriate LLD macros for the provided valuetype.
-    If a list of approved endpoints is "included", only return
-    endpoints from that list.
-    """
-    endpoints = get_endpoints(statobjs, api, node=node, valuetype=valuetype)
-    macros = []
-    if api in endpoints:
-        for e_p in endpoints[api]:
-            # Don't send health or cluster info to any zabbix host but the cluster_name one
-            if node != statobjs['health'].get('cluster_name'):
-                if api in ['health', 'clusterstate', 'clusterstats']:
-                    continue
-            if api in dnd and e_p in dnd[api]:
-                continue
-            else:
-                def macgen(e_p, api):
-                    """Add the uppercase value of valuetype to the LLD Macros"""
-                    return {
-                        '{#TYPE' + valuetype.upper() + '}':e_p,
-                        '{#API}':api
-                    }
-                if isinstance(included, list):
-                    if e_p in included:
-                        macros.append(macgen(e_p, api))
-                else:
-                    macros.append(macgen(e_p, api))
-    return macros
-
 def macrogen(statobjs, dnd, node=None, included=None):
     """
-    Get the macros via get_macros for each BASETYPE and api.
+    Get the LLD macros of every BASETYPE for every api in a single pass over the
+    index of each API's snapshot.  If a list of approved endpoints is
+    "included", only return endpoints from that list.
     Prepare them for lldoutput
     """
-    results = {}
-    for zbxtype in BASETYPES:
-        if not zbxtype in results:
-            results[zbxtype] = {}
-        for api in APIS:
-            if not api in results[zbxtype]:
-                results[zbxtype][api] = []
-            macros = get_macros(statobjs, api, dnd, node=node, valuetype=zbxtype,
-                                included=included)
-            for macro in macros:
-                results[zbxtype][api].append(macro)
+    results = dict((zbxtype, dict((api, []) for api in APIS)) for zbxtype in BASETYPES)
+    try:
+        nodeid = get_nodeid(statobjs, node)
+    except NotFound:
+        nodeid = statobjs['health'].local_id
+        LOGGER.debug('No specific node name provided. Using "{0}"'.format(nodeid))
+    # Don't send health or cluster info to any zabbix host but the cluster_name one
+    cluster_host = node == statobjs['health'].get('cluster_name')
+    included = set(included) if isinstance(included, list) else None
+    for api in APIS:
+        if api in CLUSTER_APIS and not cluster_host:
+            continue
+        skip = set(dnd[api]) if api in dnd else set()
+        index = statobjs[api].index(nodeid)
+        for e_p in index.endpoints:
+            if e_p in skip or (included is not None and e_p not in included):
+                continue
+            for zbxtype in valuetypes(e_p, index.values[e_p], index.types[e_p]):
+                results[zbxtype][api].append({
+                    '{#TYPE' + zbxtype.upper() + '}':e_p,
+                    '{#API}':api
+                })
     return results
 
 def lldoutput(results):
@@ -184,3 +140,40 @@ def lldoutput(results):
         if llddata[k] == []:
             del llddata[k]
     return llddata
+
+class LLDCache(object):
+    """
+    Bounded LRU cache of lldoutput results.
+
+    LLD data only changes when the snapshots or the configuration change, so
+    results are keyed by the node, the do_not_discover and included endpoints,
+    and the generation of every API snapshot read to compute them.
+    """
+    def __init__(self, maxsize=1024):
+        self.maxsize = maxsize
+        self.results = OrderedDict()
+        self.lock = threading.Lock()
+
+    def key(self, statobjs, dnd, node, included):
+        """Return the cache key for these arguments to macrogen"""
+        config = json.dumps(
+            [dnd, sorted(included) if isinstance(included, list) else None], sort_keys=True)
+        return (
+            node,
+            hashlib.sha1(config.encode('utf-8')).hexdigest(),
+            tuple(statobjs[api].generation() for api in APIS),
+        )
+
+    def lldoutput(self, statobjs, dnd, node=None, included=None):
+        """Return lldoutput(macrogen(...)) for these arguments, computing it only if needed"""
+        key = self.key(statobjs, dnd, node, included)
+        with self.lock:
+            if key in self.results:
+                self.results.move_to_end(key)
+                return self.results[key]
+        llddata = lldoutput(macrogen(statobjs, dnd, node=node, included=included))
+        with self.lock:
+            self.results[key] = llddata
+            while len(self.results) > self.maxsize:
+                self.results.popitem(last=False)
+        return llddata
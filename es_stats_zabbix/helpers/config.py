@@ -131,10 +131,58 @@ def config_override(ctx):
                     if k[:3] == 'api':
                         renamed = k[3:] # Remove 'api' from 'apihost', 'apiport', and 'apidebug'
                         config_dict[toplevel][renamed] = params[k]
+                    elif isinstance(config_dict[toplevel].get(k), dict):
+                        # Per-API cache timeouts: the command-line value is the default
+                        config_dict[toplevel][k]['default'] = params[k]
                     else: # Cover cache_timeout this way
                         config_dict[toplevel][k] = params[k]
     return config_dict
 
+def cache_timeouts(setting, default=60):
+    """
+    Turn the ``backend.cache_timeout`` setting into a dictionary of cache timeouts
+    per API.  The setting is either a single value for all APIs, or a dictionary
+    of per-API values, where the ``default`` key covers any API not listed.
+    """
+    if not isinstance(setting, dict):
+        setting = {'default': setting}
+    default = int(setting.get('default', default))
+    return dict((api, int(setting.get(api, default))) for api in apis())
+
+def api_endpoints(data):
+    """
+    Turn the dictionary of endpoints from the config file into a dictionary of
+    the endpoints wanted from each API.
+    """
+    endpoints = {}
+    for nodetype in data:
+        for interval in data[nodetype]:
+            for api in data[nodetype][interval]:
+                endpoints.setdefault(api, [])
+                for endpoint in data[nodetype][interval][api]:
+                    if endpoint not in endpoints[api]:
+                        endpoints[api].append(endpoint)
+    return endpoints
+
+def interval_seconds(interval):
+    """
+    Return the number of seconds in an interval from the endpoints config, e.g.
+    ``30``, ``60s``, ``5m``, ``1h``
+    """
+    units = {'s': 1, 'm': 60, 'h': 3600}
+    value = str(interval).strip().lower()
+    multiplier = 1
+    if value and value[-1] in units:
+        multiplier = units[value[-1]]
+        value = value[:-1]
+    try:
+        seconds = int(value) * multiplier
+    except ValueError:
+        seconds = 0
+    if seconds < 1:
+        raise ConfigurationError('Invalid interval: "{0}"'.format(interval))
+    return seconds
+
 def extract_endpoints(data):
     """
     Turn the dictionary of endpoints from the config file into a list of all endpoints.
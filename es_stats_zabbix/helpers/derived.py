@@ -0,0 +1,77 @@
+"""
+Derived endpoints: rates and ratios of counters, computed from the FlatIndex of
+the previous and the current Snapshot of an API when the current one is published
+"""
+
+from es_stats_zabbix.defaults.settings import DERIVED, NODE_APIS
+
+def parse(endpoint):
+    """
+    Return a tuple of the kind and the source endpoints of a derived endpoint,
+    e.g. ('ratio', ('indices.search.query_time_in_millis', 'indices.search.query_total')),
+    or None if endpoint is not a derived endpoint
+    """
+    kind, _, rest = endpoint.partition(':')
+    if kind not in DERIVED or not rest:
+        return None
+    sources = tuple(rest.split('/')) if DERIVED[kind] > 1 else (rest,)
+    if len(sources) != DERIVED[kind] or not all(sources):
+        return None
+    return kind, sources
+
+def sources(endpoints):
+    """Return a list of endpoints, with each derived endpoint replaced by its sources"""
+    retval = []
+    for endpoint in endpoints:
+        parsed = parse(endpoint)
+        for source in parsed[1] if parsed else (endpoint,):
+            if source not in retval:
+                retval.append(source)
+    return retval
+
+def elapsed(previous, current, default):
+    """
+    Return the seconds between the FlatIndexes previous and current, from their
+    Elasticsearch `timestamp` if they have one, or else default
+    """
+    try:
+        seconds = (current.values['timestamp'] - previous.values['timestamp']) / 1000.0
+    except (KeyError, TypeError):
+        return default
+    return seconds if seconds > 0 else default
+
+def derive(endpoints, previous, current, seconds):
+    """
+    Add the derived endpoints to the FlatIndex current, computed from the change
+    since previous, seconds earlier.  Endpoints whose sources are missing or not
+    numeric, or which went backwards (e.g. a node restarted), are left out.
+    """
+    for endpoint in endpoints:
+        kind, keys = parse(endpoint)
+        try:
+            deltas = [current.values[key] - previous.values[key] for key in keys]
+        except (KeyError, TypeError):
+            continue
+        if min(deltas) < 0:
+            continue
+        if kind == 'rate':
+            value = deltas[0] / float(seconds)
+        else:
+            value = deltas[0] / float(deltas[1]) if deltas[1] else 0.0
+        current.values[endpoint] = value
+        current.endpoints.append(endpoint)
+        current.types[endpoint] = float
+
+def derive_all(api, endpoints, previous, current, seconds):
+    """
+    Add the derived endpoints to current, the flattened Snapshot of api, in one
+    pass over all of its nodes.  seconds is the time between the Snapshots, used
+    for any node which has no `timestamp`.
+    """
+    if api not in NODE_APIS:
+        derive(endpoints, previous, current, elapsed(previous, current, seconds))
+        return
+    for nodeid in current:
+        if nodeid in previous:
+            derive(endpoints, previous[nodeid], current[nodeid],
+                   elapsed(previous[nodeid], current[nodeid], seconds))
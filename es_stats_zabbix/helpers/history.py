@@ -0,0 +1,153 @@
+"""
+Windowed aggregates, e.g. avg5m:jvm.mem.heap_used_percent, computed from a
+short history of each endpoint, kept in preallocated ring buffers
+"""
+
+import logging
+import math
+import re
+import threading
+from array import array
+from es_stats_zabbix.defaults.settings import NODE_APIS, WINDOWED
+
+LOGGER = logging.getLogger(__name__)
+
+WINDOW = re.compile(r'^({0})(\d+)([smh]):(.+)$'.format('|'.join(WINDOWED)))
+UNITS = {'s': 1, 'm': 60, 'h': 3600}
+
+def parse(endpoint):
+    """
+    Return a tuple of the aggregate, the window in seconds, and the source
+    endpoint of a windowed endpoint, e.g. ('avg', 300, 'jvm.mem.heap_used_percent'),
+    or None if endpoint is not a windowed endpoint
+    """
+    match = WINDOW.match(endpoint)
+    if match is None or int(match.group(2)) == 0:
+        return None
+    return match.group(1), int(match.group(2)) * UNITS[match.group(3)], match.group(4)
+
+def sources(endpoints):
+    """Return a list of endpoints, with each windowed endpoint replaced by its source"""
+    retval = []
+    for endpoint in endpoints:
+        parsed = parse(endpoint)
+        source = parsed[2] if parsed else endpoint
+        if source not in retval:
+            retval.append(source)
+    return retval
+
+class Ring(object):
+    """The last `capacity` samples of one endpoint, and when they were taken"""
+    __slots__ = ('times', 'values', 'position', 'count')
+
+    def __init__(self, capacity):
+        self.times = array('d', bytes(8 * capacity))
+        self.values = array('d', bytes(8 * capacity))
+        self.position = 0
+        self.count = 0
+
+    def __len__(self):
+        return len(self.values)
+
+    def append(self, when, value):
+        """Add a sample, replacing the oldest if full"""
+        self.times[self.position] = when
+        self.values[self.position] = value
+        self.position = (self.position + 1) % len(self.values)
+        self.count = min(self.count + 1, len(self.values))
+
+    def since(self, when):
+        """Return a list of the values of the samples taken at or after when"""
+        retval = []
+        for i in range(1, self.count + 1):
+            j = self.position - i
+            if self.times[j] < when:
+                break
+            retval.append(self.values[j])
+        return retval
+
+    def resized(self, capacity):
+        """Return a copy of this Ring with room for capacity samples"""
+        ring = Ring(capacity)
+        for i in range(min(self.count, capacity), 0, -1):
+            j = self.position - i
+            ring.append(self.times[j], self.values[j])
+        return ring
+
+AGGREGATES = {
+    'avg': lambda values: sum(values) / float(len(values)),
+    'min': min,
+    'max': max,
+}
+
+class History(object):
+    """
+    Ring buffers of the samples of the sources of windowed endpoints, one per
+    API, node and source endpoint.  Each holds enough samples for the longest
+    window of its source at the API's TTL.
+
+    At most `budget` samples are held in all, 16 bytes each.  A new Ring
+    which would exceed the budget is not created, and its windowed endpoints
+    get no value.  Rings of nodes which have left the cluster are dropped.
+    """
+    def __init__(self, budget=1048576):
+        self.budget = budget
+        self.used = 0
+        self.rings = {}
+        self.lock = threading.Lock()
+
+    def ring(self, key, capacity):
+        """Return the Ring for key, with room for at least capacity samples, or None"""
+        ring = self.rings.get(key)
+        if ring is not None and len(ring) >= capacity:
+            return ring
+        grow = capacity - (len(ring) if ring is not None else 0)
+        if self.used + grow > self.budget:
+            if ring is None:
+                LOGGER.warning(
+                    'No room for the history of {0}: {1} of {2} samples used'.format(
+                        key, self.used, self.budget))
+            return ring
+        self.used += grow
+        ring = ring.resized(capacity) if ring is not None else Ring(capacity)
+        self.rings[key] = ring
+        return ring
+
+    def forget(self, api, nodeids):
+        """Drop the Rings of the nodes of api which are not in nodeids"""
+        for key in [key for key in self.rings if key[0] == api and key[1] not in nodeids]:
+            self.used -= len(self.rings.pop(key))
+
+    def feed(self, api, endpoints, flat, when, ttl):
+        """
+        Add the samples in flat, the flattened Snapshot of api taken at when, to
+        the history of the windowed endpoints, and add those endpoints to flat
+        """
+        windows = {}
+        for endpoint in endpoints:
+            _, seconds, source = parse(endpoint)
+            windows[source] = max(windows.get(source, 0), seconds)
+        indexes = flat if api in NODE_APIS else {None: flat}
+        with self.lock:
+            if api in NODE_APIS:
+                self.forget(api, indexes)
+            for nodeid in indexes:
+                index = indexes[nodeid]
+                for source in windows:
+                    try:
+                        value = float(index.values[source])
+                    except (KeyError, TypeError, ValueError):
+                        continue
+                    ring = self.ring(
+                        (api, nodeid, source), int(math.ceil(windows[source] / float(ttl))) + 1)
+                    if ring is not None:
+                        ring.append(when, value)
+                for endpoint in endpoints:
+                    aggregate, seconds, source = parse(endpoint)
+                    ring = self.rings.get((api, nodeid, source))
+                    # Allow for the Snapshot at the start of the window being a little late
+                    values = ring.since(when - seconds - 1) if ring is not None else []
+                    if values:
+                        index.values[endpoint] = AGGREGATES[aggregate](values)
+                        index.endpoints.append(endpoint)
+                        index.types[endpoint] = float
@@ -0,0 +1,80 @@
+"""
+Collection plans: the endpoints configuration, compiled once
+"""
+
+import logging
+import threading
+from es_stats_zabbix.defaults.settings import APIS
+
+LOGGER = logging.getLogger(__name__)
+
+def zbxkey(api, endpoint):
+    """Return the Zabbix item key for endpoint of api"""
+    return 'es_stats[{0},{1},]'.format(api, endpoint)
+
+class CollectionPlans(object):
+    """
+    The endpoints configuration, compiled into immutable collection plans.
+
+    A plan is a tuple of (api, endpoint, Zabbix key) tuples, in APIS order, for
+    one nodetype and interval.  Plans are looked up by the roles (nodetypes)
+    of the node being collected, the nodetype, and the interval.
+    """
+    def __init__(self, endpoints):
+        self.nodetypes = {}
+        for nodetype in endpoints:
+            self.nodetypes[nodetype] = {}
+            for interval in endpoints[nodetype]:
+                plan = []
+                for api in APIS:
+                    for endpoint in endpoints[nodetype][interval].get(api, []):
+                        plan.append((api, endpoint, zbxkey(api, endpoint)))
+                self.nodetypes[nodetype][interval] = tuple(plan)
+        self.memo = {}
+        self.lock = threading.Lock()
+
+    def plan(self, roles, nodetype, interval):
+        """
+        Return the plan for nodetype and interval, for a node with the nodetypes
+        in roles.  The plan is empty if nodetype is not one of roles, or if there
+        is no such nodetype or interval in the configuration.
+        """
+        key = (roles, nodetype, interval)
+        if key not in self.memo:
+            if interval not in self.nodetypes.get(nodetype, {}):
+                # Not memoized, so requests for arbitrary intervals cannot grow the memo
+                return ()
+            plan = self.nodetypes[nodetype][interval] if nodetype in roles else ()
+            with self.lock:
+                self.memo[key] = plan
+        return self.memo[key]
+
+    def endpoints(self, roles):
+        """Return a tuple of every endpoint of every interval of the nodetypes in roles"""
+        key = (roles, None, None)
+        if key not in self.memo:
+            endpoints = []
+            for nodetype in self.nodetypes:
+                if nodetype in roles:
+                    for interval in self.nodetypes[nodetype]:
+                        endpoints += [entry[1] for entry in self.nodetypes[nodetype][interval]]
+            with self.lock:
+                self.memo[key] = tuple(endpoints)
+        return self.memo[key]
+
+    def entries(self, roles):
+        """
+        Return a tuple of every (api, endpoint, Zabbix key) of every interval of
+        the nodetypes in roles, once each, in APIS order
+        """
+        key = (roles, None, 'entries')
+        if key not in self.memo:
+            entries = set()
+            for nodetype in self.nodetypes:
+                if nodetype in roles:
+                    for interval in self.nodetypes[nodetype]:
+                        entries.update(self.nodetypes[nodetype][interval])
+            entries = tuple(sorted(entries, key=lambda x: (APIS.index(x[0]), x[1])))
+            with self.lock:
+                self.memo[key] = entries
+        return self.memo[key]
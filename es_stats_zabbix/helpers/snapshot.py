@@ -0,0 +1,634 @@
+"""
+Snapshot storage for Elasticsearch API responses
+"""
+
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import quote
+from dotmap import DotMap
+from es_stats import classes
+from es_stats.exceptions import NotFound
+from es_stats.utils import fix_key, get_value
+from es_stats_zabbix.defaults.settings import (
+    APIS, NODE_APIS, NODESTATS_METRIC_KEYS, NODESTATS_METRICS, REQUIRED_KEYS,
+    skip_these_endpoints)
+from es_stats_zabbix.helpers import derived, history
+from es_stats_zabbix.helpers.batch import typecaster
+from es_stats_zabbix.helpers.history import History
+from es_stats_zabbix.helpers.utils import nodetypes
+
+LOGGER = logging.getLogger(__name__)
+# Elasticsearch rejects requests whose first line is longer than its
+# http.max_initial_line_length, 4kb by default.  Leave room for the rest.
+MAX_FILTER_PATH = 2048
+
+def api_calls(client):
+    """Map each API name to the Elasticsearch client method which fetches it"""
+    return {
+        'health': client.cluster.health,
+        'clusterstate': client.cluster.state,
+        'clusterstats': client.cluster.stats,
+        'nodeinfo': client.nodes.info,
+        'nodestats': client.nodes.stats,
+    }
+
+def computed(endpoint):
+    """Return True if endpoint is computed by the backend: derived, or windowed"""
+    return bool(derived.parse(endpoint) or history.parse(endpoint))
+
+def filter_path(prefix, keys):
+    """
+    Return the `filter_path` for keys, each with prefix, which is at most
+    MAX_FILTER_PATH characters URL encoded.  If need be, keys are cut short to
+    their first two segments (e.g. jvm.mem), or to the first one.  Return None
+    if even that is too long.
+    """
+    for depth in (None, 2, 1):
+        paths = []
+        for key in sorted(set(['.'.join(key.split('.')[:depth]) for key in keys])):
+            # Leave out keys under the one before, e.g. jvm.mem under jvm
+            if not paths or not key.startswith(paths[-1] + '.'):
+                paths.append(key)
+        value = ','.join([prefix + key for key in paths])
+        if len(quote(value, safe='')) <= MAX_FILTER_PATH:
+            return value
+    return None
+
+def fetch_params(api, endpoints):
+    """
+    Compile the endpoints wanted from api into the `filter_path` (and for
+    nodestats, the `metric`) parameters of its Elasticsearch call.  If the
+    `filter_path` would be too long, it is left out, and api is fetched whole.
+    """
+    required = set(REQUIRED_KEYS[api])
+    endpoints = history.sources(endpoints)
+    # Rates are computed over the time between the Elasticsearch timestamps
+    if [endpoint for endpoint in endpoints if derived.parse(endpoint)]:
+        required.add('timestamp')
+    keys = sorted(set(derived.sources(endpoints)) | required)
+    params = {}
+    path = filter_path('nodes.*.' if api in NODE_APIS else '', keys)
+    if path is None:
+        LOGGER.warning('Too many endpoints to prune "{0}".  Fetching it whole.'.format(api))
+    else:
+        params['filter_path'] = path
+    if api == 'nodestats':
+        metrics = set([NODESTATS_METRIC_KEYS.get(key.split('.')[0], key.split('.')[0])
+                       for key in keys if key not in required])
+        if metrics and metrics.issubset(NODESTATS_METRICS):
+            params['metric'] = ','.join(sorted(metrics))
+    return params
+
+def covered(api, endpoints, endpoint):
+    """
+    Return True if endpoint is in a Snapshot of api pruned to endpoints, or if
+    endpoints is None, meaning that the Snapshot is not pruned
+    """
+    if endpoints is None or endpoint in endpoints:
+        return True
+    for key in derived.sources(history.sources(endpoints)) + REQUIRED_KEYS[api]:
+        if endpoint == key or endpoint.startswith(key + '.'):
+            return True
+    return False
+
+class FlatIndex(object):
+    """
+    A nested API response, flattened into dotted notation keys.
+
+    `values` maps every leaf's dotted key to its value.  `endpoints` lists, in
+    order, the dotted keys which are discoverable (no lists, nothing under one of
+    :func:`~es_stats_zabbix.defaults.settings.skip_these_endpoints`), and `types`
+    maps each of those to its :func:`~es_stats_zabbix.helpers.batch.typecaster` type.
+    """
+    __slots__ = ('values', 'types', 'endpoints')
+
+    def __init__(self):
+        self.values = {}
+        self.types = {}
+        self.endpoints = []
+
+def flatten(data):
+    """Flatten the nested dictionary data into a FlatIndex"""
+    index = FlatIndex()
+    skip_these = skip_these_endpoints()
+    def walk(value, prefix, skipped):
+        """Recurse through value, adding each leaf to index"""
+        for key in value:
+            child = value[key]
+            skip = skipped or key in skip_these
+            dotted = prefix + key
+            if isinstance(child, dict):
+                walk(child, dotted + '.', skip)
+            else:
+                index.values[dotted] = child
+                if not skip and not isinstance(child, list):
+                    index.endpoints.append(dotted)
+                    # typecaster cannot type empty strings, which match any type
+                    index.types[dotted] = typecaster(child) if child != '' else str
+    walk(data, '', False)
+    return index
+
+def build_index(api, value):
+    """Flatten value, per node for the node APIs"""
+    if api in NODE_APIS:
+        nodes = value.get('nodes', {})
+        return dict((nodeid, flatten(nodes[nodeid])) for nodeid in nodes)
+    return flatten(value)
+
+class NodeIndex(object):
+    """
+    Lookups of node ids by name and host, and of node names and nodetypes by
+    node id, built from a nodeinfo API response.
+    """
+    __slots__ = ('ids', 'names', 'hosts', 'nodetypes')
+
+    def __init__(self, nodeinfo):
+        nodes = nodeinfo.get('nodes', {})
+        self.ids = {}
+        self.names = {}
+        self.hosts = {}
+        self.nodetypes = {}
+        for nodeid in nodes:
+            node = nodes[nodeid]
+            self.ids[node['name']] = nodeid
+            self.names[nodeid] = node['name']
+            for host in set([node.get('host'), node.get('ip')]):
+                if host:
+                    self.hosts.setdefault(host, []).append(nodeid)
+            try:
+                self.nodetypes[nodeid] = nodetypes(node['settings']['node'])
+            except KeyError:
+                LOGGER.warning('Unable to determine the nodetypes of node {0}'.format(nodeid))
+                self.nodetypes[nodeid] = []
+
+    def nodeid(self, node):
+        """
+        Return the id of the node named node, or of the only node on host node.
+        Return None if there is no such node.
+        """
+        if node in self.ids:
+            return self.ids[node]
+        if len(self.hosts.get(node, [])) == 1:
+            return self.hosts[node][0]
+        return None
+
+class Snapshot(object):
+    """
+    A single, published API response.  Never modified after creation.
+
+    `endpoints` are those it was fetched pruned to, or None if it was not pruned.
+    """
+    __slots__ = ('api', 'value', 'timestamp', 'generation', 'flat', 'nodes', 'endpoints')
+
+    def __init__(self, api, value, generation, flat, nodes=None, endpoints=None):
+        self.api = api
+        self.value = value
+        self.timestamp = time.time()
+        self.generation = generation
+        self.flat = flat
+        self.nodes = nodes
+        self.endpoints = endpoints
+
+    def covers(self, endpoint):
+        """Return True if endpoint was fetched in this Snapshot, if it exists"""
+        return covered(self.api, self.endpoints, endpoint)
+
+    def age(self):
+        """Seconds since this snapshot was fetched"""
+        return time.time() - self.timestamp
+
+    def index(self, nodeid=None):
+        """Return the FlatIndex of this Snapshot, or of node nodeid for the node APIs"""
+        if self.api in NODE_APIS:
+            return self.flat.get(nodeid, EMPTY_INDEX)
+        return self.flat
+
+EMPTY_INDEX = FlatIndex()
+
+class Flight(object):
+    """A fetch in progress, which other threads can wait on and share"""
+    __slots__ = ('done', 'snapshot', 'error')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.snapshot = None
+        self.error = None
+
+class SnapshotStore(object):
+    """
+    Hold the most recently published Snapshot of each API.
+
+    Readers always get the latest published Snapshot, and never wait on
+    Elasticsearch unless no Snapshot has been published yet for that API.
+
+    Concurrent refreshes of the same API are coalesced: while one fetch is in
+    flight, other callers wait for it and share its Snapshot (or its error).
+
+    Each API is fresh for its own TTL from `ttls`, falling back to `cache_timeout`.
+    If it cannot be refreshed, its Snapshot is still read until it is
+    `expire_after` TTLs old.  After that, reading it fetches it again, and so
+    raises while Elasticsearch is unavailable.
+
+    If `endpoints` (a dictionary of API: [endpoints]) is provided, every API but
+    health is fetched pruned to just those endpoints.  A `full` Snapshot of an
+    API is only fetched on demand, and is cached for the same TTL.
+
+    Several APIs can be fetched concurrently with `refresh_all` and `prefetch`,
+    so that the wait is for the slowest of them, not the sum.
+
+    Derived endpoints (see :mod:`~es_stats_zabbix.helpers.derived`) in
+    `endpoints`, or added with `derive` (at most `max_derived` of them), are
+    computed from the previous Snapshot of their API as each new one is published.  So are windowed
+    endpoints (see :mod:`~es_stats_zabbix.helpers.history`), from the samples
+    of their sources kept in `history`.
+    """
+    def __init__(self, client, cache_timeout=60, ttls=None, endpoints=None, history=None,
+                 expire_after=3, max_derived=100):
+        self.client = client
+        self.cache_timeout = cache_timeout
+        self.expire_after = expire_after
+        self.ttls = ttls if ttls else {}
+        self.calls = api_calls(client)
+        self.endpoints = {}
+        self.params = {}
+        self.derived = {}
+        # Derived and windowed endpoints added by requests, and the most there may be
+        self.added = 0
+        self.max_derived = max_derived
+        self.history = history if history is not None else History()
+        if endpoints:
+            for api in endpoints:
+                self.derived[api] = [x for x in endpoints[api] if computed(x)]
+            for api in APIS:
+                if api in REQUIRED_KEYS:
+                    self.endpoints[api] = list(endpoints.get(api, []))
+                    self.params[api] = fetch_params(api, self.endpoints[api])
+        self.snapshots = {}
+        self.full_snapshots = {}
+        self.generation = 0
+        self.flights = {}
+        self.local = None
+        self.lock = threading.Lock()
+        # One thread per API at most.  Threads are only started when first used.
+        self.fetcher = ThreadPoolExecutor(max_workers=len(APIS))
+
+    def pruned(self, api):
+        """Return True if api is fetched pruned to the configured endpoints"""
+        return api in self.params
+
+    def covers(self, api, endpoint):
+        """Return True if endpoint would be in the next pruned Snapshot of api, if it exists"""
+        return covered(api, self.endpoints[api] if self.pruned(api) else None, endpoint)
+
+    def include(self, api, endpoint):
+        """Add endpoint to those fetched for api, from the next refresh on"""
+        with self.lock:
+            if self.covers(api, endpoint):
+                return
+            LOGGER.info('Adding endpoint "{0}" to those fetched for "{1}"'.format(endpoint, api))
+            self.endpoints[api] = self.endpoints[api] + [endpoint]
+            self.params[api] = fetch_params(api, self.endpoints[api])
+
+    def derive(self, api, endpoint):
+        """Compute derived or windowed endpoint for api from the next refresh on"""
+        with self.lock:
+            if endpoint in self.derived.get(api, []):
+                return
+            if self.added >= self.max_derived:
+                LOGGER.debug('Not deriving endpoint "{0}" of "{1}"'.format(endpoint, api))
+                return
+            self.added += 1
+            if self.added == self.max_derived:
+                LOGGER.warning('{0} derived or windowed endpoints have been added on request.  '
+                               'No more will be.'.format(self.added))
+            LOGGER.info('Deriving endpoint "{0}" of "{1}"'.format(endpoint, api))
+            self.derived[api] = self.derived.get(api, []) + [endpoint]
+            if self.pruned(api):
+                self.endpoints[api] = self.endpoints[api] + [endpoint]
+                self.params[api] = fetch_params(api, self.endpoints[api])
+
+    def nodes(self):
+        """Return the NodeIndex of the current nodeinfo Snapshot"""
+        return self.snapshot('nodeinfo').nodes
+
+    def local_node(self):
+        """Return a tuple of the id and name of the node the client connects to"""
+        if self.local is None:
+            localinfo = self.client.nodes.info(node_id='_local')['nodes']
+            nodeid = list(localinfo.keys())[0]
+            self.local = (nodeid, localinfo[nodeid]['name'])
+        return self.local
+
+    def fetch(self, api, full=False):
+        """Make the actual call to Elasticsearch"""
+        params = {} if full else self.params.get(api, {})
+        LOGGER.debug('Fetching API "{0}" from Elasticsearch: {1}'.format(api, params))
+        return self.calls[api](**params)
+
+    def publish(self, api, value, full=False, endpoints=None):
+        """
+        Flatten value, and make it the current Snapshot for api.  endpoints are
+        those it was fetched pruned to, if any.
+        """
+        flat = build_index(api, value)
+        nodes = NodeIndex(value) if api == 'nodeinfo' else None
+        previous = (self.full_snapshots if full else self.snapshots).get(api)
+        # Including the rates and ratios windowed endpoints are computed from
+        rates = [x for x in history.sources(self.derived.get(api, [])) if derived.parse(x)]
+        if previous is not None and rates:
+            derived.derive_all(api, rates, previous.flat, flat, previous.age())
+        windows = [x for x in self.derived.get(api, []) if history.parse(x)]
+        # Full Snapshots are fetched irregularly, so are not added to the history
+        if windows and not full:
+            self.history.feed(api, windows, flat, time.time(), self.ttl(api))
+        with self.lock:
+            self.generation += 1
+            snapshot = Snapshot(
+                api, value, self.generation, flat, nodes=nodes, endpoints=endpoints)
+            if full:
+                self.full_snapshots[api] = snapshot
+            else:
+                self.snapshots[api] = snapshot
+        return snapshot
+
+    def refresh(self, api, full=False):
+        """Fetch api from Elasticsearch and publish the result"""
+        with self.lock:
+            flight = self.flights.get((api, full))
+            leader = flight is None
+            if leader:
+                flight = self.flights[(api, full)] = Flight()
+        if not leader:
+            LOGGER.debug('Waiting on in-flight fetch of API "{0}"'.format(api))
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.snapshot
+        try:
+            with self.lock:
+                # Read before fetching, as endpoints included meanwhile may not be fetched
+                endpoints = None if full or not self.pruned(api) else self.endpoints[api]
+            flight.snapshot = self.publish(
+                api, self.fetch(api, full=full), full=full, endpoints=endpoints)
+            return flight.snapshot
+        except Exception as err:
+            flight.error = err
+            raise
+        finally:
+            with self.lock:
+                del self.flights[(api, full)]
+            flight.done.set()
+
+    def refresh_all(self, apis, full=False):
+        """
+        Refresh apis concurrently.  Return a dictionary of each api to its new
+        Snapshot, or to the exception raised fetching it.
+        """
+        if len(apis) == 1:
+            futures = {}
+        else:
+            futures = dict((api, self.fetcher.submit(self.refresh, api, full=full)) for api in apis)
+        results = {}
+        for api in apis:
+            try:
+                results[api] = futures[api].result() if futures else self.refresh(api, full=full)
+            except Exception as err:
+                results[api] = err
+        return results
+
+    def stale(self, api, full=False):
+        """Return True if reading the Snapshot for api would have to fetch it first"""
+        if full and self.pruned(api):
+            snapshot = self.full_snapshots.get(api)
+            return snapshot is None or snapshot.age() > self.ttl(api)
+        snapshot = self.snapshots.get(api)
+        return snapshot is None or snapshot.age() > self.ttl(api) * self.expire_after
+
+    def prefetch(self, apis, full=False):
+        """
+        Concurrently fetch the Snapshots of apis which reading would otherwise
+        fetch one at a time.  Errors are left for those reads to raise.
+        """
+        due = [api for api in apis if self.stale(api, full=full)]
+        if due:
+            LOGGER.debug('Prefetching APIs: {0}'.format(due))
+            self.refresh_all(due, full=full)
+
+    def snapshot(self, api, full=False):
+        """
+        Return the current Snapshot for api, fetching it only if none exists yet,
+        or if it has expired.
+
+        Full Snapshots of pruned APIs are not kept fresh in the background, so
+        they are refetched here once they are older than the API's TTL.
+        """
+        full = full and self.pruned(api)
+        if self.stale(api, full=full):
+            return self.refresh(api, full=full)
+        return self.full_snapshots[api] if full else self.snapshots[api]
+
+    def read(self, api, full=False):
+        """Return the raw API response from the current Snapshot for api"""
+        return self.snapshot(api, full=full).value
+
+    def ttl(self, api):
+        """Return the number of seconds a Snapshot of api is considered fresh"""
+        return self.ttls.get(api, self.cache_timeout)
+
+    def due_in(self, api):
+        """Return the number of seconds until api should be refreshed"""
+        snapshot = self.snapshots.get(api)
+        if snapshot is None:
+            return 0
+        return self.ttl(api) - snapshot.age()
+
+    def pin(self):
+        """Return a SnapshotSet of this store"""
+        return SnapshotSet(self)
+
+class SnapshotSet(object):
+    """
+    A view of a SnapshotStore which pins the first Snapshot it reads of each
+    API, so every read through it comes from the same Snapshots, even if the
+    store is refreshed meanwhile.  Use one per request, and then discard it.
+    """
+    def __init__(self, store):
+        self.store = store
+        self.client = store.client
+        self.pinned = {}
+
+    def __getattr__(self, name):
+        return getattr(self.store, name)
+
+    def snapshot(self, api, full=False):
+        """Return the pinned Snapshot for api, pinning the current one if need be"""
+        if (api, full) not in self.pinned:
+            self.pinned[(api, full)] = self.store.snapshot(api, full=full)
+        return self.pinned[(api, full)]
+
+    def pin(self):
+        """Return this SnapshotSet, as it is already pinned"""
+        return self
+
+    def nodes(self):
+        """Return the NodeIndex of the pinned nodeinfo Snapshot"""
+        return self.snapshot('nodeinfo').nodes
+
+    def read(self, api, full=False):
+        """Return the raw API response from the pinned Snapshot for api"""
+        return self.snapshot(api, full=full).value
+
+class SnapshotReader(object):
+    """
+    Mixin for the es_stats classes which replaces their private, per-object
+    cache with reads from a shared SnapshotStore.
+
+    A pruned reader falls back to its `fallback` full reader for any endpoint
+    the pruned Snapshot does not cover, and asks the store to fetch that
+    endpoint from then on.  It keeps falling back until a Snapshot fetched
+    with that endpoint is published.  Reads of any other API (e.g. node names from
+    nodestats) always use the pruned Snapshots.
+
+    Reads are O(1) lookups in the FlatIndex of the current Snapshot, and never
+    change the state of the reader, so it can be shared by concurrent requests.
+    """
+    # pylint: disable=super-init-not-called
+    def __init__(self, store, api, full=False, fallback=None):
+        # Deliberately not calling the es_stats __init__, which calls Elasticsearch.
+        self.logger = logging.getLogger('es_stats_zabbix.helpers.snapshot.{0}'.format(api))
+        self.client = store.client
+        self.cache = {}
+        self.cache_timeout = store.ttl(api)
+        self.local_id, self.local_name = store.local_node()
+        self.nodeid = self.local_id[:]
+        self.nodename = self.local_name[:]
+        self.store = store
+        self.api = api
+        self.full = full
+        self.fallback = fallback
+
+    def pull_stats(self, k):
+        self.store.refresh(k, full=self.full and k == self.api)
+
+    def cached_read(self, kind):
+        return self.store.read(kind, full=self.full and kind == self.api)
+
+    def nodes(self):
+        """Return the NodeIndex of the current nodeinfo Snapshot"""
+        return self.store.nodes()
+
+    def nodeid_for(self, name):
+        """Return the node id of the node named name, or the local node's if None"""
+        if name is None:
+            return self.local_id
+        nodeid = self.nodes().nodeid(name)
+        if nodeid is not None:
+            return nodeid
+        msg = 'Node with name {0} not found.'.format(name)
+        self.logger.critical(msg)
+        raise NotFound(msg)
+
+    def generation(self):
+        """Return the generation of the current Snapshot"""
+        return self.store.snapshot(self.api, full=self.full).generation
+
+    def index(self, nodeid=None):
+        """Return the FlatIndex of the current Snapshot (for nodeid, or the local node)"""
+        snapshot = self.store.snapshot(self.api, full=self.full)
+        return snapshot.index(nodeid if nodeid else self.local_id)
+
+    def lookup(self, key, nodeid):
+        """
+        Return the value of key from the FlatIndex, or walk the nested Snapshot
+        for keys which are not leaves (returning an empty DotMap if not found,
+        or if node nodeid is not in the Snapshot).
+        """
+        index = self.index(nodeid)
+        if key in index.values:
+            return index.values[key]
+        if index is EMPTY_INDEX:
+            # The node is not in this Snapshot, e.g. it just left the cluster
+            self.logger.debug('Node {0} not found in {1}'.format(nodeid, self.api))
+            return DotMap()
+        return get_value(self.stats(nodeid=nodeid), fix_key(key))
+
+    def resolves(self, endpoint, name=None):
+        """
+        Return True if every source of the computed endpoint has a value in the
+        full Snapshot (for node name), so no endpoint is derived from nothing
+        """
+        reader = self.fallback if self.fallback is not None else self
+        nodeid = reader.nodeid_for(name)
+        for source in derived.sources(history.sources([endpoint])):
+            if isinstance(reader.lookup(source, nodeid), DotMap):
+                self.logger.debug('No such endpoint to derive from: {0}'.format(source))
+                return False
+        return True
+
+    def get(self, key, name=None):
+        value = self.lookup(key, self.nodeid_for(name))
+        if value == DotMap() and computed(key):
+            # There is a value from the second refresh after the first request
+            if self.resolves(key, name=name):
+                self.store.derive(self.api, key)
+            return value
+        if value == DotMap() and self.fallback is not None \
+                and not self.store.snapshot(self.api).covers(key):
+            value = self.fallback.get(key, name=name)
+            if not isinstance(value, DotMap):
+                self.store.include(self.api, key)
+        return value
+
+class ClusterHealth(SnapshotReader, classes.ClusterHealth):
+    """ClusterHealth reading from a SnapshotStore"""
+
+class ClusterState(SnapshotReader, classes.ClusterState):
+    """ClusterState reading from a SnapshotStore"""
+    def lookup(self, key, nodeid):
+        value = super(ClusterState, self).lookup(key, nodeid)
+        # Like the es_stats ClusterState, report the master node by name, not id
+        if key == 'master_node' and not isinstance(value, DotMap):
+            value = self.nodes().names.get(value, value)
+        return value
+
+class ClusterStats(SnapshotReader, classes.ClusterStats):
+    """ClusterStats reading from a SnapshotStore"""
+
+class NodeInfo(SnapshotReader, classes.NodeInfo):
+    """NodeInfo reading from a SnapshotStore"""
+
+class NodeStats(SnapshotReader, classes.NodeStats):
+    """NodeStats reading from a SnapshotStore"""
+
+STATCLASSES = {
+    'health': ClusterHealth,
+    'clusterstate': ClusterState,
+    'clusterstats': ClusterStats,
+    'nodeinfo': NodeInfo,
+    'nodestats': NodeStats,
+}
+
+def statobjs(store, full=False):
+    """
+    Return a dictionary of stat objects, one per API, all sharing store.
+
+    If full is True, they read full Snapshots.  Otherwise they read pruned
+    Snapshots, and fall back to full ones for endpoints missing from them.
+    """
+    retval = {}
+    for api in APIS:
+        fallback = None if full else STATCLASSES[api](store, api, full=True)
+        retval[api] = STATCLASSES[api](store, api, full=full, fallback=fallback)
+    return retval
+
+def pinned(objs):
+    """Return stat objects like objs, but all reading from one new SnapshotSet"""
+    reader = objs[APIS[0]]
+    return statobjs(reader.store.pin(), full=reader.full)
+
+def prefetch(objs):
+    """Concurrently fetch any Snapshots which reading every API through objs would fetch"""
+    reader = objs[APIS[0]]
+    reader.store.prefetch(APIS, full=reader.full)
@@ -2,21 +2,66 @@
 Utility methods
 """
 
+import json
 import socket
 import logging
-import requests
 from es_stats_zabbix.defaults.settings import NODETYPES
-from es_stats_zabbix.exceptions import FailedExecution, NotFound
+from es_stats_zabbix.exceptions import BackendUnavailable, FailedExecution, NotFound
 
 LOGGER = logging.getLogger(__name__)
 
+def http_request(host, port, uri, method, body=None, timeout=10):
+    """
+    Make an HTTP/1.0 request over a plain socket, as the CLI commands must start
+    quickly, and even http.client imports email and ssl.  A body is sent as JSON.
+    Return a tuple of the response status and text.
+
+    If host is ``unix:///path/to/socket``, connect to that Unix domain socket
+    instead, and ignore port.  Raise BackendUnavailable if the connection fails.
+    """
+    unix = host.startswith('unix://')
+    payload = b''
+    headers = 'Host: {0}\r\nConnection: close\r\n'.format(
+        'localhost' if unix else '{0}:{1}'.format(host, port))
+    if body is not None:
+        payload = json.dumps(body).encode('utf-8')
+        headers += 'Content-Type: application/json\r\n'
+    headers += 'Content-Length: {0}\r\n'.format(len(payload))
+    request = '{0} {1} HTTP/1.0\r\n{2}\r\n'.format(method.upper(), uri, headers)
+    try:
+        if unix:
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            sock.settimeout(timeout)
+            try:
+                sock.connect(host[7:])
+            except OSError:
+                sock.close()
+                raise
+        else:
+            sock = socket.create_connection((host, port), timeout=timeout)
+    except OSError as err:
+        raise BackendUnavailable('Unable to connect to the backend: {0}'.format(err))
+    try:
+        sock.sendall(request.encode('utf-8') + payload)
+        chunks = []
+        while True:
+            chunk = sock.recv(65536)
+            if not chunk:
+                break
+            chunks.append(chunk)
+    finally:
+        sock.close()
+    head, _, text = b''.join(chunks).partition(b'\r\n\r\n')
+    status = int(head.split(b'\r\n', 1)[0].split()[1])
+    return status, text.decode('utf-8')
+
 def log_to_listener(host, port, level, msgs):
     """Log to the REST API"""
-    url = 'http://{0}:{1}/api/logger/{2}'.format(host, port, level)
+    uri = '/api/logger/{0}'.format(level)
     if not isinstance(msgs, dict):
-        requests.post(url, json={'message': '{0}'.format(msgs)})
+        http_request(host, port, uri, 'post', body={'message': '{0}'.format(msgs)})
     else:
-        requests.post(url, json=msgs)
+        http_request(host, port, uri, 'post', body=msgs)
 
 def open_port(host, port):
     """Test whether a port is open at host.  Return boolean"""
@@ -27,24 +72,32 @@ def open_port(host, port):
         return True
     except:
         return False
+    finally:
+        sock.close()
 
 def do_request(host, port, uri, method, body=None):
-    """Wrapper for handling REST requests"""
+    """
+    Wrapper for handling REST requests.  The CLI commands make no separate check
+    that the backend is up: if it is not, BackendUnavailable is raised here, on
+    the first request, and they exit with 1.
+    """
     # Since we're manually separating with a /, prune if it exists.
     uri = uri[1:] if uri[0] == '/' else uri
     url = 'http://{0}:{1}/{2}'.format(host, port, uri)
+    if host.startswith('unix://'):
+        url = '{0}/{1}'.format(host, uri)
     try:
         if method == 'get':
-            req = requests.get(url)
+            status, text = http_request(host, port, '/' + uri, 'get')
         elif body is not None:
             LOGGER.debug('POST: url={0}, body={1}'.format(url, body))
-            req = requests.post(url, json=body)
+            status, text = http_request(host, port, '/' + uri, 'post', body=body)
         else:
             raise ValueError('No value provided for "body"')
-        if req.status_code != 200:
+        if status != 200:
             # Something was invalid
             msgs = {
-                'message': 'Response received: {0}'.format(req.status_code),
+                'message': 'Response received: {0}'.format(status),
                 'method': method.upper(),
                 'url': url,
                 'body': body,
@@ -53,7 +106,10 @@ def do_request(host, port, uri, method, body=None):
             raise NotFound('A non-200 HTTP response code was received.')
         else:
             # We're good!
-            return req.text
+            return text
+    except BackendUnavailable:
+        # Nothing to log to
+        raise
     except:
         # Something else is amiss with our api/endpoint/node
         log_to_listener(host, port, 'error', 'Failed to collect value. Try using --debug')
@@ -71,11 +127,10 @@ def status_map(state):
         retval = 3 # fail
     return retval
 
-def true_nodetypes(statobj, nodeid):
+def nodetypes(settings):
     """
-    Return a list of nodetypes which have a `True` status"""
-    nodeinfo = statobj.cached_read('nodeinfo')['nodes']
-    settings = nodeinfo[nodeid]['settings']['node']
+    Return a list of nodetypes which have a `True` status in a node's
+    `settings.node` settings"""
     retval = []
     for nodetype in NODETYPES:
         if nodetype in settings:
@@ -93,9 +148,15 @@ def true_nodetypes(statobj, nodeid):
     LOGGER.debug('RETVAL={0}'.format(retval))
     return retval
 
+def true_nodetypes(statobj, nodeid):
+    """
+    Return a list of nodetypes which have a `True` status, from the node index
+    of the current nodeinfo snapshot.  Do not modify the list."""
+    return statobj.nodes().nodetypes[nodeid]
+
 def get_cluster_macros(statobj, nodeid):
     """Get the cluster and node LLD macros"""
-    cluster_name = statobj.client.cluster.health()['cluster_name']
+    cluster_name = statobj.cached_read('health')['cluster_name']
     nodeinfo = statobj.cached_read('nodeinfo')['nodes']
     nodename = nodeinfo[nodeid]['name']
     entries = {
@@ -123,18 +184,14 @@ def get_node_macros(statobj, nodeid):
     return macros
 
 def get_nodeid(statobjs, node):
-    """Get the nodeid from the node name"""
-    nodeinfo = statobjs['nodeinfo'].cached_read('nodeinfo')['nodes']
-    found = False
+    """Get the nodeid from the node name (or host), from the node index"""
     if not node:
         msg = 'No node name provided.'
         raise NotFound(msg)
-    for n_i in nodeinfo:
-        if nodeinfo[n_i]['name'] == node:
-            LOGGER.debug('Found node name "{0}"'.format(node))
-            LOGGER.debug('Setting nodeid to "{0}"'.format(n_i))
-            return n_i
-    if not found:
+    nodeid = statobjs['nodeinfo'].nodes().nodeid(node)
+    if nodeid is None:
         msg = 'Node with name {0} not found.'.format(node)
         LOGGER.critical(msg)
         raise NotFound(msg)
+    LOGGER.debug('Found node name "{0}", with nodeid "{1}"'.format(node, nodeid))
+    return nodeid
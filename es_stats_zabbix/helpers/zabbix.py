@@ -2,18 +2,43 @@
 Zabbix Sender Module
 """
 
+import hashlib
+import json
 import logging
 import os
 import random
+import re
 import shutil
+import socket
+import ssl
 import string
+import struct
 import tempfile
+import threading
+import time
 import protobix
 from dotmap import DotMap
+from es_stats_zabbix.exceptions import ConfigurationError, FailedExecution
 from es_stats_zabbix.helpers.utils import status_map
 
+ZBX_HDR = b'ZBXD\x01'
+ZBX_HDR_SIZE = 13
+ZBX_RESP_REGEX = re.compile(
+    r'[Pp]rocessed:? (\d+);? [Ff]ailed:? (\d+);? [Tt]otal:? (\d+);? [Ss]econds spent:? (\d+\.\d+)')
+# Zabbix trappers accept at most 250 items per request
+ZBX_TRAPPER_MAX_VALUE = 250
+# Short names of the certificate name attributes, as Zabbix formats them (RFC 4514)
+DN_ATTRIBUTES = {
+    'commonName': 'CN', 'countryName': 'C', 'domainComponent': 'DC', 'localityName': 'L',
+    'organizationName': 'O', 'organizationalUnitName': 'OU', 'stateOrProvinceName': 'ST',
+    'streetAddress': 'STREET', 'userId': 'UID',
+}
+
 class ZbxSendObject():
-    """Zabbix Sender Class"""
+    """
+    Zabbix Sender Class, which uses protobix.  Superseded by ZabbixSender, but
+    kept for comparison.
+    """
     def __init__(self, zbx_conf):
         self.zabbix = zbx_conf
         self.debug = False
@@ -61,3 +86,304 @@ class ZbxSendObject():
         self.logger.debug('DATA = {0}'.format({host:data}))
         zbx_datacontainer.add({host:data})
         return zbx_datacontainer.send()
+
+def server_address(server_active, port):
+    """
+    Return a tuple of the host and port of the first Zabbix server in
+    server_active, as the Zabbix agent reads ServerActive, e.g. "zabbix",
+    "zabbix:10052", "[::1]:10052" or "::1".  The port defaults to port, and the
+    host to 127.0.0.1.
+    """
+    server = (server_active or '127.0.0.1').split(',')[0].strip()
+    if server.startswith('['):
+        server, _, rest = server[1:].partition(']')
+        if rest.startswith(':'):
+            port = rest[1:]
+    elif server.count(':') == 1:
+        # More than one colon is an IPv6 address, without a port
+        server, port = server.split(':')
+    return server, int(port)
+
+class ZabbixSender(object):
+    """
+    Zabbix Sender which speaks the Zabbix sender protocol directly.
+
+    Build it once from the `zabbix` configuration dictionary and reuse it for
+    every push.  The server address and the TLS context are resolved once, here.
+    The Zabbix server closes the connection after answering each request, so a
+    connection is opened per request (per 250 items).
+
+    send() returns the same tuple as protobix's DataContainer.send():
+    (server_success, server_failure, processed, failed, total, seconds spent)
+    """
+    def __init__(self, zbx_conf):
+        self.logger = logging.getLogger('esz.ZabbixSender')
+        self.server, self.port = server_address(
+            zbx_conf.get('ServerActive'), zbx_conf.get('ServerPort', 10051))
+        self.timeout = zbx_conf.get('Timeout', 3)
+        # Zabbix agents send items one at a time at DebugLevel 4 or higher
+        self.bulk = 1 if zbx_conf.get('DebugLevel', 3) >= 4 else ZBX_TRAPPER_MAX_VALUE
+        self.tls_connect = zbx_conf.get('TLSConnect', 'unencrypted')
+        if self.tls_connect == 'psk':
+            raise ConfigurationError('TLSConnect=psk is not supported.  Use unencrypted or cert.')
+        self.context = None
+        if self.tls_connect == 'cert':
+            self.context = tls_context(zbx_conf)
+        self.issuer = zbx_conf.get('TLSServerCertIssuer')
+        self.subject = zbx_conf.get('TLSServerCertSubject')
+        self.address = None
+
+    def resolve(self):
+        """Resolve the Zabbix server address, once"""
+        if self.address is None:
+            family, kind, proto, _, address = socket.getaddrinfo(
+                self.server, self.port, type=socket.SOCK_STREAM)[0]
+            self.address = (family, kind, proto, address)
+        return self.address
+
+    def connect(self):
+        """Return a new connection to the Zabbix server"""
+        family, kind, proto, address = self.resolve()
+        sock = socket.socket(family, kind, proto)
+        sock.settimeout(self.timeout)
+        try:
+            sock.connect(address)
+            if self.context:
+                sock = self.context.wrap_socket(sock)
+                self.verify_peer(sock)
+        except OSError:
+            sock.close()
+            # The address may have changed
+            self.address = None
+            raise
+        return sock
+
+    def verify_peer(self, sock):
+        """
+        Raise ssl.SSLError unless the Zabbix server certificate has the
+        configured TLSServerCertIssuer and TLSServerCertSubject, if any
+        """
+        cert = sock.getpeercert()
+        for setting, field, expected in (
+                ('TLSServerCertIssuer', 'issuer', self.issuer),
+                ('TLSServerCertSubject', 'subject', self.subject)):
+            if expected and dn_string(cert.get(field, ())) != expected:
+                raise ssl.SSLError('Zabbix server certificate {0} "{1}" does not match {2}'.format(
+                    field, dn_string(cert.get(field, ())), setting))
+
+    def request(self, items, clock):
+        """
+        Send one request of items.  Return a tuple of the server response
+        ('success' or 'failed'), processed, failed, total and seconds spent
+        """
+        payload = json.dumps({'request': 'sender data', 'data': items, 'clock': clock})
+        payload = payload.encode('utf-8')
+        packet = ZBX_HDR + struct.pack('<Q', len(payload)) + payload
+        sock = self.connect()
+        try:
+            sock.sendall(packet)
+            header = recv_exactly(sock, ZBX_HDR_SIZE)
+            if header[:5] != ZBX_HDR:
+                raise FailedExecution(
+                    'Invalid response header from Zabbix server: {0}'.format(header))
+            length = struct.unpack('<Q', header[5:])[0]
+            body = json.loads(recv_exactly(sock, length).decode('utf-8'))
+        finally:
+            sock.close()
+        self.logger.debug('Zabbix server response: {0}'.format(body))
+        result = ZBX_RESP_REGEX.search(body.get('info', ''))
+        if not result:
+            raise FailedExecution('Unexpected response from Zabbix server: {0}'.format(body))
+        processed, failed, total, spent = result.groups()
+        return body.get('response'), int(processed), int(failed), int(total), float(spent)
+
+    def send(self, host, data, data_type='items'):
+        """Send data, a dictionary of item keys and values, for host"""
+        return self.send_hosts({host: data}, data_type=data_type)
+
+    def send_hosts(self, data, data_type='items'):
+        """
+        Send data, a dictionary of hosts, each with a dictionary of item keys and
+        values, in as few requests as the 250 items per request limit allows.
+        """
+        clock = int(time.time())
+        items = []
+        for host in data:
+            for key in data[host]:
+                if data[host][key] == []:
+                    continue
+                if data_type == 'lld':
+                    value = json.dumps({'data': data[host][key]})
+                else:
+                    value = data[host][key]
+                items.append(
+                    {'host': host, 'key': key, 'value': value, 'clock': clock, 'state': 0})
+        self.logger.debug('Sending {0} items for {1} host(s)'.format(len(items), len(data)))
+        server_success = server_failure = processed = failed = total = spent = 0
+        for offset in range(0, len(items), self.bulk):
+            result = self.request(items[offset:offset + self.bulk], clock)
+            if result[0] == 'success':
+                server_success += 1
+            elif result[0] == 'failed':
+                server_failure += 1
+            processed += result[1]
+            failed += result[2]
+            total += result[3]
+            spent += result[4]
+        return server_success, server_failure, processed, failed, total, spent
+
+class ChangeFilter(object):
+    """
+    Remember the last value sent for each host and item key, so that only
+    changed values need be sent.  A value which has not changed is still sent
+    every `heartbeat` pushes, so Zabbix can tell it from no data at all.
+
+    Values not seen for `expire` heartbeats of their last push interval, e.g.
+    those of departed nodes, are forgotten.  Values only seen once go by the
+    longest last push interval of any value.
+    """
+    def __init__(self, heartbeat=10, expire=3):
+        self.heartbeat = heartbeat
+        self.expire = expire
+        # (host, key): (value, pushes since sent, last seen, seconds since seen before)
+        self.last = {}
+        self.lock = threading.Lock()
+        self.logger = logging.getLogger('esz.ChangeFilter')
+
+    def changes(self, data):
+        """
+        Return data, a dictionary of hosts, each with a dictionary of item keys
+        and values, with only the values which changed or are due a heartbeat.
+        They are remembered as sent.
+        """
+        retval = {}
+        kept = total = 0
+        now = time.time()
+        with self.lock:
+            for host in data:
+                for key in data[host]:
+                    total += 1
+                    value = data[host][key]
+                    last = self.last.get((host, key))
+                    period = now - last[2] if last is not None else 0
+                    if last is not None and last[0] == value and last[1] + 1 < self.heartbeat:
+                        self.last[(host, key)] = (value, last[1] + 1, now, period)
+                        continue
+                    self.last[(host, key)] = (value, 0, now, period)
+                    retval.setdefault(host, {})[key] = value
+                    kept += 1
+            self.prune(now)
+        self.logger.debug('Sending {0} of {1} values'.format(kept, total))
+        return retval
+
+    def prune(self, now):
+        """Forget the values not seen for `expire` heartbeats.  Call with the lock held."""
+        longest = max([x[3] for x in self.last.values()] or [0])
+        window = self.expire * self.heartbeat
+        for hostkey in list(self.last):
+            _, _, seen, period = self.last[hostkey]
+            period = period or longest
+            if period and now - seen > window * period:
+                del self.last[hostkey]
+
+    def forget(self, data):
+        """Forget the values in data, e.g. if they could not be sent, so they are sent next time"""
+        with self.lock:
+            for host in data:
+                for key in data[host]:
+                    self.last.pop((host, key), None)
+
+class LLDFilter(object):
+    """
+    Remember a fingerprint of the LLD data last sent for each host, so the same
+    data need not be sent again.  It is still sent once `refresh` seconds have
+    passed, so Zabbix does not treat the discovered items as lost.
+
+    Count the sends and skips per host.
+    """
+    def __init__(self, refresh=3600):
+        self.refresh = refresh
+        self.last = {}
+        self.counts = {}
+        self.lock = threading.Lock()
+        self.logger = logging.getLogger('esz.LLDFilter')
+
+    @staticmethod
+    def fingerprint(llddata):
+        """Return a fingerprint of llddata"""
+        return hashlib.sha1(json.dumps(llddata, sort_keys=True).encode('utf-8')).hexdigest()
+
+    def due(self, host, fingerprint):
+        """Return True if LLD data with fingerprint should be sent for host, else count a skip"""
+        with self.lock:
+            last = self.last.get(host)
+            if last is None or last[0] != fingerprint or time.time() - last[1] >= self.refresh:
+                return True
+            self.counts.setdefault(host, [0, 0])[1] += 1
+        self.logger.debug('LLD data for {0} is unchanged.  Not sending.'.format(host))
+        return False
+
+    def sent(self, host, fingerprint):
+        """Record that LLD data with fingerprint was sent for host"""
+        with self.lock:
+            self.last[host] = (fingerprint, time.time())
+            self.counts.setdefault(host, [0, 0])[0] += 1
+
+    def count(self, host):
+        """Return a tuple of the number of times LLD data was sent and skipped for host"""
+        with self.lock:
+            return tuple(self.counts.get(host, (0, 0)))
+
+def recv_exactly(sock, size):
+    """Read exactly size bytes from sock"""
+    data = b''
+    while len(data) < size:
+        chunk = sock.recv(size - len(data))
+        if not chunk:
+            raise FailedExecution('Connection closed by Zabbix server')
+        data += chunk
+    return data
+
+def dn_string(rdns):
+    """
+    Return a distinguished name, as returned by SSLSocket.getpeercert(), as an
+    RFC 4514 string, which is how Zabbix compares TLSServerCertIssuer and
+    TLSServerCertSubject, e.g. "CN=Zabbix server,OU=Operations,O=Example,C=LV"
+    """
+    retval = []
+    for rdn in reversed(rdns):
+        values = []
+        for name, value in rdn:
+            value = re.sub(r'([,+"\\<>;])', r'\\\1', value)
+            if value.startswith(('#', ' ')):
+                value = '\\' + value
+            if value.endswith(' '):
+                value = value[:-1] + '\\ '
+            values.append('{0}={1}'.format(DN_ATTRIBUTES.get(name, name), value))
+        retval.append('+'.join(values))
+    return ','.join(retval)
+
+def tls_context(zbx_conf):
+    """Return an SSLContext for TLSConnect=cert, as the Zabbix agent configures it"""
+    # PROTOCOL_TLS_CLIENT and minimum_version are Python 3.6 and 3.7 on, and
+    # the options they replace are deprecated from then on
+    context = ssl.SSLContext(getattr(ssl, 'PROTOCOL_TLS_CLIENT', ssl.PROTOCOL_SSLv23))
+    # Zabbix verifies the certificate issuer and subject (see verify_peer), not the hostname
+    context.check_hostname = False
+    context.verify_mode = ssl.CERT_REQUIRED
+    # TLS 1.2 or later only
+    if hasattr(ssl, 'TLSVersion'):
+        context.minimum_version = ssl.TLSVersion.TLSv1_2
+    else:
+        context.options |= ssl.OP_NO_SSLv2 | ssl.OP_NO_SSLv3 | ssl.OP_NO_TLSv1 | ssl.OP_NO_TLSv1_1
+    context.options |= ssl.OP_NO_COMPRESSION
+    context.verify_flags = ssl.VERIFY_X509_STRICT
+    context.load_cert_chain(zbx_conf.get('TLSCertFile'), zbx_conf.get('TLSKeyFile'))
+    if zbx_conf.get('TLSCAFile'):
+        context.load_verify_locations(cafile=zbx_conf['TLSCAFile'])
+    else:
+        context.load_default_certs(ssl.Purpose.SERVER_AUTH)
+    if zbx_conf.get('TLSCRLFile'):
+        context.verify_flags |= ssl.VERIFY_CRL_CHECK_LEAF
+        context.load_verify_locations(cafile=zbx_conf['TLSCRLFile'])
+    return context
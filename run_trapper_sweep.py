@@ -0,0 +1,10 @@
+#!/usr/bin/env python
+
+"""
+Launch cluster-wide Trapper-based stat gathering
+"""
+
+from es_stats_zabbix.cli.entrypoint import run
+
+if __name__ == '__main__':
+    run()
@@ -12,9 +12,9 @@ from elasticsearch.exceptions import ConnectionError
 from flask import Flask, request
 from flask_restful import Resource, Api
 
-from es_stats.classes import ClusterHealth, ClusterState, ClusterStats, NodeInfo, NodeStats
 from es_stats_zabbix.backend import RequestLogger, Discovery, Stat, run_backend
 from es_stats_zabbix.helpers.config import get_config
+from es_stats_zabbix.helpers.snapshot import SnapshotStore, statobjs
 from es_stats_zabbix.helpers.utils import open_port
 
 HOST, PORT = os.environ.get('TEST_ES_SERVER', 'localhost:9200').split(':')
@@ -119,13 +119,7 @@ class FlaskUnitTest(TestCase):
         self.args['flaskport'] = FLASKPORT
         self.args['endpoints'] = get_config(BASE_CONFIG, 'endpoints')
         c_t = 60
-        self.statobjs = {
-            'health': ClusterHealth(self.client, cache_timeout=c_t),
-            'clusterstate': ClusterState(self.client, cache_timeout=c_t),
-            'clusterstats': ClusterStats(self.client, cache_timeout=c_t),
-            'nodeinfo': NodeInfo(self.client, cache_timeout=c_t),
-            'nodestats': NodeStats(self.client, cache_timeout=c_t),
-        }
+        self.statobjs = statobjs(SnapshotStore(self.client, cache_timeout=c_t))
 
         app = Flask('INTEGRATION_TESTS')
         app.config['TESTING'] = True
@@ -3,6 +3,7 @@ import random
 import shutil
 import string
 import tempfile
+import threading
 from unittest import TestCase
 
 def random_directory():
@@ -40,4 +41,141 @@ class FileTestCase(TestCase):
 
     def write_config(self, fname, data):
         with open(fname, 'w') as f:
-            f.write(data)
\ No newline at end of file
+            f.write(data)
+
+NODEINFO = {
+    'cluster_name': 'unittest',
+    'nodes': {
+        'abc123': {
+            'name': 'node1',
+            'host': '10.0.0.1',
+            'settings': {'node': {'master': 'true', 'data': 'true', 'ingest': 'false',
+                                  'attr': {'ml': {'enabled': 'true'}}}},
+            'jvm': {'version': '1.8.0', 'using_compressed_ordinary_object_pointers': 'true'},
+        },
+        'def456': {
+            'name': 'node2',
+            'host': '10.0.0.2',
+            'settings': {'node': {'master': 'false', 'data': 'true', 'ingest': 'true',
+                                  'attr': {'ml': {'enabled': 'true'}}}},
+            'jvm': {'version': '1.8.0', 'using_compressed_ordinary_object_pointers': 'true'},
+        },
+    }
+}
+
+def nodestats_node(name, value):
+    """Return the nodestats for a single fake node"""
+    return {
+        'name': name,
+        'jvm': {'mem': {'heap_used_percent': value, 'heap_used_in_bytes': value * 1024}},
+        'indices': {
+            'docs': {'count': value * 10},
+            'search': {'query_total': value * 100, 'query_time_in_millis': value * 50},
+        },
+        'os': {'cpu': {'percent': 5}},
+    }
+
+def filter_path(data, paths):
+    """Apply an Elasticsearch style filter_path (with * wildcards) to data"""
+    def prune(value, parts):
+        if not parts:
+            return value
+        if not isinstance(value, dict):
+            return None
+        retval = {}
+        for key in value:
+            if parts[0] in ('*', key):
+                pruned = prune(value[key], parts[1:])
+                if pruned is not None:
+                    retval[key] = pruned
+        return retval if retval else None
+    retval = {}
+    for path in paths.split(','):
+        pruned = prune(data, path.split('.'))
+        if pruned:
+            merge(retval, pruned)
+    return retval
+
+def merge(target, source):
+    """Recursively merge dictionary source into target"""
+    for key in source:
+        if isinstance(source[key], dict) and isinstance(target.get(key), dict):
+            merge(target[key], source[key])
+        else:
+            target[key] = source[key]
+
+class Namespace(object):
+    """Attribute holder for the fake client's namespaces (cluster, nodes)"""
+
+class FakeClient(object):
+    """
+    Stand-in for an Elasticsearch client which counts every API call made
+    """
+    def __init__(self, value=1, missing=()):
+        self.calls = []
+        self.value = value
+        # Node ids left out of nodestats, as if they just left the cluster
+        self.missing = missing
+        self.cluster = Namespace()
+        self.cluster.health = self.api('health', self.health)
+        self.cluster.state = self.api('clusterstate', self.clusterstate)
+        self.cluster.stats = self.api('clusterstats', self.clusterstats)
+        self.nodes = Namespace()
+        self.nodes.info = self.api('nodeinfo', self.nodeinfo)
+        self.nodes.stats = self.api('nodestats', self.nodestats)
+
+    def api(self, name, method):
+        """Wrap method so calls to it are recorded"""
+        def wrapper(*args, **kwargs):
+            self.calls.append((name, kwargs))
+            if 'filter_path' in kwargs:
+                return filter_path(method(**kwargs), kwargs['filter_path'])
+            return method(**kwargs)
+        return wrapper
+
+    def count(self, name):
+        """Return the number of calls made to API name"""
+        return len([c for c in self.calls if c[0] == name])
+
+    def health(self, **kwargs):
+        return {'cluster_name': 'unittest', 'status': 'green', 'number_of_nodes': 2,
+                'timed_out': False}
+
+    def clusterstate(self, **kwargs):
+        return {'cluster_name': 'unittest', 'master_node': 'abc123'}
+
+    def clusterstats(self, **kwargs):
+        return {'cluster_name': 'unittest', '_nodes': {'total': 2, 'successful': 2, 'failed': 0},
+                'indices': {'count': 3}}
+
+    def nodeinfo(self, node_id=None, **kwargs):
+        if node_id == '_local':
+            return {'nodes': {'abc123': NODEINFO['nodes']['abc123']}}
+        return NODEINFO
+
+    def nodestats(self, **kwargs):
+        nodes = {
+            'abc123': nodestats_node('node1', self.value),
+            'def456': nodestats_node('node2', self.value * 2),
+        }
+        for nodeid in self.missing:
+            del nodes[nodeid]
+        return {'cluster_name': 'unittest', 'nodes': nodes}
+
+class FakeSender(object):
+    """
+    Stand-in for a ZabbixSender which records the data of every push, or
+    refuses the connection while `down`
+    """
+    server, port = '127.0.0.1', 10051
+    def __init__(self):
+        self.sent = []
+        self.down = False
+        # Set on every push, for tests of background threads
+        self.pushed = threading.Event()
+    def send_hosts(self, data, data_type='items'):
+        if self.down:
+            raise ConnectionRefusedError()
+        self.sent.append(data)
+        self.pushed.set()
+        return 1, 0, 1, 0, 1, 0.0
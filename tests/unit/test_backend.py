@@ -0,0 +1,242 @@
+"""Unit tests for the flask_restful Resource classes in es_stats_zabbix/backend"""
+import json
+from unittest import TestCase
+from flask import Flask
+from flask_restful import Api
+from es_stats_zabbix.backend import (
+    Batch, Bulk, ClusterDiscovery, Discovery, DisplayEndpoints, NodeDiscovery, RequestLogger,
+    Scheduler, Stat, TrapperDiscovery, TrapperStats, TrapperSweep
+)
+from es_stats_zabbix.backend.batch import batch
+from es_stats_zabbix.backend.bulk import bulk
+from es_stats_zabbix.backend.trapper import get_node_roles, shipall, sweep
+from es_stats_zabbix.helpers.plans import CollectionPlans
+from es_stats_zabbix.helpers.snapshot import SnapshotStore, pinned, statobjs
+from es_stats_zabbix.helpers.zabbix import ChangeFilter, LLDFilter
+from . import FakeClient, FakeSender
+
+class TestConstruction(TestCase):
+    """flask_restful constructs a new Resource per request, so construction must be cheap"""
+    def test_no_elasticsearch_calls(self):
+        """Constructing a Resource should never call Elasticsearch"""
+        client = FakeClient()
+        objs = statobjs(SnapshotStore(client))
+        before = len(client.calls)
+        Stat(objs['nodestats'])
+        DisplayEndpoints(objs)
+        Discovery(objs, {}, {})
+        ClusterDiscovery(objs)
+        NodeDiscovery(objs)
+        TrapperDiscovery(objs, {}, {}, {})
+        TrapperStats(objs, {}, {})
+        TrapperSweep(objs, {}, {})
+        Batch(objs)
+        RequestLogger()
+        self.assertEqual(before, len(client.calls))
+
+class TestStat(TestCase):
+    """Stat test class"""
+    def test_ratio(self):
+        """Derived endpoints with a slash in them are routed to Stat as one key"""
+        client = FakeClient()
+        ratio = 'ratio:indices.search.query_time_in_millis/indices.search.query_total'
+        store = SnapshotStore(client, endpoints={'nodestats': [ratio]})
+        app = Flask(__name__)
+        Api(app).add_resource(Stat, '/api/nodestats/<path:key>', endpoint='/nodestats/',
+                              resource_class_kwargs={'statobj': statobjs(store)['nodestats']})
+        store.snapshot('nodestats')
+        client.value = 3
+        store.refresh('nodestats')
+        response = app.test_client().post(
+            '/api/nodestats/' + ratio, data=json.dumps({'node': 'node2'}))
+        self.assertEqual(200, response.status_code)
+        self.assertEqual(0.5, response.get_json())
+
+class TestGetNodeRoles(TestCase):
+    """get_node_roles test class"""
+    def setUp(self):
+        self.statobjs = statobjs(SnapshotStore(FakeClient()))
+    def test_node(self):
+        """A node's roles are its nodetypes"""
+        node, roles = get_node_roles('node2', self.statobjs)
+        self.assertEqual('node2', node)
+        self.assertNotIn('master', roles)
+        self.assertIn('ingest', roles)
+
+class TestSweep(TestCase):
+    """sweep test class"""
+    def setUp(self):
+        self.statobjs = statobjs(SnapshotStore(FakeClient()))
+        self.plans = CollectionPlans({
+            'cluster': {'60s': {'health': ['status']}},
+            'master': {'60s': {'clusterstate': ['master_node']}},
+            'data': {
+                '60s': {'nodestats': ['indices.docs.count']},
+                '5m': {'nodeinfo': ['jvm.version']},
+            },
+        })
+    def test_all(self):
+        """The cluster host and every node, each with the stats for its nodetypes"""
+        self.assertEqual(
+            {
+                'unittest': {'es_stats[health,status,]': 0},
+                'node1': {'es_stats[clusterstate,master_node,]': 'node1',
+                          'es_stats[nodestats,indices.docs.count,]': 10},
+                'node2': {'es_stats[nodestats,indices.docs.count,]': 20},
+            },
+            sweep(self.statobjs, self.plans, '60s')
+        )
+    def test_departed_node(self):
+        """A node in nodeinfo but not in nodestats is skipped, not fatal to the sweep"""
+        objs = statobjs(SnapshotStore(FakeClient(missing=['def456'])))
+        data = sweep(pinned(objs), self.plans, '60s')
+        self.assertNotIn('node2', data)
+        self.assertEqual({'es_stats[clusterstate,master_node,]': 'node1',
+                          'es_stats[nodestats,indices.docs.count,]': 10}, data['node1'])
+    def test_nodetypes(self):
+        """Only the requested nodetypes, at the requested interval"""
+        self.assertEqual(
+            {'node1': {'es_stats[nodeinfo,jvm.version,]': '1.8.0'},
+             'node2': {'es_stats[nodeinfo,jvm.version,]': '1.8.0'}},
+            sweep(self.statobjs, self.plans, '5m', nodetypes=['data'])
+        )
+
+class TestShipall(TestCase):
+    """shipall test class"""
+    def test_changes_only(self):
+        """With a ChangeFilter, unchanged values are not sent, and unsent values are retried"""
+        sender = FakeSender()
+        changes = ChangeFilter()
+        data = {'node1': {'a': 1, 'b': 2}}
+        self.assertEqual((0, 200), shipall(sender, data, changes=changes))
+        self.assertEqual((0, 200), shipall(sender, data, changes=changes))
+        self.assertEqual([data], sender.sent)
+        sender.down = True
+        self.assertEqual(500, shipall(sender, {'node1': {'a': 2, 'b': 2}}, changes=changes)[1])
+        sender.down = False
+        shipall(sender, {'node1': {'a': 2, 'b': 2}}, changes=changes)
+        self.assertEqual({'node1': {'a': 2}}, sender.sent[-1])
+
+class TestTrapperDiscovery(TestCase):
+    """TrapperDiscovery test class"""
+    def test_unchanged_skipped(self):
+        """Unchanged LLD data is not sent again, and the counts are in the headers"""
+        sender = FakeSender()
+        app = Flask(__name__)
+        Api(app).add_resource(
+            TrapperDiscovery, '/api/trapperdiscovery/<zbxhost>', resource_class_kwargs={
+                'statobjs': statobjs(SnapshotStore(FakeClient())),
+                'zabbix': {},
+                'endpoints': {'data': {'60s': {'nodestats': ['indices.docs.count']}}},
+                'do_not_discover': {},
+                'sender': sender,
+                'lldfilter': LLDFilter()})
+        client = app.test_client()
+        for sent, skipped in ((1, 0), (1, 1)):
+            response = client.post('/api/trapperdiscovery/node1')
+            self.assertEqual(200, response.status_code)
+            self.assertEqual(b'0\n', response.data)
+            self.assertEqual(str(sent), response.headers['X-LLD-Sent'])
+            self.assertEqual(str(skipped), response.headers['X-LLD-Skipped'])
+        self.assertEqual(1, len(sender.sent))
+
+class TestScheduler(TestCase):
+    """Scheduler test class"""
+    def setUp(self):
+        self.sender = FakeSender()
+        plans = CollectionPlans({
+            'cluster': {'60s': {'health': ['status']}},
+            'data': {'5m': {'nodestats': ['indices.docs.count']}},
+        })
+        self.scheduler = Scheduler(
+            statobjs(SnapshotStore(FakeClient())), plans, self.sender, jitter=0)
+    def test_groups(self):
+        """One group per nodetype and interval"""
+        self.assertEqual(
+            [('cluster', '60s', 60), ('data', '5m', 300)], sorted(self.scheduler.groups))
+    def test_push(self):
+        """Groups are pushed through the trapper sweep"""
+        self.assertEqual(0, self.scheduler.push('cluster', '60s'))
+        self.assertEqual(0, self.scheduler.push('data', '5m'))
+        self.assertEqual(
+            [{'unittest': {'es_stats[health,status,]': 0}},
+             {'node1': {'es_stats[nodestats,indices.docs.count,]': 10},
+              'node2': {'es_stats[nodestats,indices.docs.count,]': 20}}],
+            self.sender.sent)
+    def test_start_stop(self):
+        """Once started, groups are pushed until the thread is stopped"""
+        self.scheduler.start()
+        self.assertTrue(self.sender.pushed.wait(5))
+        self.scheduler.stop()
+        self.scheduler.join(5)
+        self.assertFalse(self.scheduler.is_alive())
+
+class TestBulk(TestCase):
+    """bulk test class"""
+    def setUp(self):
+        self.statobjs = statobjs(SnapshotStore(FakeClient()))
+        self.plans = CollectionPlans({
+            'cluster': {'60s': {'health': ['status', 'timed_out']}},
+            'master': {'60s': {'clusterstate': ['master_node']}},
+            'data': {'60s': {'nodestats': ['indices.docs.count', 'jvm.mem.heap_used_percent']}},
+        })
+    def test_node(self):
+        """Every nodetype of the node, keyed by api:endpoint"""
+        self.assertEqual(
+            {'clusterstate:master_node': 'node1', 'nodestats:indices.docs.count': 10,
+             'nodestats:jvm.mem.heap_used_percent': 1},
+            bulk(self.statobjs, self.plans, 'node1', '60s')
+        )
+        self.assertEqual(
+            {'nodestats:indices.docs.count': 20, 'nodestats:jvm.mem.heap_used_percent': 2},
+            bulk(self.statobjs, self.plans, 'node2', '60s')
+        )
+    def test_cluster(self):
+        """The cluster name gets the cluster stats, normalized for Zabbix"""
+        self.assertEqual(
+            {'health:status': 0, 'health:timed_out': 0},
+            bulk(self.statobjs, self.plans, 'unittest', '60s')
+        )
+    def test_nodetype(self):
+        """Limited to one nodetype"""
+        self.assertEqual(
+            {'clusterstate:master_node': 'node1'},
+            bulk(self.statobjs, self.plans, 'node1', '60s', nodetypes=['master'])
+        )
+    def test_resource(self):
+        """An empty interval means 60s, and an unknown node is not found"""
+        app = Flask(__name__)
+        Api(app).add_resource(Bulk, '/api/bulk/<node>', resource_class_kwargs={
+            'statobjs': self.statobjs, 'plans': self.plans, 'endpoints': {}})
+        client = app.test_client()
+        response = client.post('/api/bulk/node2', data=json.dumps({'interval': ''}))
+        self.assertEqual(200, response.status_code)
+        self.assertEqual(20, response.get_json()['nodestats:indices.docs.count'])
+        response = client.post('/api/bulk/nope', data=json.dumps({'interval': '60s'}))
+        self.assertEqual(404, response.status_code)
+        self.assertIn('nope', response.get_json()['message'])
+
+class TestBatch(TestCase):
+    """batch test class"""
+    def test_batch(self):
+        """Values in request order, with markers for those which can't be read"""
+        objs = statobjs(SnapshotStore(FakeClient()))
+        self.assertEqual(
+            [0, 2, {'percent': 5}, 'node1', 'ZBX_NOTFOUND', 'ZBX_NOTSUPPORTED', 'ZBX_NOTSUPPORTED'],
+            batch(objs, [
+                ['health', 'status'],
+                ['nodestats', 'jvm.mem.heap_used_percent', 'node2'],
+                {'api': 'nodestats', 'key': 'os.cpu'},
+                ['clusterstate', 'master_node', ''],
+                ['health', 'nope'],
+                ['nope', 'status'],
+                ['nodestats', 'name', 'node9'],
+            ])
+        )
+    def test_malformed(self):
+        """Malformed entries are not supported, in their place, without failing the batch"""
+        objs = statobjs(SnapshotStore(FakeClient()))
+        self.assertEqual(
+            ['ZBX_NOTSUPPORTED', 'ZBX_NOTSUPPORTED', 'ZBX_NOTSUPPORTED', 0, 'ZBX_NOTSUPPORTED'],
+            batch(objs, [['health'], 'health', None, ['health', 'status'], [['health'], 'x']])
+        )
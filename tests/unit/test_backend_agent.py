@@ -0,0 +1,76 @@
+"""Unit tests for es_stats_zabbix/backend/agent.py"""
+import json
+import socket
+import struct
+from unittest import TestCase
+from es_stats_zabbix.backend.agent import AgentListener, parse_key
+from es_stats_zabbix.helpers.plans import CollectionPlans
+from es_stats_zabbix.helpers.snapshot import SnapshotStore, statobjs
+from . import FakeClient
+
+def check(address, key, framed=True):
+    """Make a passive check of key, as the Zabbix server would.  Return the answer."""
+    sock = socket.create_connection(address)
+    payload = key.encode('utf-8', 'surrogateescape')
+    if framed:
+        sock.sendall(b'ZBXD\x01' + struct.pack('<Q', len(payload)) + payload)
+    else:
+        sock.sendall(payload + b'\n')
+    data = b''
+    while True:
+        chunk = sock.recv(4096)
+        if not chunk:
+            break
+        data += chunk
+    sock.close()
+    length = struct.unpack('<Q', data[5:13])[0]
+    return data[13:13 + length].decode('utf-8')
+
+class TestParseKey(TestCase):
+    """parse_key test class"""
+    def test_parse(self):
+        """Plain, quoted and empty parameters"""
+        self.assertEqual(('agent.ping', []), parse_key('agent.ping'))
+        self.assertEqual(
+            ('es_stat', ['nodestats', 'jvm.mem.heap_used_percent', '']),
+            parse_key('es_stat[nodestats,"jvm.mem.heap_used_percent",]'))
+        self.assertEqual(('es_stat', ['health', 'a,b']), parse_key('es_stat[health,"a,b"]'))
+
+class TestAgentListener(TestCase):
+    """AgentListener test class"""
+    def setUp(self):
+        plans = CollectionPlans({'data': {'60s': {'nodestats': ['indices.docs.count']}}})
+        self.agent = AgentListener(
+            ('127.0.0.1', 0), statobjs(SnapshotStore(FakeClient())), plans=plans)
+        self.agent.start()
+        self.address = self.agent.server_address
+    def tearDown(self):
+        self.agent.stop()
+    def test_stat(self):
+        """Values are answered from the snapshots"""
+        self.assertEqual('0', check(self.address, 'es_stat[health,status]'))
+        self.assertEqual(
+            '2', check(self.address, 'es_stat[nodestats,jvm.mem.heap_used_percent,node2]'))
+        self.assertEqual('1', check(self.address, 'agent.ping', framed=False))
+    def test_bulk(self):
+        """es_bulk answers with the bulk JSON object"""
+        self.assertEqual(
+            {'nodestats:indices.docs.count': 20},
+            json.loads(check(self.address, 'es_bulk[node2,,60s]')))
+    def test_not_supported(self):
+        """Unknown keys, APIs and endpoints are not supported"""
+        for key in ['system.uptime', 'es_stat[nope,status]', 'es_stat[health,nope]']:
+            self.assertTrue(check(self.address, key).startswith('ZBX_NOTSUPPORTED\0'))
+    def test_malformed(self):
+        """Truncated headers are closed unanswered, undecodable requests are not supported"""
+        sock = socket.create_connection(self.address)
+        sock.sendall(b'ZBXD\x01\x05')
+        sock.shutdown(socket.SHUT_WR)
+        self.assertEqual(b'', sock.recv(4096))
+        sock.close()
+        self.assertTrue(check(self.address, '\udcff', framed=False).startswith(
+            'ZBX_NOTSUPPORTED\0'))
+    def test_allowed(self):
+        """Connections from addresses not allowed are closed unanswered"""
+        self.agent.allowed = set(['10.0.0.1'])
+        self.assertRaises(struct.error, check, self.address, 'agent.ping')
@@ -0,0 +1,70 @@
+"""Unit tests for es_stats_zabbix/backend/metrics.py"""
+from unittest import TestCase
+from flask import Flask
+from flask_restful import Api
+from es_stats_zabbix.backend.metrics import CONTENT_TYPE, Metrics, MetricsCache, families
+from es_stats_zabbix.helpers.plans import CollectionPlans
+from es_stats_zabbix.helpers.snapshot import SnapshotStore, pinned, statobjs
+from . import FakeClient
+
+class TestMetrics(TestCase):
+    """Metrics test class"""
+    def setUp(self):
+        self.store = SnapshotStore(FakeClient())
+        self.statobjs = statobjs(self.store)
+        self.plans = CollectionPlans({
+            'cluster': {'60s': {'health': ['status', 'cluster_name']}},
+            'data': {
+                '60s': {'nodestats': ['indices.docs.count']},
+                '5m': {'nodeinfo': ['jvm.version'], 'nodestats': ['indices.docs.count']},
+            },
+        })
+    def test_families(self):
+        """One family per numeric endpoint, with a sample per node it is configured for"""
+        self.assertEqual(
+            ['# TYPE es_stats_health_status gauge\n'
+             'es_stats_health_status{cluster="unittest"} 0\n',
+             '# TYPE es_stats_nodestats_indices_docs_count gauge\n'
+             'es_stats_nodestats_indices_docs_count{cluster="unittest",node="node1"} 10\n'
+             'es_stats_nodestats_indices_docs_count{cluster="unittest",node="node2"} 20\n'],
+            list(families(self.statobjs, self.plans)))
+    def test_missing_node(self):
+        """The samples of a node missing from a Snapshot are left out, not fatal"""
+        objs = statobjs(SnapshotStore(FakeClient(missing=['def456'])))
+        self.assertEqual(
+            ['# TYPE es_stats_health_status gauge\n'
+             'es_stats_health_status{cluster="unittest"} 0\n',
+             '# TYPE es_stats_nodestats_indices_docs_count gauge\n'
+             'es_stats_nodestats_indices_docs_count{cluster="unittest",node="node1"} 10\n'],
+            list(families(objs, self.plans)))
+    def test_partial_not_cached(self):
+        """A rendering which is abandoned or fails part way is not cached"""
+        cache = MetricsCache()
+        stream = cache.stream(pinned(self.statobjs), self.plans)
+        next(stream)
+        stream.close()
+        self.assertIsNone(cache.key)
+        objs = pinned(self.statobjs)
+        objs['nodestats'].get = None
+        with self.assertRaises(TypeError):
+            b''.join(cache.stream(objs, self.plans))
+        self.assertIsNone(cache.key)
+    def test_cached_per_generation(self):
+        """Metrics are rendered again only once a Snapshot is refreshed"""
+        cache = MetricsCache()
+        first = b''.join(cache.stream(pinned(self.statobjs), self.plans))
+        chunks = cache.chunks
+        self.assertEqual(first, b''.join(cache.stream(pinned(self.statobjs), self.plans)))
+        self.assertIs(chunks, cache.chunks)
+        self.store.refresh('nodestats')
+        self.assertEqual(first, b''.join(cache.stream(pinned(self.statobjs), self.plans)))
+        self.assertIsNot(chunks, cache.chunks)
+    def test_resource(self):
+        """The /metrics resource answers in the Prometheus text format"""
+        app = Flask(__name__)
+        Api(app).add_resource(Metrics, '/metrics', resource_class_kwargs={
+            'statobjs': self.statobjs, 'plans': self.plans, 'endpoints': {}})
+        response = app.test_client().get('/metrics')
+        self.assertEqual(200, response.status_code)
+        self.assertEqual(CONTENT_TYPE, response.headers['Content-Type'])
+        self.assertIn(b'es_stats_health_status{cluster="unittest"} 0\n', response.data)
@@ -0,0 +1,62 @@
+"""Unit tests for es_stats_zabbix/backend/server.py"""
+import http.client
+import threading
+from unittest import TestCase
+from flask import Flask, request
+from es_stats_zabbix.backend.server import PooledWSGIServer
+
+def app(started=None, release=None):
+    """A Flask app which answers with the client port, after release is set"""
+    flask_app = Flask(__name__)
+    @flask_app.route('/')
+    def index():
+        if release:
+            started.set()
+            release.wait(5)
+        return str(request.environ['REMOTE_PORT'])
+    return flask_app
+
+class TestPooledWSGIServer(TestCase):
+    """PooledWSGIServer test class"""
+    def serve(self, flask_app, **kwargs):
+        server = PooledWSGIServer('127.0.0.1', 0, flask_app, **kwargs)
+        server.start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        return server
+    def test_keepalive(self):
+        """Requests on one connection are served on that connection"""
+        server = self.serve(app())
+        conn = http.client.HTTPConnection('127.0.0.1', server.port, timeout=5)
+        conn.request('GET', '/')
+        first = conn.getresponse().read()
+        conn.request('GET', '/')
+        self.assertEqual(first, conn.getresponse().read())
+        conn.close()
+    def test_no_keepalive(self):
+        """With keepalive 0, the server closes the connection after each request"""
+        server = self.serve(app(), keepalive=0)
+        conn = http.client.HTTPConnection('127.0.0.1', server.port, timeout=5)
+        conn.request('GET', '/')
+        response = conn.getresponse()
+        response.read()
+        self.assertTrue(response.will_close)
+        conn.close()
+    def test_close_waits(self):
+        """server_close returns only once the request in progress is answered"""
+        started, release = threading.Event(), threading.Event()
+        server = PooledWSGIServer('127.0.0.1', 0, app(started, release), threads=2, keepalive=0)
+        server.start()
+        answers = []
+        def client():
+            conn = http.client.HTTPConnection('127.0.0.1', server.port, timeout=5)
+            conn.request('GET', '/')
+            answers.append(conn.getresponse().status)
+        thread = threading.Thread(target=client)
+        thread.start()
+        started.wait(5)
+        server.shutdown()
+        threading.Timer(0.2, release.set).start()
+        server.server_close()
+        thread.join(5)
+        self.assertEqual([200], answers)
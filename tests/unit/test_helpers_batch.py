@@ -0,0 +1,97 @@
+"""Unit tests for es_stats_zabbix/helpers/batch.py"""
+from unittest import TestCase
+from es_stats_zabbix.helpers.batch import (
+    LLDCache, get_endpoints, lldoutput, macrogen, typecaster, valuetypes)
+from es_stats_zabbix.helpers.snapshot import SnapshotStore, statobjs
+from . import FakeClient
+
+class TestTypecaster(TestCase):
+    """typecaster test class"""
+    def test_types(self):
+        """Values are cast as Zabbix would see them"""
+        self.assertIs(bool, typecaster('false'))
+        self.assertIs(float, typecaster(-1))
+        self.assertIs(float, typecaster(1.5))
+        self.assertIs(int, typecaster(15))
+        self.assertIs(str, typecaster('green'))
+
+class TestGetEndpoints(TestCase):
+    """get_endpoints test class"""
+    def setUp(self):
+        self.statobjs = statobjs(SnapshotStore(FakeClient()))
+    def test_all(self):
+        """All discoverable endpoints, less the skipped ones"""
+        self.assertEqual(
+            {'nodestats': [
+                'name', 'jvm.mem.heap_used_percent', 'jvm.mem.heap_used_in_bytes',
+                'indices.docs.count', 'indices.search.query_total',
+                'indices.search.query_time_in_millis'
+            ]},
+            get_endpoints(self.statobjs, 'nodestats', node='node2')
+        )
+    def test_valuetype(self):
+        """Endpoints are filtered by type and by name suffix"""
+        self.assertEqual(
+            {'nodestats': ['indices.search.query_time_in_millis']},
+            get_endpoints(self.statobjs, 'nodestats', valuetype='millis')
+        )
+        self.assertEqual(
+            {'nodestats': ['indices.docs.count', 'indices.search.query_total']},
+            get_endpoints(self.statobjs, 'nodestats', valuetype='unsigned')
+        )
+        self.assertEqual({}, get_endpoints(self.statobjs, 'nodestats', valuetype='float'))
+
+class TestValuetypes(TestCase):
+    """valuetypes test class"""
+    def test_suffixes(self):
+        """Integer endpoints are classified by their name's suffix"""
+        self.assertEqual(['bytes'], valuetypes('mem.used_in_bytes', 1, int))
+        self.assertEqual(['unsigned'], valuetypes('docs.count', 1, int))
+    def test_empty(self):
+        """Empty values match every type whose suffix rule they pass"""
+        self.assertEqual(
+            ['bool', 'unsigned', 'character', 'float'], valuetypes('some.value', '', str))
+
+class TestMacrogen(TestCase):
+    """macrogen test class"""
+    def setUp(self):
+        self.statobjs = statobjs(SnapshotStore(FakeClient()))
+    def test_node(self):
+        """Nodes only discover node-level APIs, less do_not_discover"""
+        llddata = lldoutput(macrogen(
+            self.statobjs, {'nodeinfo': ['name']}, node='node1',
+            included=['name', 'status', 'jvm.mem.heap_used_percent']))
+        self.assertEqual(
+            {
+                'character_lld': [{'{#TYPECHARACTER}': 'name', '{#API}': 'nodestats'}],
+                'percent_lld': [
+                    {'{#TYPEPERCENT}': 'jvm.mem.heap_used_percent', '{#API}': 'nodestats'}],
+            },
+            llddata
+        )
+    def test_cluster(self):
+        """The cluster host discovers cluster-level APIs"""
+        llddata = lldoutput(macrogen(self.statobjs, {}, node='unittest', included=['status']))
+        self.assertEqual(
+            [{'{#TYPECHARACTER}': 'status', '{#API}': 'health'}], llddata['character_lld'])
+
+class TestLLDCache(TestCase):
+    """LLDCache test class"""
+    def setUp(self):
+        self.store = SnapshotStore(FakeClient())
+        self.statobjs = statobjs(self.store)
+    def test_memoized(self):
+        """Results are reused until a snapshot changes"""
+        cache = LLDCache()
+        first = cache.lldoutput(self.statobjs, {}, node='node1')
+        self.assertIs(first, cache.lldoutput(self.statobjs, {}, node='node1'))
+        self.assertIsNot(first, cache.lldoutput(self.statobjs, {}, node='node1', included=[]))
+        self.store.refresh('nodestats')
+        self.assertIsNot(first, cache.lldoutput(self.statobjs, {}, node='node1'))
+    def test_bounded(self):
+        """The least recently used results are evicted"""
+        cache = LLDCache(maxsize=2)
+        for node in ['node1', 'node2', 'unittest']:
+            cache.lldoutput(self.statobjs, {}, node=node)
+        self.assertEqual(
+            ['node2', 'unittest'], [key[0] for key in cache.results])
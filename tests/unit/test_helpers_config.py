@@ -0,0 +1,37 @@
+"""Unit tests for es_stats_zabbix/helpers/config.py"""
+from unittest import TestCase
+from es_stats_zabbix.exceptions import ConfigurationError
+from es_stats_zabbix.helpers.config import cache_timeouts, get_config, interval_seconds
+
+class TestCacheTimeouts(TestCase):
+    """cache_timeouts test class"""
+    def test_single_value(self):
+        """A single value applies to every API"""
+        self.assertEqual(
+            {'health': 30, 'clusterstate': 30, 'clusterstats': 30, 'nodeinfo': 30, 'nodestats': 30},
+            cache_timeouts(30)
+        )
+    def test_per_api(self):
+        """Per-API values override the default"""
+        ttls = cache_timeouts({'health': 10, 'nodeinfo': 600})
+        self.assertEqual(10, ttls['health'])
+        self.assertEqual(600, ttls['nodeinfo'])
+        self.assertEqual(60, ttls['nodestats'])
+    def test_schema(self):
+        """The backend schema accepts a dictionary of per-API values"""
+        cfg = {'backend': {'cache_timeout': {'default': 30, 'nodeinfo': 600}}}
+        self.assertEqual(
+            {'default': 30, 'nodeinfo': 600}, get_config(cfg, 'backend')['cache_timeout'])
+
+class TestIntervalSeconds(TestCase):
+    """interval_seconds test class"""
+    def test_units(self):
+        """Intervals in seconds, minutes and hours"""
+        self.assertEqual(30, interval_seconds(30))
+        self.assertEqual(60, interval_seconds('60s'))
+        self.assertEqual(300, interval_seconds('5m'))
+        self.assertEqual(3600, interval_seconds('1H'))
+    def test_invalid(self):
+        """Nonsense and non-positive intervals are configuration errors"""
+        self.assertRaises(ConfigurationError, interval_seconds, 'often')
+        self.assertRaises(ConfigurationError, interval_seconds, '0s')
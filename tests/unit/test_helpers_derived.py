@@ -0,0 +1,80 @@
+"""Unit tests for es_stats_zabbix/helpers/derived.py"""
+from unittest import TestCase
+from dotmap import DotMap
+from es_stats_zabbix.helpers.derived import derive, parse, sources
+from es_stats_zabbix.helpers.snapshot import SnapshotStore, fetch_params, flatten, statobjs
+from . import FakeClient
+
+RATIO = 'ratio:indices.search.query_time_in_millis/indices.search.query_total'
+
+class TestParse(TestCase):
+    """parse and sources test class"""
+    def test_parse(self):
+        """Derived endpoints are parsed into their kind and sources, anything else is None"""
+        self.assertEqual(('rate', ('a.b',)), parse('rate:a.b'))
+        self.assertEqual(('ratio', ('a', 'b')), parse('ratio:a/b'))
+        self.assertIsNone(parse('ratio:a'))
+        self.assertIsNone(parse('indices.docs.count'))
+    def test_sources(self):
+        """Derived endpoints are replaced by their sources, once each"""
+        self.assertEqual(['a', 'b', 'c'], sources(['rate:a', 'ratio:a/b', 'c']))
+    def test_fetch_params(self):
+        """Pruned fetches include the sources, and the timestamps of the nodes"""
+        self.assertEqual(
+            {'filter_path': 'nodes.*.indices.search.query_time_in_millis,'
+                            'nodes.*.indices.search.query_total,nodes.*.name,nodes.*.timestamp',
+             'metric': 'indices'},
+            fetch_params('nodestats', ['rate:indices.search.query_total', RATIO]))
+
+class TestDerive(TestCase):
+    """derive test class"""
+    def test_derive(self):
+        """Rates per second, ratios of changes, and nothing for counters which went backwards"""
+        previous = flatten({'timestamp': 1000, 'a': 10, 'b': 4, 'c': 50})
+        current = flatten({'timestamp': 3000, 'a': 30, 'b': 14, 'c': 0})
+        derive(['rate:a', 'ratio:a/b', 'rate:c', 'rate:missing'], previous, current, 2)
+        self.assertEqual(10.0, current.values['rate:a'])
+        self.assertEqual(2.0, current.values['ratio:a/b'])
+        self.assertNotIn('rate:c', current.values)
+        self.assertEqual(['rate:a', 'ratio:a/b'], current.endpoints[-2:])
+
+class TestStore(TestCase):
+    """Derived endpoints in the SnapshotStore test class"""
+    def test_configured(self):
+        """Configured derived endpoints are computed for every node from the second Snapshot"""
+        client = FakeClient()
+        store = SnapshotStore(client, endpoints={'nodestats': [RATIO]})
+        objs = statobjs(store)
+        self.assertEqual(DotMap(), objs['nodestats'].get(RATIO, name='node1'))
+        client.value = 3
+        store.refresh('nodestats')
+        self.assertEqual(0.5, objs['nodestats'].get(RATIO, name='node1'))
+        self.assertEqual(0.5, objs['nodestats'].get(RATIO, name='node2'))
+    def test_requested(self):
+        """Derived endpoints which are requested are computed from the next refresh on"""
+        client = FakeClient()
+        store = SnapshotStore(client, endpoints={'nodestats': ['indices.docs.count']})
+        objs = statobjs(store)
+        self.assertEqual(DotMap(), objs['nodestats'].get('rate:indices.docs.count'))
+        store.refresh('nodestats')
+        client.value = 2
+        store.refresh('nodestats')
+        self.assertGreater(objs['nodestats'].get('rate:indices.docs.count'), 0)
+    def test_unknown_sources(self):
+        """Derived endpoints of endpoints which do not exist are not registered"""
+        store = SnapshotStore(FakeClient(), endpoints={'nodestats': ['indices.docs.count']})
+        objs = statobjs(store)
+        params = store.params['nodestats']
+        for key in ['rate:no.such.key', 'ratio:indices.docs.count/nope', 'avg5m:rate:nope']:
+            self.assertEqual(DotMap(), objs['nodestats'].get(key))
+        self.assertEqual([], store.derived['nodestats'])
+        self.assertEqual(params, store.params['nodestats'])
+    def test_limit(self):
+        """At most max_derived endpoints are registered on request"""
+        store = SnapshotStore(FakeClient(), max_derived=2)
+        objs = statobjs(store)
+        for key in ['rate:indices.docs.count', 'rate:jvm.mem.heap_used_percent', 'rate:name']:
+            objs['nodestats'].get(key)
+        self.assertEqual(
+            ['rate:indices.docs.count', 'rate:jvm.mem.heap_used_percent'],
+            store.derived['nodestats'])
@@ -0,0 +1,87 @@
+"""Unit tests for es_stats_zabbix/helpers/history.py"""
+from unittest import TestCase
+from dotmap import DotMap
+from es_stats_zabbix.helpers.history import History, Ring, parse, sources
+from es_stats_zabbix.helpers.snapshot import SnapshotStore, flatten, statobjs
+from . import FakeClient
+
+class TestParse(TestCase):
+    """parse and sources test class"""
+    def test_parse(self):
+        """Windowed endpoints are parsed into their aggregate, window and source"""
+        self.assertEqual(('avg', 300, 'jvm.mem.heap_used_percent'),
+                         parse('avg5m:jvm.mem.heap_used_percent'))
+        self.assertEqual(('max', 30, 'rate:a'), parse('max30s:rate:a'))
+        self.assertIsNone(parse('avg:a'))
+        self.assertIsNone(parse('avg0m:a'))
+        self.assertIsNone(parse('a.b'))
+    def test_sources(self):
+        """Windowed endpoints are replaced by their sources, once each"""
+        self.assertEqual(['a', 'b'], sources(['avg1m:a', 'max5m:a', 'b']))
+
+class TestRing(TestCase):
+    """Ring test class"""
+    def test_wrap(self):
+        """Only the newest samples are kept, and read newest first"""
+        ring = Ring(3)
+        for i in range(5):
+            ring.append(float(i), i * 10.0)
+        self.assertEqual([40.0, 30.0, 20.0], ring.since(0))
+        self.assertEqual([40.0, 30.0], ring.since(3))
+        self.assertEqual([40.0, 30.0], ring.resized(2).since(0))
+        self.assertEqual([40.0, 30.0, 20.0], ring.resized(5).since(0))
+
+class TestHistory(TestCase):
+    """History test class"""
+    def test_feed(self):
+        """Aggregates over the window are added to the index"""
+        history = History()
+        for when, value in ((0, 10), (60, 20), (120, 60)):
+            index = flatten({'a': value})
+            history.feed('health', ['avg1m:a', 'min2m:a', 'max1m:a'], index, when, 60)
+        self.assertEqual(40.0, index.values['avg1m:a'])
+        self.assertEqual(10.0, index.values['min2m:a'])
+        self.assertEqual(60.0, index.values['max1m:a'])
+    def test_budget(self):
+        """No Ring is created beyond the budget, and the Rings of departed nodes are dropped"""
+        history = History(budget=6)
+        flat = {'n1': flatten({'a': 1}), 'n2': flatten({'a': 1}), 'n3': flatten({'a': 1})}
+        history.feed('nodestats', ['avg2m:a'], flat, 0, 60)
+        self.assertEqual(6, history.used)
+        self.assertNotIn('avg2m:a', flat['n3'].values)
+        flat = {'n3': flatten({'a': 1})}
+        history.feed('nodestats', ['avg2m:a'], flat, 60, 60)
+        self.assertEqual(3, history.used)
+        self.assertEqual(1.0, flat['n3'].values['avg2m:a'])
+
+class TestStore(TestCase):
+    """Windowed endpoints in the SnapshotStore test class"""
+    def test_windowed(self):
+        """Windowed endpoints are computed for every node as Snapshots are published"""
+        client = FakeClient()
+        store = SnapshotStore(client, endpoints={'nodestats': ['avg5m:jvm.mem.heap_used_percent']})
+        objs = statobjs(store)
+        self.assertEqual(1, objs['nodestats'].get('avg5m:jvm.mem.heap_used_percent', 'node1'))
+        client.value = 3
+        store.refresh('nodestats')
+        self.assertEqual(2, objs['nodestats'].get('avg5m:jvm.mem.heap_used_percent', 'node1'))
+        self.assertEqual(4, objs['nodestats'].get('avg5m:jvm.mem.heap_used_percent', 'node2'))
+    def test_windowed_rate(self):
+        """Windowed endpoints of derived endpoints"""
+        client = FakeClient()
+        ratio = 'ratio:indices.search.query_time_in_millis/indices.search.query_total'
+        store = SnapshotStore(client, endpoints={'nodestats': ['max5m:' + ratio]})
+        objs = statobjs(store)
+        store.snapshot('nodestats')
+        client.value = 3
+        store.refresh('nodestats')
+        self.assertEqual(0.5, objs['nodestats'].get('max5m:' + ratio, 'node1'))
+    def test_requested(self):
+        """Windowed endpoints which are requested are computed from the next refresh on"""
+        client = FakeClient()
+        store = SnapshotStore(client, endpoints={'nodestats': ['indices.docs.count']})
+        objs = statobjs(store)
+        self.assertEqual(DotMap(), objs['nodestats'].get('max5m:indices.docs.count', 'node2'))
+        client.value = 3
+        store.refresh('nodestats')
+        self.assertEqual(60, objs['nodestats'].get('max5m:indices.docs.count', 'node2'))
@@ -0,0 +1,56 @@
+"""Unit tests for es_stats_zabbix/helpers/plans.py"""
+from unittest import TestCase
+from es_stats_zabbix.helpers.plans import CollectionPlans
+
+ENDPOINTS = {
+    'cluster': {'60s': {'health': ['status', 'number_of_nodes']}},
+    'master': {
+        '60s': {
+            'nodestats': ['jvm.mem.heap_used_percent'],
+            'clusterstats': ['indices.count'],
+        },
+        '5m': {'nodeinfo': ['jvm.version']},
+    },
+    'data': {'60s': {'nodestats': ['indices.docs.count']}},
+}
+
+class TestCollectionPlans(TestCase):
+    """CollectionPlans test class"""
+    def setUp(self):
+        self.plans = CollectionPlans(ENDPOINTS)
+    def test_plan(self):
+        """Plans are flat (api, endpoint, key) tuples, in APIS order"""
+        self.assertEqual(
+            (
+                ('clusterstats', 'indices.count', 'es_stats[clusterstats,indices.count,]'),
+                ('nodestats', 'jvm.mem.heap_used_percent',
+                 'es_stats[nodestats,jvm.mem.heap_used_percent,]'),
+            ),
+            self.plans.plan(('master', 'data'), 'master', '60s')
+        )
+    def test_roles(self):
+        """A nodetype which is not among the node's roles gets an empty plan"""
+        self.assertEqual((), self.plans.plan(('data',), 'master', '60s'))
+        self.assertEqual((), self.plans.plan(('cluster',), 'data', '60s'))
+    def test_missing(self):
+        """Unknown nodetypes and intervals get an empty plan"""
+        self.assertEqual((), self.plans.plan(('ingest',), 'ingest', '60s'))
+        self.assertEqual((), self.plans.plan(('data',), 'data', '5m'))
+        self.assertEqual((), self.plans.plan(('data',), None, '60s'))
+    def test_memoized(self):
+        """The same plan object is returned every time"""
+        plan = self.plans.plan(('cluster',), 'cluster', '60s')
+        self.assertIs(plan, self.plans.plan(('cluster',), 'cluster', '60s'))
+    def test_memo_bounded(self):
+        """Plans for nodetypes and intervals which are not configured are not memoized"""
+        for interval in ['1s', '2s', '3s']:
+            self.plans.plan(('data',), 'data', interval)
+            self.plans.plan(('nope',), 'nope', interval)
+        self.assertEqual({}, self.plans.memo)
+    def test_endpoints(self):
+        """Every endpoint, of every interval, of the node's roles"""
+        self.assertEqual(
+            ['indices.count', 'jvm.mem.heap_used_percent', 'jvm.version'],
+            sorted(self.plans.endpoints(('master',)))
+        )
+        self.assertEqual(('status', 'number_of_nodes'), self.plans.endpoints(('cluster',)))
@@ -0,0 +1,221 @@
+"""Unit tests for es_stats_zabbix/helpers/snapshot.py"""
+import os
+import threading
+import time
+from unittest import TestCase
+from urllib.parse import quote
+import yaml
+from dotmap import DotMap
+from es_stats_zabbix.backend.refresher import Refresher
+from es_stats_zabbix.helpers.config import api_endpoints
+from es_stats_zabbix.helpers.snapshot import (
+    SnapshotStore, fetch_params, flatten, pinned, prefetch, statobjs)
+from . import FakeClient
+
+class TestSnapshotStore(TestCase):
+    """SnapshotStore test class"""
+    def test_read_fetches_once(self):
+        """Only the first read of an API should call Elasticsearch"""
+        client = FakeClient()
+        store = SnapshotStore(client)
+        store.read('nodestats')
+        store.read('nodestats')
+        self.assertEqual(1, client.count('nodestats'))
+        self.assertEqual(0, client.count('clusterstate'))
+    def test_publish_replaces(self):
+        """A refresh publishes a new Snapshot with a higher generation"""
+        store = SnapshotStore(FakeClient())
+        first = store.snapshot('health')
+        second = store.refresh('health')
+        self.assertGreater(second.generation, first.generation)
+        self.assertIs(second, store.snapshot('health'))
+    def test_concurrent_refresh_coalesced(self):
+        """Concurrent refreshes of one API should make a single Elasticsearch call"""
+        client = FakeClient()
+        store = SnapshotStore(client)
+        slow = store.calls['nodestats']
+        def slow_call(**kwargs):
+            time.sleep(0.2)
+            return slow(**kwargs)
+        store.calls['nodestats'] = slow_call
+        results = []
+        threads = [
+            threading.Thread(target=lambda: results.append(store.snapshot('nodestats')))
+            for _ in range(10)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(1, client.count('nodestats'))
+        self.assertEqual(1, len(set(id(result) for result in results)))
+    def test_refresh_all_concurrent(self):
+        """refresh_all waits for the slowest API, not the sum of them, and returns errors"""
+        store = SnapshotStore(FakeClient())
+        for api in ('health', 'clusterstats', 'nodestats'):
+            call = store.calls[api]
+            store.calls[api] = lambda call=call, **kwargs: time.sleep(0.2) or call(**kwargs)
+        def broken(**kwargs):
+            raise Exception('unavailable')
+        store.calls['clusterstate'] = broken
+        start = time.time()
+        results = store.refresh_all(['health', 'clusterstate', 'clusterstats', 'nodestats'])
+        self.assertLess(time.time() - start, 0.5)
+        self.assertIs(results['nodestats'], store.snapshot('nodestats'))
+        self.assertIsInstance(results['clusterstate'], Exception)
+    def test_prefetch(self):
+        """prefetch fetches only the Snapshots reading would have to"""
+        client = FakeClient()
+        store = SnapshotStore(client, endpoints={'nodestats': ['jvm.mem.heap_used_percent']})
+        store.read('health')
+        prefetch(statobjs(store, full=True))
+        self.assertEqual(1, client.count('health'))
+        self.assertEqual(1, len([c for c in client.calls if c == ('nodestats', {})]))
+        prefetch(statobjs(store, full=True))
+        self.assertEqual(1, len([c for c in client.calls if c == ('nodestats', {})]))
+
+class TestFlatten(TestCase):
+    """flatten test class"""
+    def test_flatten(self):
+        """Every leaf is indexed, but only discoverable ones are endpoints"""
+        index = flatten({
+            'a': {'b': 1, 'c': 'true', 'd': ''},
+            'os': {'cpu': 5},
+            'e': [1, 2],
+            'f': {},
+        })
+        self.assertEqual(['a.b', 'a.c', 'a.d'], index.endpoints)
+        self.assertEqual({'a.b': int, 'a.c': bool, 'a.d': str}, index.types)
+        self.assertEqual(5, index.values['os.cpu'])
+        self.assertEqual([1, 2], index.values['e'])
+        self.assertNotIn('f', index.values)
+
+class TestStatObjs(TestCase):
+    """Stat objects backed by a SnapshotStore"""
+    def test_get_reads_snapshot(self):
+        """Reads through the es_stats classes should never call Elasticsearch"""
+        client = FakeClient()
+        store = SnapshotStore(client, cache_timeout=60)
+        Refresher(store).refresh_due()
+        objs = statobjs(store)
+        # Due for a refresh, but not expired
+        for snapshot in store.snapshots.values():
+            snapshot.timestamp -= 90
+        before = len(client.calls)
+        self.assertEqual(1, objs['nodestats'].get('jvm.mem.heap_used_percent'))
+        self.assertEqual(2, objs['nodestats'].get('jvm.mem.heap_used_percent', name='node2'))
+        self.assertEqual('node1', objs['clusterstate'].get('master_node'))
+        self.assertEqual(5, objs['nodestats'].get('os.cpu.percent'))
+        self.assertEqual({'percent': 5}, objs['nodestats'].get('os.cpu'))
+        self.assertEqual(before, len(client.calls))
+    def test_pinned(self):
+        """Pinned stat objects keep reading the same Snapshot after a refresh"""
+        client = FakeClient()
+        store = SnapshotStore(client)
+        objs = pinned(statobjs(store))
+        self.assertEqual(1, objs['nodestats'].get('jvm.mem.heap_used_percent'))
+        client.value = 3
+        store.refresh('nodestats')
+        self.assertEqual(1, objs['nodestats'].get('jvm.mem.heap_used_percent'))
+        self.assertEqual(1, pinned(objs)['nodestats'].get('jvm.mem.heap_used_percent'))
+        self.assertEqual(3, statobjs(store)['nodestats'].get('jvm.mem.heap_used_percent'))
+
+class TestPruning(TestCase):
+    """Fetching APIs pruned to the configured endpoints"""
+    def test_fetch_params(self):
+        """Endpoints compile into filter_path and metric parameters"""
+        self.assertEqual(
+            {'filter_path': 'nodes.*.jvm.mem.heap_used_percent,nodes.*.name', 'metric': 'jvm'},
+            fetch_params('nodestats', ['jvm.mem.heap_used_percent'])
+        )
+        self.assertEqual(
+            {'filter_path': 'cluster_name,indices.count'},
+            fetch_params('clusterstats', ['indices.count'])
+        )
+    def test_metric_keys(self):
+        """Response keys not named for their metric are mapped to it"""
+        params = fetch_params('nodestats', ['breakers.parent.tripped', 'jvm.uptime_in_millis'])
+        self.assertEqual('breaker,jvm', params['metric'])
+    def test_shipped_config(self):
+        """The requests for the shipped configuration fit in Elasticsearch's 4kb first line"""
+        path = os.path.join(os.path.dirname(__file__), '..', '..', 'configuration', '6.3')
+        with open(os.path.join(path, 'config.yml')) as config:
+            endpoints = api_endpoints(yaml.safe_load(config)['endpoints'])
+        for api in endpoints:
+            params = fetch_params(api, endpoints[api])
+            self.assertIn('filter_path', params)
+            line = 'GET /_nodes/stats/{0}?filter_path={1} HTTP/1.1'.format(
+                params.get('metric', ''), quote(params['filter_path'], safe=''))
+            self.assertLessEqual(len(line), 4096)
+    def test_too_long(self):
+        """Keys are cut short to fit, and if they cannot, the API is fetched whole"""
+        keys = ['jvm.mem.pools.pool{0}.used_in_bytes'.format(i) for i in range(100)]
+        self.assertEqual(
+            {'filter_path': 'nodes.*.jvm.mem,nodes.*.name', 'metric': 'jvm'},
+            fetch_params('nodestats', keys))
+        keys = ['key{0}.value'.format(i) for i in range(500)]
+        self.assertNotIn('filter_path', fetch_params('clusterstats', keys))
+    def test_pruned_snapshot(self):
+        """Only configured endpoints are fetched, and health is never pruned"""
+        store = SnapshotStore(FakeClient(), endpoints={'nodestats': ['jvm.mem.heap_used_percent']})
+        node = store.read('nodestats')['nodes']['abc123']
+        self.assertEqual(['jvm', 'name'], sorted(node.keys()))
+        self.assertFalse(store.pruned('health'))
+    def test_fallback(self):
+        """Unconfigured endpoints are read from a full Snapshot, then fetched from then on"""
+        client = FakeClient()
+        store = SnapshotStore(client, endpoints={'nodestats': ['jvm.mem.heap_used_percent']})
+        objs = statobjs(store)
+        self.assertEqual(10, objs['nodestats'].get('indices.docs.count'))
+        self.assertTrue(store.covers('nodestats', 'indices.docs.count'))
+        node = store.refresh('nodestats').value['nodes']['abc123']
+        self.assertEqual(10, node['indices']['docs']['count'])
+    def test_fallback_until_fetched(self):
+        """An included endpoint is read from the full Snapshot until a pruned one has it"""
+        client = FakeClient()
+        store = SnapshotStore(client, endpoints={'nodestats': ['jvm.mem.heap_used_percent']})
+        objs = statobjs(store)
+        for name in ['node1', 'node2', 'node1']:
+            self.assertNotEqual(DotMap(), objs['nodestats'].get('indices.docs.count', name=name))
+        self.assertFalse(store.snapshot('nodestats').covers('indices.docs.count'))
+        store.refresh('nodestats')
+        self.assertTrue(store.snapshot('nodestats').covers('indices.docs.count'))
+        self.assertEqual(20, objs['nodestats'].get('indices.docs.count', name='node2'))
+    def test_no_fallback_for_configured(self):
+        """A configured endpoint missing from the pruned Snapshot does not exist at all"""
+        client = FakeClient()
+        store = SnapshotStore(client, endpoints={'nodestats': ['no.such.key']})
+        objs = statobjs(store)
+        objs['nodestats'].get('no.such.key')
+        self.assertEqual(0, len([c for c in client.calls if c == ('nodestats', {})]))
+
+class TestRefresher(TestCase):
+    """Refresher test class"""
+    def test_refresh_due(self):
+        """Only expired APIs are refreshed"""
+        client = FakeClient()
+        store = SnapshotStore(client, cache_timeout=60)
+        refresher = Refresher(store)
+        self.assertAlmostEqual(60, refresher.refresh_due(), delta=1)
+        refresher.refresh_due()
+        self.assertEqual(1, client.count('clusterstate'))
+    def test_failed_refresh_expires_snapshot(self):
+        """
+        A failed refresh keeps the previous Snapshot and retries sooner, but
+        only until the Snapshot expires.  Reading it then raises.
+        """
+        client = FakeClient()
+        store = SnapshotStore(client, cache_timeout=60, expire_after=3)
+        refresher = Refresher(store, apis=['health'], retry=2)
+        refresher.refresh_due()
+        snapshot = store.snapshot('health')
+        def broken(**kwargs):
+            raise Exception('unavailable')
+        store.calls['health'] = broken
+        snapshot.timestamp -= 61
+        self.assertEqual(2, refresher.refresh_due())
+        self.assertIs(snapshot, store.snapshot('health'))
+        snapshot.timestamp -= 120
+        self.assertEqual(2, refresher.refresh_due())
+        self.assertRaises(Exception, store.snapshot, 'health')
+        self.assertRaises(Exception, statobjs(store)['health'].get, 'status')
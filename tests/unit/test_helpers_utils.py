@@ -1,7 +1,17 @@
 """Unit tests for es_stats_zabbix/helpers/utils.py"""
+import json
+import os
 import socket
+import socketserver
+import tempfile
+import threading
+from http.server import BaseHTTPRequestHandler, HTTPServer
 from unittest import TestCase
-from es_stats_zabbix.helpers.utils import open_port, status_map
+from es_stats_zabbix.exceptions import BackendUnavailable, NotFound
+from es_stats_zabbix.helpers.snapshot import SnapshotStore, statobjs
+from es_stats_zabbix.helpers.utils import (
+    get_nodeid, http_request, open_port, status_map, true_nodetypes)
+from . import FakeClient
 
 class TestStatusMap(TestCase):
     """StatusMap test class"""
@@ -34,3 +44,70 @@ class TestOpenPort(TestCase):
         host = 'localhost'
         port = 7606
         self.assertFalse(open_port(host, port))
+
+class TestNodeLookups(TestCase):
+    """Node lookups through the node index"""
+    def setUp(self):
+        self.statobjs = statobjs(SnapshotStore(FakeClient()))
+    def test_get_nodeid(self):
+        """Nodes are found by name, or by host"""
+        self.assertEqual('def456', get_nodeid(self.statobjs, 'node2'))
+        self.assertEqual('def456', get_nodeid(self.statobjs, '10.0.0.2'))
+        self.assertRaises(NotFound, get_nodeid, self.statobjs, 'node3')
+        self.assertRaises(NotFound, get_nodeid, self.statobjs, None)
+    def test_true_nodetypes(self):
+        """Nodetypes are read from the node settings"""
+        self.assertEqual(['coordinating', 'master', 'data', 'ml'],
+                         true_nodetypes(self.statobjs['nodeinfo'], 'abc123'))
+        self.assertEqual(['coordinating', 'data', 'ml', 'ingest'],
+                         true_nodetypes(self.statobjs['nodeinfo'], 'def456'))
+
+class Echo(BaseHTTPRequestHandler):
+    """Answer with the method, path and JSON body of the request"""
+    def answer(self):
+        length = int(self.headers.get('Content-Length', 0))
+        body = json.loads(self.rfile.read(length).decode('utf-8')) if length else None
+        payload = json.dumps([self.command, self.path, body]).encode('utf-8')
+        self.send_response(404 if self.path == '/missing' else 200)
+        self.end_headers()
+        self.wfile.write(payload)
+    do_GET = do_POST = answer
+    def log_message(self, *args):
+        pass
+
+class TestHttpRequest(TestCase):
+    """http_request test class"""
+    def setUp(self):
+        self.server = HTTPServer(('127.0.0.1', 0), Echo)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.port = self.server.server_address[1]
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+    def test_get(self):
+        """A GET returns the status and text of the response"""
+        status, text = http_request('127.0.0.1', self.port, '/api/health/status', 'get')
+        self.assertEqual(200, status)
+        self.assertEqual(['GET', '/api/health/status', None], json.loads(text))
+    def test_post(self):
+        """A POST body is sent as JSON"""
+        status, text = http_request('127.0.0.1', self.port, '/missing', 'post', body={'node': 'a'})
+        self.assertEqual(404, status)
+        self.assertEqual(['POST', '/missing', {'node': 'a'}], json.loads(text))
+    def test_unix_socket(self):
+        """A host of unix:///path connects to that Unix domain socket"""
+        path = os.path.join(tempfile.mkdtemp(), 'esz.sock')
+        server = socketserver.ThreadingUnixStreamServer(path, Echo)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        try:
+            status, text = http_request('unix://' + path, None, '/api/batch', 'post', body={})
+            self.assertEqual(200, status)
+            self.assertEqual(['POST', '/api/batch', {}], json.loads(text))
+        finally:
+            server.shutdown()
+            server.server_close()
+            os.unlink(path)
+    def test_unavailable(self):
+        """Failing to connect is reported as BackendUnavailable"""
+        self.assertRaises(
+            BackendUnavailable, http_request, 'unix:///nonexistent/esz.sock', None, '/', 'get')
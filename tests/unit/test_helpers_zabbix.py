@@ -0,0 +1,175 @@
+"""Unit tests for es_stats_zabbix/helpers/zabbix.py"""
+import json
+import socketserver
+import ssl
+import struct
+import threading
+import time
+from unittest import TestCase
+from es_stats_zabbix.exceptions import ConfigurationError
+from es_stats_zabbix.helpers.zabbix import ChangeFilter, LLDFilter, ZabbixSender, dn_string
+
+CERT = {
+    'issuer': ((('countryName', 'LV'),), (('organizationName', 'Zabbix SIA'),),
+               (('commonName', 'Zabbix CA'),)),
+    'subject': ((('countryName', 'LV'),), (('organizationName', 'Zabbix SIA'),),
+                (('organizationalUnitName', 'Ops, EU'),), (('commonName', 'Zabbix server'),)),
+}
+
+class FakeTLSSocket(object):
+    """Stand-in for an SSLSocket connected to a Zabbix server with CERT"""
+    def getpeercert(self):
+        return CERT
+
+class FakeTrapper(socketserver.BaseRequestHandler):
+    """Answer one Zabbix sender request, as a Zabbix server would"""
+    def handle(self):
+        header = self.request.recv(13)
+        length = struct.unpack('<Q', header[5:])[0]
+        body = b''
+        while len(body) < length:
+            body += self.request.recv(length - len(body))
+        request = json.loads(body.decode('utf-8'))
+        self.server.requests.append(request)
+        total = len(request['data'])
+        failed = len([x for x in request['data'] if x['key'] == 'bad'])
+        answer = json.dumps({
+            'response': 'success',
+            'info': 'processed: {0}; failed: {1}; total: {2}; seconds spent: 0.000100'.format(
+                total - failed, failed, total)
+        }).encode('utf-8')
+        self.request.sendall(b'ZBXD\x01' + struct.pack('<Q', len(answer)) + answer)
+
+class TestZabbixSender(TestCase):
+    """ZabbixSender test class"""
+    def setUp(self):
+        self.server = socketserver.ThreadingTCPServer(('127.0.0.1', 0), FakeTrapper)
+        self.server.requests = []
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.sender = ZabbixSender(
+            {'ServerActive': '127.0.0.1', 'ServerPort': self.server.server_address[1]})
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+    def test_send(self):
+        """Items are sent, and the server response is parsed as protobix does"""
+        self.assertEqual(
+            (1, 0, 1, 1, 2, 0.0001), self.sender.send('node1', {'good': 1, 'bad': 'x'}))
+        request = self.server.requests[0]
+        self.assertEqual('sender data', request['request'])
+        self.assertEqual({'node1'}, set(x['host'] for x in request['data']))
+    def test_chunks(self):
+        """At most 250 items are sent per request"""
+        data = dict(('key{0}'.format(i), i) for i in range(600))
+        self.assertEqual((3, 0, 600, 0, 600), self.sender.send('node1', data)[:5])
+        self.assertEqual([250, 250, 100], [len(x['data']) for x in self.server.requests])
+    def test_send_hosts(self):
+        """Items for several hosts share requests"""
+        data = dict(
+            ('node{0}'.format(n), dict(('key{0}'.format(i), i) for i in range(100)))
+            for n in range(3))
+        self.assertEqual((2, 0, 300, 0, 300), self.sender.send_hosts(data)[:5])
+        self.assertEqual(
+            {'node0', 'node1', 'node2'}, set(x['host'] for x in self.server.requests[0]['data']))
+    def test_lld(self):
+        """LLD values are JSON encoded, and empty ones skipped"""
+        self.sender.send('node1', {'discovery': [{'{#MACRO}': 'x'}], 'empty': []}, data_type='lld')
+        items = self.server.requests[0]['data']
+        self.assertEqual(1, len(items))
+        self.assertEqual({'data': [{'{#MACRO}': 'x'}]}, json.loads(items[0]['value']))
+    def test_serveractive_port(self):
+        """A port in ServerActive takes precedence over ServerPort"""
+        sender = ZabbixSender({'ServerActive': 'zabbix.example.com:10052,other', 'ServerPort': 1})
+        self.assertEqual(('zabbix.example.com', 10052), (sender.server, sender.port))
+    def test_serveractive_forms(self):
+        """IPv6 addresses, with and without a port, and no ServerActive at all"""
+        for server_active, expected in [
+                ('[::1]:10052', ('::1', 10052)),
+                ('[::1]', ('::1', 10051)),
+                ('::1', ('::1', 10051)),
+                ('fe80::1:2, other', ('fe80::1:2', 10051)),
+                ('zabbix', ('zabbix', 10051)),
+                (None, ('127.0.0.1', 10051))]:
+            sender = ZabbixSender({'ServerActive': server_active, 'ServerPort': 10051})
+            self.assertEqual(expected, (sender.server, sender.port))
+    def test_psk(self):
+        """TLSConnect=psk is rejected when the sender is built, not on the first push"""
+        self.assertRaises(ConfigurationError, ZabbixSender, {'TLSConnect': 'psk'})
+
+class TestTLS(TestCase):
+    """Zabbix server certificate issuer and subject test class"""
+    def test_dn_string(self):
+        """Names are formatted most specific first, with special characters escaped"""
+        self.assertEqual('CN=Zabbix CA,O=Zabbix SIA,C=LV', dn_string(CERT['issuer']))
+        self.assertEqual(
+            'CN=Zabbix server,OU=Ops\\, EU,O=Zabbix SIA,C=LV', dn_string(CERT['subject']))
+    def test_verify_peer(self):
+        """The connection is refused unless the configured issuer and subject match"""
+        sender = ZabbixSender({'TLSServerCertIssuer': 'CN=Zabbix CA,O=Zabbix SIA,C=LV'})
+        sender.verify_peer(FakeTLSSocket())
+        sender.subject = 'CN=Zabbix server,O=Zabbix SIA,C=LV'
+        self.assertRaises(ssl.SSLError, sender.verify_peer, FakeTLSSocket())
+
+class TestChangeFilter(TestCase):
+    """ChangeFilter test class"""
+    def test_changes(self):
+        """Only changed values pass, until the heartbeat"""
+        changes = ChangeFilter(heartbeat=3)
+        self.assertEqual({'h': {'a': 1, 'b': 2}}, changes.changes({'h': {'a': 1, 'b': 2}}))
+        self.assertEqual({'h': {'b': 3}}, changes.changes({'h': {'a': 1, 'b': 3}}))
+        self.assertEqual({}, changes.changes({'h': {'a': 1, 'b': 3}}))
+        self.assertEqual({'h': {'a': 1}}, changes.changes({'h': {'a': 1, 'b': 3}}))
+    def test_forget(self):
+        """Forgotten values pass again"""
+        changes = ChangeFilter()
+        changes.changes({'h': {'a': 1}})
+        changes.forget({'h': {'a': 1}})
+        self.assertEqual({'h': {'a': 1}}, changes.changes({'h': {'a': 1}}))
+
+    @staticmethod
+    def age(changes, seconds, hosts=None):
+        """Make the values remembered by changes (for hosts, or all) seconds older"""
+        for hostkey in changes.last:
+            if hosts and hostkey[0] not in hosts:
+                continue
+            value, count, seen, period = changes.last[hostkey]
+            changes.last[hostkey] = (value, count, seen - seconds, period)
+    def test_prune(self):
+        """Values not seen for expire heartbeats of the push interval are forgotten"""
+        changes = ChangeFilter(heartbeat=2, expire=3)
+        changes.changes({'h': {'a': 1}, 'gone': {'a': 1}})
+        self.age(changes, 60)
+        changes.changes({'h': {'a': 1}})
+        self.assertIn(('gone', 'a'), changes.last)
+        self.age(changes, 60)
+        changes.changes({'h': {'a': 1}})
+        self.assertIn(('gone', 'a'), changes.last)
+        self.age(changes, 60)
+        self.age(changes, 300, hosts=['gone'])
+        changes.changes({'h': {'a': 1}})
+        self.assertEqual([('h', 'a')], list(changes.last))
+    def test_stall(self):
+        """After one long gap between pushes, the window shrinks again"""
+        changes = ChangeFilter(heartbeat=2, expire=3)
+        changes.changes({'h': {'a': 1}, 'gone': {'a': 1}})
+        self.age(changes, 3600)
+        changes.changes({'h': {'a': 1}})
+        self.assertIn(('gone', 'a'), changes.last)
+        self.age(changes, 60)
+        changes.changes({'h': {'a': 1}})
+        self.assertEqual([('h', 'a')], list(changes.last))
+
+class TestLLDFilter(TestCase):
+    """LLDFilter test class"""
+    def test_due(self):
+        """LLD data is due if it changed, or its refresh is"""
+        lldfilter = LLDFilter(refresh=60)
+        first = lldfilter.fingerprint([{'{#KEY}': 'a'}])
+        self.assertTrue(lldfilter.due('h', first))
+        lldfilter.sent('h', first)
+        self.assertFalse(lldfilter.due('h', lldfilter.fingerprint([{'{#KEY}': 'a'}])))
+        self.assertTrue(lldfilter.due('h', lldfilter.fingerprint([{'{#KEY}': 'b'}])))
+        self.assertTrue(lldfilter.due('other', first))
+        lldfilter.last['h'] = (first, time.time() - 60)
+        self.assertTrue(lldfilter.due('h', first))
+        self.assertEqual((1, 1), lldfilter.count('h'))